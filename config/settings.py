@@ -28,6 +28,13 @@ SECRET_KEY = 'django-insecure-p%hqur)!*do8^o$_3rtuu5q1k8s+h^m)7s6h=qx44+b7cb6g5v
 # This avoids the "no such table: django_session" error for the PoC
 SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies' 
 
+# Server mode: entrypoint.sh sets SERVER_MODE=asgi to run uvicorn workers, which
+# serve the async catalog/cart/checkout views (store/async_urls.py)
+ASYNC_VIEWS = os.environ.get('SERVER_MODE') == 'asgi'
+
+# Benchmarks only: seconds added to each catalog version lookup (see bench_asgi)
+SIMULATED_IO_LATENCY = float(os.environ.get('SIMULATED_IO_LATENCY_MS', 0)) / 1000
+
 # =======================================================
 # ENVIRONMENT-SPECIFIC SETTINGS (Production/Development)
 # =======================================================
@@ -47,10 +54,19 @@ if 'DATABASE_URL' in os.environ:
     DATABASES = {
         'default': dj_database_url.config(
             default=os.environ['DATABASE_URL'],
-            conn_max_age=600,
+            # Async requests may run on a different thread each time, so persistent
+            # connections would pile up; rely on the server-side pooler instead
+            conn_max_age=0 if ASYNC_VIEWS else 600,
             ssl_require=True # Important for Render connections
         )
     }
+    # Read replicas (store/db_routing.py): comma-separated URLs, served as replica1, replica2, ...
+    for n, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+        DATABASES[f'replica{n}'] = dj_database_url.parse(
+            url.strip(), conn_max_age=0 if ASYNC_VIEWS else 600, ssl_require=True,
+        )
+        DATABASES[f'replica{n}']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
     
     # Recommended security settings for production
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https') # <-- THIS IS THE FIX
@@ -73,10 +89,92 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Take the write lock when a transaction starts, so concurrent checkouts
+            # wait for each other instead of failing on lock upgrade
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file-backed test database lets threaded tests (concurrent checkout)
+            # use real SQLite locking; the shared in-memory database fails fast instead
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        },
+        # A second connection to the same file, standing in for a replica; reads
+        # only go to it with LOCAL_REPLICA=1 (and in the routing tests)
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {'timeout': 20},
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
+    DATABASE_REPLICAS = ['replica'] if os.environ.get('LOCAL_REPLICA') else []
+
+# Catalog and sales-report reads go to DATABASE_REPLICAS; everything else, and
+# a client's reads for a few seconds after it writes, to the primary
+DATABASE_ROUTERS = ['store.db_routing.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5
+
+
+# Catalog cache (store/catalog_cache.py) and cart store cache ('carts', see CART_STORE).
+# Every gunicorn worker must see the same caches, or a catalog change made in one
+# worker stays invisible in the others: Redis when REDIS_URL is set, else tables in
+# the database (created by `createcachetable` in the migrate job). Local development
+# runs one process, so it keeps LocMemCache (gunicorn then starts a single worker).
+# Per-product entries need far more room than the default of 300 entries.
+def _shared_cache(name, max_entries):
+    if os.environ.get('REDIS_URL'):
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': name,
+        }
+    if 'DATABASE_URL' in os.environ:
+        return {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': f"{name.replace('-', '_')}_cache",
+            'OPTIONS': {'MAX_ENTRIES': max_entries},
         }
+    return {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': name,
+        'OPTIONS': {'MAX_ENTRIES': max_entries},
     }
 
 
+CACHES = {
+    'default': _shared_cache('store-catalog', 100000),
+    'carts': _shared_cache('store-carts', 50000),
+}
+
+
+# Render catalog fragments (grid, cards, detail, category nav) from the cache
+CATALOG_FRAGMENT_CACHE = True
+# Seconds anonymous visitors may reuse a catalog page without revalidating once a
+# 304 confirmed it; every request after that is a cheap conditional GET. Responses
+# that set the CSRF cookie stay private (store/conditional.py)
+CATALOG_PAGE_MAX_AGE = 60
+
+
+# Per-view metrics (store/metrics.py). With several worker processes, point
+# METRICS_DIR at a directory they share so /metrics reports all of them.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+# /metrics requires "Authorization: Bearer <token>"; without a token it is only served with DEBUG on
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+
+# Request profiling (store/profiling.py). Staff users profile one request with
+# "X-Profile: 1" or ?_profile=1; a sample rate > 0 also profiles random traffic.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MAX_PROFILES = 200
+
+
+# Cart line store (store/cart_store.py), kept in the 'carts' cache so every worker
+# sees the same copy. LRUCartStore is per process: only for a single worker.
+CART_STORE = {
+    'BACKEND': 'store.cart_store.CacheCartStore',
+    'OPTIONS': {'alias': 'carts'},
+}
+
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -90,12 +188,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the recorded latency covers the whole middleware stack
+    'store.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', 
+    'store.middleware.AsyncWhiteNoiseMiddleware', 
+    # Outside the session middleware, so session writes also pin the client to the primary
+    'store.db_routing.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -104,7 +207,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend with per-request render timing for /metrics
+        'BACKEND': 'store.metrics.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -151,9 +255,19 @@ STATICFILES_DIRS = [
 
 # Use WhiteNoise to compress and cache static files (best practice)
 STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
     "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
 }
 
+# Uploaded product images (originals; pages only use their thumbnails)
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+MEDIA_URL = '/media/'
+
+# Product thumbnails (store/thumbnails.py), built by the build_thumbnails command
+# or on first request, and served by WhiteNoise as immutable files
+THUMBNAIL_ROOT = os.environ.get('THUMBNAIL_ROOT', os.path.join(BASE_DIR, 'thumbnails'))
+THUMBNAIL_URL = '/thumbs/'
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
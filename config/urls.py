@@ -14,10 +14,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include # <-- Add 'include'
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', include('store.urls')), # <-- Add this line
+    # ASGI mode serves the async catalog/cart/checkout views
+    path('', include('store.async_urls' if settings.ASYNC_VIEWS else 'store.urls')),
 ]
\ No newline at end of file
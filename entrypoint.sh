@@ -1,13 +1,28 @@
 #!/bin/sh
+set -e
 
-# Collect static files (CRITICAL NEW STEP)
-echo "Collecting static files..."
-python manage.py collectstatic --noinput
+# Static files are collected and pre-compressed (gzip + brotli) when the image
+# is built (see Dockerfile), so booting a container does no file work.
 
-# NEW: Apply database migrations
-echo "Applying database migrations..."
-python manage.py migrate
+# One-off migrate job, run once per deploy before the new web containers
+# (e.g. Render pre-deploy command or `docker run <image> /app/entrypoint.sh migrate`)
+if [ "$1" = "migrate" ]; then
+    echo "Applying database migrations..."
+    python manage.py migrate --noinput
+    # Cache tables of the database cache backend (config/settings.py; no-op with Redis)
+    exec python manage.py createcachetable
+fi
+
+# Web containers only check that the schema is current; they never migrate
+echo "Checking database migrations..."
+python manage.py check_migrations --wait "${MIGRATION_WAIT:-60}"
+
+# Start Gunicorn with the server profile in config/gunicorn.conf.py
+# (SERVER_MODE=asgi runs uvicorn workers and the async views)
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "Starting Gunicorn (ASGI, uvicorn workers)..."
+    exec gunicorn -c config/gunicorn.conf.py config.asgi:application
+fi
 
-# Start Gunicorn
 echo "Starting Gunicorn..."
-gunicorn config.wsgi:application --bind 0.0.0.0:8000
\ No newline at end of file
+exec gunicorn -c config/gunicorn.conf.py config.wsgi:application
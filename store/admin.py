@@ -1,49 +1,215 @@
+from datetime import date, timedelta
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db.models import OuterRef, Subquery, Sum
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
 
 # Register your models here.
-from .models import Product, Cart, CartItem, Order, OrderItem, Category # <-- Added Category
+from .models import Product, Cart, CartItem, Order, OrderItem, Category, FlashSale, RequestProfile, DailySales, RollupState # <-- Added Category
+from . import inventory, profiling, rollups
+from .cart import LINE_SUBTOTAL
+from .money import ZERO, Money
+from .pagination import EstimatedCountPaginator
 
 # Inline to display items within the Cart admin view
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
     readonly_fields = ('subtotal',)
+    raw_id_fields = ('product',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 # Inline to display items within the Order admin view
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ('subtotal',)
+    raw_id_fields = ('product',)
 
 # MODIFIED: Register Product with list_display to show stock and Category
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price', 'inventory_stock')
+    list_display = ('name', 'sku', 'category', 'price', 'inventory_stock')
     list_editable = ('price', 'inventory_stock')
     list_filter = ('category',) # <-- Added filter
+    actions = ['start_flash_sale', 'end_flash_sale']
+
+    @admin.action(description="Start flash sale (sharded stock) for selected products")
+    def start_flash_sale(self, request, queryset):
+        for product in queryset:
+            inventory.start_flash_sale(product)
+        self.message_user(request, f"Flash-sale mode enabled for {queryset.count()} product(s).")
+
+    @admin.action(description="End flash sale for selected products")
+    def end_flash_sale(self, request, queryset):
+        for product in queryset:
+            inventory.end_flash_sale(product)
+        self.message_user(request, f"Flash-sale mode ended for {queryset.count()} product(s).")
+
+@admin.register(FlashSale)
+class FlashSaleAdmin(admin.ModelAdmin):
+    list_display = ('product', 'shards', 'reservation_ttl', 'created_at')
+    readonly_fields = ('product', 'shards')
 
 @admin.register(Category) # <-- Register Category
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'slug')
+    list_display = ('name', 'slug', 'parent', 'depth', 'product_count')
+    list_select_related = ('parent',)
+    # Materialized-path order lists every category under its parent
+    ordering = ('path',)
+    readonly_fields = ('path', 'product_count')
     prepopulated_fields = {'slug': ('name',)}
 
 
+# Changelists of the large tables: a fixed number of queries per page (related
+# rows joined, totals annotated), estimated counts and exact-match searches on
+# indexed columns, so they do not slow down as the tables grow.
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'session_key', 'created_at', 'total')
+    list_display = ('id', 'user', 'session_key', 'created_at', 'updated_at', 'total')
+    list_select_related = ('user',)
     inlines = [CartItemInline]
     readonly_fields = ('total',)
-    search_fields = ('user__username', 'session_key')
+    raw_id_fields = ('user',)
+    search_fields = ('user__username__exact', 'session_key__exact')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # Only evaluated for the rows of the page, instead of Cart.total's query per row
+        totals = (
+            CartItem.objects.filter(cart=OuterRef('pk'))
+            .order_by()
+            .values('cart')
+            .annotate(total=Sum(LINE_SUBTOTAL))
+            .values('total')
+        )
+        return super().get_queryset(request).annotate(items_total=Subquery(totals))
+
+    @admin.display(description="Total", ordering='items_total')
+    def total(self, obj):
+        return ZERO if obj.items_total is None else Money.from_decimal(obj.items_total)
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'created_at', 'total_paid', 'status')
+    list_select_related = ('user',)
     inlines = [OrderItemInline]
     list_filter = ('status', 'created_at')
-    search_fields = ('user__username',)
+    raw_id_fields = ('user',)
+    search_fields = ('user__username__exact',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('cart', 'product', 'quantity', 'subtotal')
-    list_filter = ('cart',)
-    search_fields = ('product__name',)
\ No newline at end of file
+    # Cart.__str__ shows the owner's username; subtotal reads the product's price
+    list_select_related = ('cart__user', 'product')
+    raw_id_fields = ('cart', 'product')
+    search_fields = ('product__sku__exact', 'cart__session_key__exact')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'query_count', 'sampled')
+    list_filter = ('sampled', 'view_name')
+    search_fields = ('path',)
+    exclude = ('stats', 'sql_log')
+    readonly_fields = (
+        'created_at', 'method', 'path', 'view_name', 'user', 'status_code',
+        'duration_ms', 'query_count', 'sampled', 'downloads', 'top_functions',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/pstats/', self.admin_site.admin_view(self.download_pstats), name='store_requestprofile_pstats'),
+            path('<int:pk>/download/sql/', self.admin_site.admin_view(self.download_sql), name='store_requestprofile_sql'),
+        ] + super().get_urls()
+
+    @admin.display(description="Download")
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">profile.prof</a> (snakeviz, gprof2dot) &middot; <a href="{}">queries.json</a>',
+            reverse('admin:store_requestprofile_pstats', args=[obj.pk]),
+            reverse('admin:store_requestprofile_sql', args=[obj.pk]),
+        )
+
+    @admin.display(description="Top functions (cumulative)")
+    def top_functions(self, obj):
+        return format_html('<pre>{}</pre>', profiling.summary(obj))
+
+    def _get_profile(self, request, pk):
+        # admin_view() only checks is_staff
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_or_change_permission(request, profile):
+            raise PermissionDenied
+        return profile
+
+    def download_pstats(self, request, pk):
+        profile = self._get_profile(request, pk)
+        response = HttpResponse(bytes(profile.stats), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="profile-{pk}.prof"'
+        return response
+
+    def download_sql(self, request, pk):
+        profile = self._get_profile(request, pk)
+        response = HttpResponse(profile.sql_log or '[]', content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="queries-{pk}.json"'
+        return response
+
+
+@admin.register(DailySales)
+class SalesReportAdmin(admin.ModelAdmin):
+    """The "Daily sales" page is a report read only from the rollup tables (store/rollups.py)."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        today = timezone.localdate()
+        try:
+            end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else today
+            start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=29)
+        except ValueError:
+            start, end = today - timedelta(days=29), today
+        granularity = 'hour' if request.GET.get('granularity') == 'hour' else 'day'
+        by = request.GET.get('by') if request.GET.get('by') in rollups.DIMENSIONS else 'product'
+        status = request.GET.get('status') or None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Sales report",
+            'start': start,
+            'end': end,
+            'granularity': granularity,
+            'by': by,
+            'status': status,
+            'dimensions': list(rollups.DIMENSIONS),
+            'statuses': [value for value, _ in Order.STATUS_CHOICES],
+            'state': RollupState.objects.filter(name=rollups.STATE_NAME).first(),
+            **rollups.report(start, end, granularity, by, status),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/store/sales_report.html', context)
@@ -0,0 +1,24 @@
+# store/async_urls.py
+"""
+The store URLconf for ASGI mode (settings.ASYNC_VIEWS): the same routes as
+store/urls.py with the catalog, cart and checkout views swapped for their
+async versions. Other views stay sync and Django runs them in a thread.
+"""
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'product_list': async_views.product_list,
+    'product_list_by_category': async_views.product_list,
+    'product_detail': async_views.product_detail,
+    'cart': async_views.view_cart,
+    'checkout': async_views.checkout,
+    'process_order': async_views.process_order,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS.get(pattern.name, pattern.callback), name=pattern.name)
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,130 @@
+# store/async_views.py
+"""
+Async versions of the catalog, cart and checkout views, served when the app
+runs under ASGI (see store/async_urls.py).
+
+Reads use the async cache and ORM APIs (catalog_cache.aget_*, cart.aget_*),
+so a slow cache or database round trip suspends only its own request
+instead of tying up a worker thread. Templates are rendered only after the
+cached fragments they use have been fetched (_render), and the fragments
+they had to render are stored afterwards. Writes that need a transaction
+(place_order) run through sync_to_async, as the async ORM has no
+transaction support.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.shortcuts import redirect, render
+
+from . import cart as cart_service
+from . import catalog_cache, conditional
+from .checkout import CheckoutError, OutOfStockError, place_order
+from .pagination import normalize_sort, position_key, read_cursor
+from .views import RECENT_ORDERS_SESSION_KEY, SORT_LABELS
+
+
+async def _render(request, template_name, context, fragments=(), version=None):
+    """
+    Renders a template after resolving everything it would otherwise look up
+    synchronously: the catalog version, the nav tree and the cached
+    `fragments`, given as (name, vary_on) pairs besides the nav.
+    """
+    version = context['catalog_version'] = version or await catalog_cache.aget_version()
+    context['all_categories'] = await catalog_cache.aget_nav_tree()
+    keys = [catalog_cache.fragment_key(name, vary_on, version) for name, vary_on in (('nav', ()), *fragments)]
+    context['catalog_fragments'] = await catalog_cache.aget_fragments(keys)
+    response = render(request, template_name, context)
+    await catalog_cache.asave_fragments(context['catalog_fragments'])
+    return response
+
+
+async def _respond(request, template_name, context, products, fragments):
+    """Renders a catalog page, or answers 304 before rendering (store/conditional.py)."""
+    version = await catalog_cache.aget_version()
+    user = await request.auser()
+    return await conditional.arespond(
+        request, lambda: _render(request, template_name, context, fragments, version),
+        version, products, user.is_authenticated,
+    )
+
+
+# View 1: Home/Product List Page (async)
+async def product_list(request, category_slug=None):
+    current_category = None
+    category = None
+    products, next_cursor = (), None
+    sort = normalize_sort(request.GET.get('sort'))
+    position = read_cursor(request.GET.get('after'), sort)
+    after = request.GET.get('after') if position is not None else None
+
+    if category_slug:
+        category = await catalog_cache.aget_category(category_slug)
+        if category:
+            current_category = category.name
+
+    if category or not category_slug:
+        products, next_cursor = await catalog_cache.aget_page(category, sort, after)
+
+    context = {
+        'products': products,
+        'current_category': current_category,
+        'category_slug': category_slug,
+        'sort': sort,
+        'sort_options': SORT_LABELS,
+        'next_cursor': next_cursor,
+        'is_first_page': position is None,
+        'page_key': position_key(position),
+    }
+    # The grid, and on a miss its cards (see the templates)
+    fragments = [('grid', (category_slug, sort, context['page_key']))] + [('card', (p.pk,)) for p in products]
+    return await _respond(request, 'store/product_list.html', context, products, fragments)
+
+# View 2: Product Detail Page (async)
+async def product_detail(request, pk):
+    product = await catalog_cache.aget_product(pk)
+
+    if product is None:
+        return redirect('product_list')
+
+    return await _respond(request, 'store/product_detail.html', {'product': product}, [product], [('detail', (product.pk,))])
+
+# View 3: Cart Page (async)
+async def view_cart(request):
+    cart_items, cart_total = await cart_service.aget_cart_lines(request)
+
+    context = {
+        'cart_items': cart_items,
+        'cart_total': cart_total
+    }
+    return await _render(request, 'store/cart.html', context)
+
+# View 4: Checkout Page (async)
+async def checkout(request):
+    cart_items, cart_total = await cart_service.aget_cart_lines(request)
+
+    if not cart_items:
+        messages.warning(request, "Your cart is empty. Please add items before checking out.")
+        return redirect('product_list')
+
+    return await _render(request, 'store/checkout.html', {'cart_total': cart_total})
+
+# View to process the order (async; the transaction itself runs in a worker thread)
+async def process_order(request):
+    if request.method != 'POST':
+        return redirect('checkout')
+
+    cart = await cart_service.aget_cart(request)
+    user = await request.auser()
+    try:
+        order = await sync_to_async(place_order)(cart, user)
+    except OutOfStockError as error:
+        messages.error(request, f"{error} Please update your cart and try again.")
+        return redirect('cart')
+    except CheckoutError as error:
+        messages.warning(request, str(error))
+        return redirect('product_list')
+
+    recent_orders = request.session.get(RECENT_ORDERS_SESSION_KEY, [])
+    request.session[RECENT_ORDERS_SESSION_KEY] = (recent_orders + [order.pk])[-10:]
+
+    messages.success(request, "Order processed successfully!")
+    return redirect('order_success', order_id=order.pk)
@@ -0,0 +1,387 @@
+# store/cart.py
+"""
+Cart service persisting carts to the Cart/CartItem models.
+
+Logged-in users own one Cart row; anonymous visitors get a Cart keyed by a
+random token kept in their session (the session only ever stores that token).
+Rendering a cart costs a constant number of queries regardless of its size:
+one to find the cart and one for all lines, with each line subtotal and the
+cart total computed by the database in that same query. A compact copy of the
+line quantities is kept in the cart store (store/cart_store.py), so repeat
+renders only read the store and the catalog cache; every write drops it.
+Subtotals and totals are Money (integer cents, store/money.py).
+
+Anonymous carts nobody came back to are deleted in small batches by
+purge_stale_carts() (the purge_carts command).
+"""
+import secrets
+import time
+from functools import partial
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models import DecimalField, Exists, ExpressionWrapper, F, Max, Min, OuterRef, Sum, Window
+from django.utils import timezone
+
+from . import catalog_cache, inventory
+from .cart_store import get_store
+from .models import Cart, CartItem, StockReservation
+from .money import ZERO, Money
+
+CART_SESSION_KEY = 'cart_key'
+
+LINE_SUBTOTAL = ExpressionWrapper(
+    F('quantity') * F('product__price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+class CartLine:
+    """A cart line rendered from the cart store and catalog cache (mirrors CartItem for templates)."""
+    __slots__ = ('product', 'quantity', 'subtotal_cents')
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+        self.subtotal_cents = product.unit_price.cents * quantity
+
+    @property
+    def subtotal(self):
+        return Money(self.subtotal_cents)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name}"
+
+
+# --- CART STORE KEYS ---
+def _store_key(cart):
+    if cart.user_id is not None:
+        return f'u:{cart.user_id}'
+    return f's:{cart.session_key}'
+
+
+def _request_store_key(request):
+    """Returns the cart store key for the request without touching the database."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'u:{user.pk}'
+    key = request.session.get(CART_SESSION_KEY)
+    return f's:{key}' if key else None
+
+
+def _forget(cart):
+    key = _store_key(cart)
+    store = get_store()
+    store.delete(key)
+    # Drop it again once the write is visible, in case a concurrent read refilled the old lines
+    transaction.on_commit(lambda: store.delete(key))
+
+
+# --- LOOKUP ---
+def get_cart(request, create=False):
+    """Returns the request's Cart (creating it when `create` is set), or None."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cart = Cart.objects.filter(user=user).order_by('pk').first()
+        if cart is None and create:
+            cart = Cart.objects.create(user=user)
+        return cart
+
+    key = request.session.get(CART_SESSION_KEY)
+    if key:
+        cart = Cart.objects.filter(session_key=key).first()
+        if cart is not None or not create:
+            return cart
+    elif not create:
+        return None
+
+    key = secrets.token_urlsafe(12)
+    request.session[CART_SESSION_KEY] = key
+    return Cart.objects.create(session_key=key)
+
+
+def get_lines(cart):
+    """
+    Returns (items, total) for the cart in a single query. Each CartItem carries
+    `line_subtotal` and its product (with category) preloaded.
+    """
+    if cart is None:
+        return [], ZERO
+
+    items = list(
+        CartItem.objects.filter(cart=cart, quantity__gt=0)
+        .select_related('product__category')
+        .annotate(line_subtotal=LINE_SUBTOTAL, cart_total=Window(Sum(LINE_SUBTOTAL)))
+        .order_by('pk')
+    )
+    total = Money.from_decimal(items[0].cart_total) if items else ZERO
+    return items, total
+
+
+def get_cart_lines(request):
+    """
+    Returns (lines, total) for rendering the request's cart. Served from the cart
+    store and catalog cache when possible; otherwise loaded with get_lines()
+    and written back to the store.
+    """
+    store_key = _request_store_key(request)
+    if store_key is None:
+        return [], ZERO
+
+    store = get_store()
+    quantities = store.get(store_key)
+    if quantities is None:
+        items, total = get_lines(get_cart(request))
+        store.set(store_key, {item.product_id: item.quantity for item in items})
+        return items, total
+
+    products = catalog_cache.get_products(quantities)
+    lines = [CartLine(products[pk], quantity) for pk, quantity in quantities.items() if pk in products]
+    return lines, lines_total(lines)
+
+
+def lines_total(lines):
+    """Total of CartLines, summed as plain ints (see the bench_money command)."""
+    return Money(sum(line.subtotal_cents for line in lines))
+
+
+def get_total(cart):
+    """Returns the cart total using one aggregate query."""
+    if cart is None:
+        return ZERO
+    total = CartItem.objects.filter(cart=cart).aggregate(total=Sum(LINE_SUBTOTAL))['total']
+    return ZERO if total is None else Money.from_decimal(total)
+
+
+def get_quantity(cart, product_id):
+    if cart is None:
+        return 0
+    quantities = get_store().get(_store_key(cart))
+    if quantities is not None:
+        return quantities.get(product_id, 0)
+    return CartItem.objects.filter(cart=cart, product_id=product_id).values_list('quantity', flat=True).first() or 0
+
+
+def get_quantities(cart, product_ids):
+    """Returns {product_id: quantity} of the cart's lines for the given products in one query."""
+    if cart is None:
+        return {}
+    return dict(CartItem.objects.filter(cart=cart, product_id__in=product_ids).values_list('product_id', 'quantity'))
+
+
+# --- ASYNC LOOKUP (store/async_views.py; writes stay on the sync functions) ---
+async def _arequest_store_key(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        return f'u:{user.pk}'
+    key = request.session.get(CART_SESSION_KEY)
+    return f's:{key}' if key else None
+
+
+async def aget_cart(request):
+    """Async get_cart() for an existing cart; returns None if there is none."""
+    user = await request.auser()
+    if user.is_authenticated:
+        return await Cart.objects.filter(user=user).order_by('pk').afirst()
+    key = request.session.get(CART_SESSION_KEY)
+    return await Cart.objects.filter(session_key=key).afirst() if key else None
+
+
+async def aget_lines(cart):
+    if cart is None:
+        return [], ZERO
+    items = [
+        item async for item in CartItem.objects.filter(cart=cart, quantity__gt=0)
+        .select_related('product__category')
+        .annotate(line_subtotal=LINE_SUBTOTAL, cart_total=Window(Sum(LINE_SUBTOTAL)))
+        .order_by('pk')
+    ]
+    total = Money.from_decimal(items[0].cart_total) if items else ZERO
+    return items, total
+
+
+async def aget_cart_lines(request):
+    store_key = await _arequest_store_key(request)
+    if store_key is None:
+        return [], ZERO
+
+    store = get_store()
+    quantities = await store.aget(store_key)
+    if quantities is None:
+        items, total = await aget_lines(await aget_cart(request))
+        await store.aset(store_key, {item.product_id: item.quantity for item in items})
+        return items, total
+
+    products = await catalog_cache.aget_products(quantities)
+    lines = [CartLine(products[pk], quantity) for pk, quantity in quantities.items() if pk in products]
+    return lines, lines_total(lines)
+
+
+# --- MUTATION ---
+def _touch(cart):
+    Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+
+
+def set_quantity(cart, product_id, quantity):
+    """Sets a line's quantity with a single upsert; a quantity of 0 removes the line."""
+    if quantity > 0:
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, quantity=quantity)],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+        removed = False
+    else:
+        removed = CartItem.objects.filter(cart=cart, product_id=product_id).delete()[0] > 0
+    _touch(cart)
+    _forget(cart)
+    return removed
+
+
+def add_quantity(cart, product_id, quantity, limit=None):
+    """
+    Adds `quantity` to a line with a relative F() update (creating the line if
+    needed), so concurrent adds are never lost. With `limit`, the line is left
+    unchanged if it would end up above it. Returns whether it was added.
+    """
+    lines = CartItem.objects.filter(cart=cart, product_id=product_id)
+    if limit is not None:
+        lines = lines.filter(quantity__lte=limit - quantity)
+    added = lines.update(quantity=F('quantity') + quantity) > 0
+    if not added and (limit is None or quantity <= limit):
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+            added = True
+        except IntegrityError:
+            # The line is too full, or a concurrent add has just created it
+            added = lines.update(quantity=F('quantity') + quantity) > 0
+    if added:
+        _touch(cart)
+        _forget(cart)
+    return added
+
+
+def set_quantities(cart, quantities):
+    """Applies {product_id: quantity} with one bulk upsert and one delete (for quantities of 0)."""
+    keep = [CartItem(cart=cart, product_id=pk, quantity=quantity) for pk, quantity in quantities.items() if quantity > 0]
+    drop = [pk for pk, quantity in quantities.items() if quantity <= 0]
+    if keep:
+        CartItem.objects.bulk_create(
+            keep,
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+    if drop:
+        CartItem.objects.filter(cart=cart, product_id__in=drop).delete()
+    _touch(cart)
+    _forget(cart)
+
+
+def clear(cart):
+    if cart is not None:
+        CartItem.objects.filter(cart=cart).delete()
+        _touch(cart)
+        _forget(cart)
+
+
+@transaction.atomic
+def merge_anonymous_cart(request, user):
+    """
+    Moves the session's anonymous cart into the user's cart on login.
+    Quantities of products in both carts are added together; all lines are
+    written with one bulk upsert, flash-sale holds move along with them, and
+    the anonymous cart is deleted.
+    """
+    key = request.session.pop(CART_SESSION_KEY, None)
+    if not key:
+        return None
+    anonymous = Cart.objects.filter(session_key=key, user__isnull=True).first()
+    if anonymous is None:
+        return None
+
+    incoming = dict(CartItem.objects.filter(cart=anonymous).values_list('product_id', 'quantity'))
+    cart = Cart.objects.filter(user=user).order_by('pk').first()
+    if cart is None:
+        # Adopt the anonymous cart as-is
+        _forget(anonymous)
+        anonymous.user = user
+        anonymous.session_key = None
+        anonymous.save(update_fields=['user', 'session_key', 'updated_at'])
+        _forget(anonymous)
+        return anonymous
+
+    if incoming:
+        existing = dict(
+            CartItem.objects.filter(cart=cart, product_id__in=incoming).values_list('product_id', 'quantity')
+        )
+        CartItem.objects.bulk_create(
+            [
+                CartItem(cart=cart, product_id=product_id, quantity=quantity + existing.get(product_id, 0))
+                for product_id, quantity in incoming.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+    # Deleting the cart would cascade to its reservations without returning their stock to the shards
+    inventory.move_reservations(anonymous, cart)
+    _forget(anonymous)
+    anonymous.delete()
+    _touch(cart)
+    _forget(cart)
+    return cart
+
+
+# --- PURGE ---
+def replication_lag(using='default'):
+    """Seconds the slowest streaming replica is behind (PostgreSQL primary only), else None."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT EXTRACT(EPOCH FROM MAX(replay_lag)) FROM pg_stat_replication')
+        lag = cursor.fetchone()[0]
+    return None if lag is None else float(lag)
+
+
+def _forget_sessions(session_keys):
+    store = get_store()
+    for session_key in session_keys:
+        store.delete(f's:{session_key}')
+
+
+def purge_stale_carts(cutoff, batch_size=1000, pause=0.0, max_lag=None):
+    """
+    Deletes anonymous carts (and their lines) not updated since `cutoff`,
+    walking the primary key in windows of `batch_size` ids, each deleted in its
+    own short transaction. Carts still holding flash-sale reservations are
+    left to the reservation sweeper. Between batches it sleeps `pause` seconds
+    and, with `max_lag`, waits until replicas are at most that many seconds
+    behind. Yields (carts, lines) deleted per batch.
+    """
+    stale = Cart.objects.filter(user__isnull=True, updated_at__lt=cutoff)
+    bounds = stale.aggregate(first=Min('pk'), last=Max('pk'))
+    if bounds['first'] is None:
+        return
+    held = StockReservation.objects.filter(cart=OuterRef('pk'))
+
+    for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+        with transaction.atomic():
+            rows = list(
+                stale.filter(pk__gte=start, pk__lt=start + batch_size)
+                .exclude(Exists(held))
+                .select_for_update(skip_locked=True)
+                .values_list('pk', 'session_key')
+            )
+            if not rows:
+                continue
+            _, deleted = Cart.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+            transaction.on_commit(partial(_forget_sessions, [session_key for _, session_key in rows]))
+        yield deleted.get(Cart._meta.label, 0), deleted.get(CartItem._meta.label, 0)
+
+        if pause:
+            time.sleep(pause)
+        while max_lag is not None and (replication_lag() or 0) > max_lag:
+            time.sleep(1)
@@ -0,0 +1,238 @@
+# store/cart_store.py
+"""
+Pluggable server-side store for cart line quantities.
+
+The database (Cart/CartItem) remains the source of truth; this store keeps a
+compact copy of each cart's {product_id: quantity} map so that rendering a
+cart, or reading a line quantity, does not need the database. Entries are
+dropped whenever the cart is written (see store/cart.py) and refilled on the
+next read. Async views use aget() and aset(), which never block the event
+loop on the backend's I/O.
+
+Lines are encoded as varints: the line count, then for every line (sorted by
+product id) the delta from the previous product id and the quantity. A
+typical line costs 2-3 bytes instead of ~12 for a JSON pair.
+
+Backends, chosen with settings.CART_STORE:
+  CacheCartStore   -- a Django cache alias; shared by all workers when the cache is
+  LRUCartStore     -- in-process, bounded; per worker, so only for a single worker
+  SQLiteCartStore  -- a local SQLite file shared by all workers on a host
+"""
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+# --- ENCODING ---
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_lines(lines):
+    """Encodes {product_id: quantity} as delta/varint bytes."""
+    out = bytearray()
+    _write_varint(out, len(lines))
+    previous = 0
+    for product_id in sorted(lines):
+        _write_varint(out, product_id - previous)
+        _write_varint(out, lines[product_id])
+        previous = product_id
+    return bytes(out)
+
+
+def decode_lines(data):
+    """Decodes bytes produced by encode_lines back into {product_id: quantity}."""
+    count, pos = _read_varint(data, 0)
+    lines = {}
+    product_id = 0
+    for _ in range(count):
+        delta, pos = _read_varint(data, pos)
+        quantity, pos = _read_varint(data, pos)
+        product_id += delta
+        lines[product_id] = quantity
+    return lines
+
+
+# --- BACKENDS ---
+class BaseCartStore(ABC):
+    """Backends store encoded lines as bytes; get() and set() do the encoding."""
+
+    def get(self, key):
+        """Returns the stored {product_id: quantity} for the key, or None if absent."""
+        data = self._get(key)
+        return None if data is None else decode_lines(data)
+
+    def set(self, key, lines):
+        self._set(key, encode_lines(lines))
+
+    async def aget(self, key):
+        data = await self._aget(key)
+        return None if data is None else decode_lines(data)
+
+    async def aset(self, key, lines):
+        await self._aset(key, encode_lines(lines))
+
+    async def _aget(self, key):
+        # Backends doing I/O run it in a worker thread unless they have an async API
+        return await sync_to_async(self._get, thread_sensitive=False)(key)
+
+    async def _aset(self, key, data):
+        await sync_to_async(self._set, thread_sensitive=False)(key, data)
+
+    @abstractmethod
+    def delete(self, key):
+        """Drops the key's lines, if stored."""
+
+    @abstractmethod
+    def clear(self):
+        """Drops every stored cart."""
+
+    @abstractmethod
+    def _get(self, key):
+        """Returns the encoded lines for the key, or None."""
+
+    @abstractmethod
+    def _set(self, key, data):
+        """Stores encoded lines under the key."""
+
+
+class CacheCartStore(BaseCartStore):
+    """Store in a cache alias of settings.CACHES (Redis or the database in production)."""
+
+    def __init__(self, alias='carts', timeout=7 * 24 * 3600):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _get(self, key):
+        return self._cache.get(key)
+
+    def _set(self, key, data):
+        self._cache.set(key, data, self.timeout)
+
+    async def _aget(self, key):
+        return await self._cache.aget(key)
+
+    async def _aset(self, key, data):
+        await self._cache.aset(key, data, self.timeout)
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def clear(self):
+        # Empties the whole alias, which holds nothing but carts
+        self._cache.clear()
+
+
+class LRUCartStore(BaseCartStore):
+    """Bounded in-process store; least recently used carts are evicted first."""
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+            return data
+
+    def _set(self, key, data):
+        with self._lock:
+            self._data[key] = data
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    async def _aget(self, key):
+        return self._get(key)
+
+    async def _aset(self, key, data):
+        self._set(key, data)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCartStore(BaseCartStore):
+    """Store in a local SQLite file (WAL mode) so every worker on the host shares one copy."""
+
+    def __init__(self, path, max_age=7 * 24 * 3600):
+        self.path = str(path)
+        self.max_age = max_age
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cart_store (key TEXT PRIMARY KEY, lines BLOB NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def _get(self, key):
+        row = self._connection().execute(
+            'SELECT lines FROM cart_store WHERE key = ? AND updated > ?', (key, time.time() - self.max_age)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, data):
+        self._connection().execute(
+            'INSERT INTO cart_store (key, lines, updated) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET lines = excluded.lines, updated = excluded.updated',
+            (key, data, time.time()),
+        )
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cart_store WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cart_store')
+
+
+_store = None
+
+
+def get_store():
+    """Returns the process-wide cart store configured by settings.CART_STORE."""
+    global _store
+    if _store is None:
+        config = getattr(settings, 'CART_STORE', {})
+        backend = import_string(config.get('BACKEND', 'store.cart_store.CacheCartStore'))
+        _store = backend(**config.get('OPTIONS', {}))
+    return _store
@@ -0,0 +1,84 @@
+# store/catalog.py
+"""
+Compact catalog records.
+
+Product and Category rows are converted into small read-only records so they
+can be cached (see store/catalog_cache.py) and rendered without carrying full
+model instances around.
+"""
+from .money import Money
+
+
+class CatalogCategory:
+    """Read-only category record; satisfies template access to cat.name, cat.slug and the tree fields."""
+    __slots__ = ('pk', 'name', 'slug', 'parent_id', 'path', 'depth', 'product_count')
+
+    def __init__(self, pk, name, slug, parent_id=None, path='', depth=0, product_count=0):
+        self.pk = pk
+        self.name = name
+        self.slug = slug
+        # Position in the category tree (store/categories.py)
+        self.parent_id = parent_id
+        self.path = path
+        self.depth = depth
+        self.product_count = product_count
+
+    @classmethod
+    def from_model(cls, category):
+        return cls(
+            category.pk, category.name, category.slug,
+            category.parent_id, category.path, category.depth, category.product_count,
+        )
+
+    @property
+    def ancestor_ids(self):
+        """The pks from the root down to this category."""
+        return [int(pk) for pk in self.path.split('/') if pk]
+
+    def __str__(self):
+        return self.name
+
+
+class CatalogProduct:
+    """Read-only product record exposing the attributes the templates use."""
+    __slots__ = (
+        'pk', 'name', 'description', 'price', 'unit_price', 'inventory_stock', 'category', 'flash_sale',
+        'image_hash', 'image_width', 'image_height', 'updated_at',
+    )
+
+    def __init__(self, pk, name, description, price, inventory_stock, category, flash_sale=False,
+                 image_hash='', image_width=None, image_height=None, updated_at=None):
+        self.pk = pk
+        self.name = name
+        self.description = description
+        self.price = price
+        # Integer-cents copy of price for cart arithmetic (store/money.py)
+        self.unit_price = Money.from_decimal(price)
+        self.inventory_stock = inventory_stock
+        self.category = category
+        self.flash_sale = flash_sale
+        # Thumbnail URLs and dimensions (store/thumbnails.py); no image when image_hash is empty
+        self.image_hash = image_hash
+        self.image_width = image_width
+        self.image_height = image_height
+        # ETag and Last-Modified of the pages showing the product (store/conditional.py)
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_model(cls, product, category=None):
+        """Builds a record from a Product fetched with select_related('category', 'flash_sale')."""
+        if category is None and product.category is not None:
+            category = CatalogCategory.from_model(product.category)
+        return cls(
+            product.pk, product.name, product.description or '',
+            product.price, product.inventory_stock, category,
+            hasattr(product, 'flash_sale'),
+            product.image_hash, product.image_width, product.image_height, product.updated_at,
+        )
+
+    @property
+    def id(self):
+        return self.pk
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,393 @@
+# store/catalog_cache.py
+"""
+Read-through cache over the Product and Category models.
+
+Every key embeds a catalog version number. Saving or deleting a Product or
+Category (including list_editable edits in ProductAdmin) bumps the version via
+the signal handlers in store/signals.py, which makes all previously cached
+entries unreachable at once instead of deleting them one by one. Stock
+moved by orders and the flash-sale sweeper only refreshes the products
+involved (stock_changed()), unless one of them sold out or came back.
+
+The category nav tree is also kept per process, tagged with the version it
+was built for, so rendering it costs only the version lookup.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .catalog import CatalogCategory, CatalogProduct
+from .models import Category, Product
+from .pagination import PAGE_SIZE, SORT_ORDERS, apaginate, normalize_sort, paginate, position_key, read_cursor
+
+VERSION_KEY = 'catalog:version'
+CACHE_TIMEOUT = 60 * 60
+
+
+class CacheStats:
+    """Per-process hit/miss counters for the catalog cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+stats = CacheStats()
+
+
+# --- VERSIONING ---
+def _io_latency():
+    # Benchmarks only (bench_asgi): the version read stands in for a round trip to a remote cache
+    return getattr(settings, 'SIMULATED_IO_LATENCY', 0)
+
+
+def get_version():
+    """Returns the current catalog version, seeding it if the key was evicted."""
+    if _io_latency():
+        time.sleep(_io_latency())
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A time-based seed never collides with versions used before an eviction
+        version = int(time.time() * 1000)
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_version():
+    """Invalidates every cached catalog entry by moving to a new version."""
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return get_version()
+
+
+def _key(version, *parts):
+    return ':'.join(['catalog', 'v%s' % version, *map(str, parts)])
+
+
+def _products_queryset():
+    return Product.objects.select_related('category', 'flash_sale').order_by('pk')
+
+
+# --- READ-THROUGH ACCESSORS ---
+def get_product(pk):
+    """Returns the CatalogProduct with the given pk, or None if it does not exist."""
+    key = _key(get_version(), 'product', pk)
+    record = cache.get(key)
+    if record is not None:
+        stats.record(hits=1)
+        return record
+
+    stats.record(misses=1)
+    product = _products_queryset().filter(pk=pk).first()
+    if product is None:
+        return None
+    record = CatalogProduct.from_model(product)
+    cache.set(key, record, CACHE_TIMEOUT)
+    return record
+
+
+def get_products(pks):
+    """Returns {pk: CatalogProduct} for the given pks, loading all misses in one query."""
+    version = get_version()
+    keys = {_key(version, 'product', pk): pk for pk in pks}
+    found = cache.get_many(keys)
+    records = {keys[key]: record for key, record in found.items()}
+
+    missing = [pk for pk in keys.values() if pk not in records]
+    stats.record(hits=len(records), misses=len(missing))
+    if missing:
+        loaded = {}
+        for product in _products_queryset().filter(pk__in=missing):
+            record = CatalogProduct.from_model(product)
+            records[product.pk] = record
+            loaded[_key(version, 'product', product.pk)] = record
+        cache.set_many(loaded, CACHE_TIMEOUT)
+    return records
+
+
+def _records(products):
+    """Converts Product rows to records, sharing one CatalogCategory per category."""
+    categories = {}
+    records = []
+    for product in products:
+        category = None
+        if product.category is not None:
+            category = categories.get(product.category_id)
+            if category is None:
+                category = categories[product.category_id] = CatalogCategory.from_model(product.category)
+        records.append(CatalogProduct.from_model(product, category))
+    return tuple(records)
+
+
+def _in_subtree(queryset, category, categories):
+    """Filters products to a category's subtree; a leaf keeps the plain category_id filter (and its index)."""
+    if any(c.parent_id == category.pk for c in categories):
+        return queryset.filter(category__path__startswith=category.path)
+    return queryset.filter(category_id=category.pk)
+
+
+def get_page(category=None, sort=None, cursor=None, per_page=PAGE_SIZE):
+    """
+    Returns (products, next_cursor) for one keyset page of the listing.
+    `category` is a CatalogCategory (or None for all products); its
+    subcategories' products are included. A cursor that does not decode
+    gives the first page.
+    """
+    sort = normalize_sort(sort)
+    # Keyed on the decoded position, so junk or re-encoded cursors cannot mint new entries
+    position = read_cursor(cursor, sort)
+    key = _key(get_version(), 'page', category.pk if category else '*', sort, per_page, position_key(position))
+    page = cache.get(key)
+    if page is not None:
+        stats.record(hits=1)
+        return page
+
+    stats.record(misses=1)
+    queryset = _products_queryset()
+    if category is not None:
+        queryset = _in_subtree(queryset, category, get_categories())
+    rows, next_cursor = paginate(queryset, sort, position, per_page)
+
+    page = (_records(rows), next_cursor)
+    cache.set(key, page, CACHE_TIMEOUT)
+    return page
+
+
+def get_category(slug):
+    """Returns the CatalogCategory with the given slug, or None."""
+    return next((c for c in get_categories() if c.slug == slug), None)
+
+
+def get_categories():
+    """Returns the tuple of CatalogCategory records used for navigation."""
+    key = _key(get_version(), 'categories')
+    categories = cache.get(key)
+    if categories is not None:
+        stats.record(hits=1)
+        return categories
+
+    stats.record(misses=1)
+    categories = tuple(
+        CatalogCategory.from_model(category)
+        for category in Category.objects.exclude(slug__isnull=True).exclude(slug='').order_by('pk')
+    )
+    cache.set(key, categories, CACHE_TIMEOUT)
+    return categories
+
+
+# --- NAV TREE (per process) ---
+_nav_tree = (None, ())
+
+
+def build_nav_tree(categories):
+    """Orders category records depth-first, siblings by name, for the navigation menu."""
+    children = {}
+    for category in categories:
+        children.setdefault(category.parent_id, []).append(category)
+    ordered = []
+    stack = sorted(children.get(None, ()), key=lambda c: c.name, reverse=True)
+    while stack:
+        category = stack.pop()
+        ordered.append(category)
+        stack.extend(sorted(children.get(category.pk, ()), key=lambda c: c.name, reverse=True))
+    return tuple(ordered)
+
+
+def get_nav_tree():
+    """Returns the nav tree, rebuilt in this process only when the catalog version has moved on."""
+    global _nav_tree
+    version = get_version()
+    built_for, tree = _nav_tree
+    if built_for != version:
+        tree = build_nav_tree(get_categories())
+        _nav_tree = (version, tree)
+    return tree
+
+
+def fragment_key(name, vary_on=(), version=None):
+    """Returns the versioned cache key of a rendered template fragment (see templatetags/catalog_tags.py)."""
+    digest = hashlib.md5(repr(tuple(map(str, vary_on))).encode('utf-8')).hexdigest() if vary_on else '-'
+    return _key(version or get_version(), 'fragment', name, digest)
+
+
+# Fragments showing one product's stock, keyed on its pk (see the templates)
+STOCK_FRAGMENTS = ('card', 'detail')
+
+
+def stock_changed(pks, availability_changed=False):
+    """
+    Recaches the records of products whose stock changed and drops their card
+    and detail fragments, leaving the rest of the catalog cached. Listings only
+    show whether a product is in stock, so they are retired (with everything
+    else) only when `availability_changed`: a product sold out or came back.
+    """
+    if availability_changed:
+        return bump_version()
+    version = get_version()
+    # From the primary: a replica may not have the new stock yet
+    cache.set_many({
+        _key(version, 'product', product.pk): CatalogProduct.from_model(product)
+        for product in _products_queryset().using(DEFAULT_DB_ALIAS).filter(pk__in=pks)
+    }, CACHE_TIMEOUT)
+    cache.delete_many([fragment_key(name, [pk], version) for pk in pks for name in STOCK_FRAGMENTS])
+    return version
+
+
+# --- ASYNC ACCESSORS (store/async_views.py) ---
+async def aget_version():
+    if _io_latency():
+        await asyncio.sleep(_io_latency())
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not await cache.aadd(VERSION_KEY, version, None):
+            version = await cache.aget(VERSION_KEY, version)
+    return version
+
+
+async def aget_product(pk):
+    key = _key(await aget_version(), 'product', pk)
+    record = await cache.aget(key)
+    if record is not None:
+        stats.record(hits=1)
+        return record
+
+    stats.record(misses=1)
+    product = await _products_queryset().filter(pk=pk).afirst()
+    if product is None:
+        return None
+    record = CatalogProduct.from_model(product)
+    await cache.aset(key, record, CACHE_TIMEOUT)
+    return record
+
+
+async def aget_products(pks):
+    version = await aget_version()
+    keys = {_key(version, 'product', pk): pk for pk in pks}
+    found = await cache.aget_many(keys)
+    records = {keys[key]: record for key, record in found.items()}
+
+    missing = [pk for pk in keys.values() if pk not in records]
+    stats.record(hits=len(records), misses=len(missing))
+    if missing:
+        loaded = {}
+        async for product in _products_queryset().filter(pk__in=missing):
+            record = CatalogProduct.from_model(product)
+            records[product.pk] = record
+            loaded[_key(version, 'product', product.pk)] = record
+        await cache.aset_many(loaded, CACHE_TIMEOUT)
+    return records
+
+
+async def aget_page(category=None, sort=None, cursor=None, per_page=PAGE_SIZE):
+    sort = normalize_sort(sort)
+    position = read_cursor(cursor, sort)
+    key = _key(await aget_version(), 'page', category.pk if category else '*', sort, per_page, position_key(position))
+    page = await cache.aget(key)
+    if page is not None:
+        stats.record(hits=1)
+        return page
+
+    stats.record(misses=1)
+    queryset = _products_queryset()
+    if category is not None:
+        queryset = _in_subtree(queryset, category, await aget_categories())
+    rows, next_cursor = await apaginate(queryset, sort, position, per_page)
+
+    page = (_records(rows), next_cursor)
+    await cache.aset(key, page, CACHE_TIMEOUT)
+    return page
+
+
+async def aget_categories():
+    key = _key(await aget_version(), 'categories')
+    categories = await cache.aget(key)
+    if categories is not None:
+        stats.record(hits=1)
+        return categories
+
+    stats.record(misses=1)
+    categories = tuple([
+        CatalogCategory.from_model(category)
+        async for category in Category.objects.exclude(slug__isnull=True).exclude(slug='').order_by('pk')
+    ])
+    await cache.aset(key, categories, CACHE_TIMEOUT)
+    return categories
+
+
+async def aget_nav_tree():
+    global _nav_tree
+    version = await aget_version()
+    built_for, tree = _nav_tree
+    if built_for != version:
+        tree = build_nav_tree(await aget_categories())
+        _nav_tree = (version, tree)
+    return tree
+
+
+async def aget_category(slug):
+    return next((c for c in await aget_categories() if c.slug == slug), None)
+
+
+class Fragments:
+    """
+    Rendered fragments looked up before an async view renders, as the
+    {% catalog_fragment %} tag cannot await the cache. The tag reads `found`
+    and puts what it had to render into `missed`, which asave_fragments()
+    stores afterwards.
+    """
+
+    def __init__(self, found):
+        self.found = found
+        self.missed = {}
+
+
+async def aget_fragments(keys):
+    return Fragments(await cache.aget_many(keys))
+
+
+async def asave_fragments(fragments):
+    if fragments.missed:
+        await cache.aset_many(fragments.missed, CACHE_TIMEOUT)
+
+
+def warm(batch_size=2000):
+    """Caches every product record, the categories and the first page of every listing in each sort order."""
+    version = get_version()
+    categories = get_categories()
+    batch = {}
+    for product in _products_queryset().iterator(chunk_size=batch_size):
+        batch[_key(version, 'product', product.pk)] = CatalogProduct.from_model(product)
+        if len(batch) >= batch_size:
+            cache.set_many(batch, CACHE_TIMEOUT)
+            batch = {}
+    cache.set_many(batch, CACHE_TIMEOUT)
+    for category in (None, *categories):
+        for sort in SORT_ORDERS:
+            get_page(category, sort)
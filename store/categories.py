@@ -0,0 +1,146 @@
+# store/categories.py
+"""
+Category tree stored as materialized paths.
+
+Every category keeps the pks from its root down to itself in `path`
+("3/12/" is category 12 under root 3) and its `depth`. A subtree is then one
+indexed prefix query (subtree()), and the ancestors of a category are read
+straight from its path without any query.
+
+`product_count` holds the products in a category and all of its
+descendants. It is maintained incrementally: a product that is created,
+deleted or moved adjusts the counts of the ancestors it left and joined
+(product_moved(), called from store/signals.py), and moving a category moves
+its whole count with it. Bulk writes that bypass signals (import_catalog)
+call rebuild() afterwards.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Concat, Substr
+
+from .models import Category, Product
+
+SEPARATOR = '/'
+
+
+def ancestor_ids(path):
+    """Returns the pks in a path, root first (the category itself last)."""
+    return [int(pk) for pk in path.split(SEPARATOR) if pk]
+
+
+def subtree(category):
+    """Returns the category and all of its descendants."""
+    return Category.objects.filter(path__startswith=category.path)
+
+
+def check_parent(category):
+    """Rejects a parent that is the category itself or one of its descendants."""
+    parent = category.parent
+    if category.pk is None or parent is None:
+        return
+    if parent.pk == category.pk or category.pk in ancestor_ids(parent.path):
+        raise ValidationError({'parent': "A category cannot be placed under itself or one of its subcategories."})
+
+
+def _parent_path(category):
+    if category.parent_id is None:
+        return ''
+    return Category.objects.filter(pk=category.parent_id).values_list('path', flat=True).get()
+
+
+def place(category):
+    """
+    Sets path and depth from the category's parent before it is saved.
+    Returns the stored (path, product_count) of an existing category, or None
+    for a new one.
+    """
+    parent_path = _parent_path(category)
+    category.depth = parent_path.count(SEPARATOR)
+    stored = None
+    if category.pk is not None:
+        stored = Category.objects.filter(pk=category.pk).values_list('path', 'product_count').first()
+    if stored is None:
+        category.path = f'{parent_path}{category.pk}{SEPARATOR}' if category.pk is not None else parent_path
+        return None
+
+    category.path = f'{parent_path}{category.pk}{SEPARATOR}'
+    if category.pk in ancestor_ids(parent_path):
+        raise ValueError(f"Category {category.pk} cannot be moved under its own subtree.")
+    category.product_count = stored[1]
+    return stored
+
+
+def placed(category, stored):
+    """Completes a save: the path of a new category, or the subtree and counts of a moved one."""
+    if stored is None:
+        if not category.path.endswith(f'{category.pk}{SEPARATOR}'):
+            category.path += f'{category.pk}{SEPARATOR}'
+            Category.objects.filter(pk=category.pk).update(path=category.path)
+        return
+
+    old_path, count = stored
+    if old_path == category.path:
+        return
+    Category.objects.filter(path__startswith=old_path).exclude(pk=category.pk).update(
+        path=Concat(Value(category.path), Substr('path', len(old_path) + 1)),
+        depth=F('depth') + (category.depth - old_path.count(SEPARATOR) + 1),
+    )
+    _move_count(ancestor_ids(old_path)[:-1], ancestor_ids(category.path)[:-1], count)
+
+
+def _move_count(old_ancestors, new_ancestors, count):
+    """Moves `count` products from one ancestor chain to another; shared ancestors are untouched."""
+    if not count:
+        return
+    left = set(old_ancestors) - set(new_ancestors)
+    joined = set(new_ancestors) - set(old_ancestors)
+    if left:
+        Category.objects.filter(pk__in=left).update(product_count=F('product_count') - count)
+    if joined:
+        Category.objects.filter(pk__in=joined).update(product_count=F('product_count') + count)
+
+
+def product_moved(old_category_id, new_category_id):
+    """Adjusts counts for one product leaving old_category_id and joining new_category_id (either may be None)."""
+    if old_category_id == new_category_id:
+        return
+    paths = dict(
+        Category.objects.filter(pk__in=[pk for pk in (old_category_id, new_category_id) if pk is not None])
+        .values_list('pk', 'path')
+    )
+    _move_count(
+        ancestor_ids(paths.get(old_category_id, '')),
+        ancestor_ids(paths.get(new_category_id, '')),
+        1,
+    )
+
+
+def category_deleted(category):
+    """Takes a deleted (leaf) category's products off its ancestors' counts; they become uncategorized."""
+    count = Category.objects.filter(pk=category.pk).values_list('product_count', flat=True).first()
+    _move_count(ancestor_ids(category.path)[:-1], [], count or 0)
+
+
+@transaction.atomic
+def rebuild():
+    """Recomputes every path, depth and product count from the parent links and products."""
+    categories = {category.pk: category for category in Category.objects.select_for_update().order_by('pk')}
+    direct = dict(
+        Product.objects.filter(category__isnull=False).values_list('category_id').annotate(n=Count('pk')).order_by()
+    )
+
+    def path_of(category, seen=()):
+        if category.parent_id is None or category.parent_id not in categories or category.pk in seen:
+            return f'{category.pk}{SEPARATOR}'
+        return path_of(categories[category.parent_id], (*seen, category.pk)) + f'{category.pk}{SEPARATOR}'
+
+    for category in categories.values():
+        category.path = path_of(category)
+        category.depth = category.path.count(SEPARATOR) - 1
+        category.product_count = 0
+    for category in categories.values():
+        for pk in ancestor_ids(category.path):
+            categories[pk].product_count += direct.get(category.pk, 0)
+    Category.objects.bulk_update(categories.values(), ['path', 'depth', 'product_count'], batch_size=500)
+    return len(categories)
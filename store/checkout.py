@@ -0,0 +1,102 @@
+# store/checkout.py
+"""
+Transactional checkout.
+
+An order is placed in one transaction: the cart's products are locked in
+ascending pk order (so two checkouts touching the same products can never
+deadlock), each line's stock is decremented with a conditional F() update
+that only succeeds while enough stock remains, and the Order with all its
+OrderItems is written with one bulk insert. If any line is short the whole
+transaction rolls back, so stock can never be oversold or go negative.
+
+Products in flash-sale mode skip the row lock and consume the cart's shard
+reservations instead (see store/inventory.py).
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F
+
+from . import cart as cart_service
+from . import catalog_cache, db_routing, inventory
+from .models import CartItem, Order, OrderItem, Product
+from .money import Money
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into an order."""
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, product_name, available):
+        self.product_name = product_name
+        self.available = available
+        super().__init__(f"Only {available} of {product_name} left in stock.")
+
+
+def place_order(cart, user=None):
+    """Creates an Order from the cart, decrements stock and empties the cart. Returns the Order."""
+    if cart is None:
+        raise EmptyCartError("Your cart is empty.")
+
+    with transaction.atomic():
+        quantities = dict(
+            CartItem.objects.filter(cart=cart, quantity__gt=0)
+            .order_by('product_id')
+            .values_list('product_id', 'quantity')
+        )
+        if not quantities:
+            raise EmptyCartError("Your cart is empty.")
+
+        # Flash-sale products draw on the cart's shard reservations and are not locked here;
+        # every other product row is locked up front, always in pk order
+        flash_sales = inventory.get_flash_sales(quantities)
+        locked = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=[pk for pk in quantities if pk not in flash_sales])
+            .order_by('pk')
+            .only('pk', 'name', 'price', 'inventory_stock')
+        )
+        products = locked + list(
+            Product.objects.filter(pk__in=flash_sales).order_by('pk').only('pk', 'name', 'price')
+        )
+
+        for product in products[len(locked):]:
+            try:
+                inventory.consume(flash_sales[product.pk], cart, quantities[product.pk])
+            except inventory.InsufficientStock:
+                raise OutOfStockError(product.name, inventory.available_stock(product.pk))
+
+        for product in locked:
+            quantity = quantities[product.pk]
+            updated = Product.objects.filter(pk=product.pk, inventory_stock__gte=quantity).update(
+                inventory_stock=F('inventory_stock') - quantity
+            )
+            if not updated:
+                raise OutOfStockError(product.name, Product.objects.filter(pk=product.pk).values_list('inventory_stock', flat=True).first() or 0)
+
+        order = Order.objects.create(
+            user=user if user is not None and user.is_authenticated else None,
+            total_paid=Money.sum(Money.from_decimal(product.price) * quantities[product.pk] for product in products).to_decimal(),
+            status='Processing',
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, price=product.price, quantity=quantities[product.pk])
+            for product in products
+        ])
+        cart_service.clear(cart)
+
+        # Queryset updates bypass post_save, so refresh the ordered products' cached stock explicitly
+        # (the whole catalog only when one sold out), and again once the replicas have caught up, in
+        # case a request re-cached the old stock from one. Flash-sale stock lives in shards and is
+        # synced by the sweeper instead.
+        if locked:
+            sold_out = any(product.inventory_stock <= quantities[product.pk] for product in locked)
+            refresh = partial(catalog_cache.stock_changed, [product.pk for product in locked], sold_out)
+            transaction.on_commit(refresh)
+            transaction.on_commit(partial(db_routing.after_replication, refresh))
+    return order
@@ -0,0 +1,100 @@
+# store/conditional.py
+"""
+Conditional GET (ETag, Last-Modified) and Cache-Control for catalog pages.
+
+The validators come from data the views already hold before rendering: the
+catalog version (bumped by product and category edits, so it covers prices,
+names and the category nav) and the pk, stock and updated_at of the
+products on the page, whose records are refreshed on their own when only
+their stock changes. When the client's copy is current, respond() returns a
+304 without rendering any template.
+
+The ETag decides: Last-Modified (the newest updated_at on the page) is sent
+for clients and caches that keep it, but a date cannot tell deletions,
+renames, nav or login changes apart, so a request with only
+If-Modified-Since always gets the full page.
+
+Every catalog page renders add-to-cart forms carrying the client's CSRF
+token, so the ETag also covers the CSRF cookie (which is rotated on login)
+and the login state: a 304 never revives a page whose token no longer
+matches. For the same reason responses vary on Cookie, and a shared cache
+can only reuse a page for the visitor it was rendered for; it is not
+expected to serve one copy to everyone. Caching across visitors would need
+the token filled in client-side.
+
+Anonymous visitors get public Cache-Control (CATALOG_PAGE_MAX_AGE), which
+lets the browser reuse the page. Logged-in users get private, no-cache
+(they still receive 304s), and so does any response that sets a cookie, as
+in Django's cache middleware: rendering a form sends the CSRF cookie again.
+A page showing flash messages is never cached and gets no validators, since
+the messages are shown once.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def _has_messages(request):
+    # len() loads the messages without marking them as seen
+    return len(messages.get_messages(request)) > 0
+
+
+def validators(request, version, products, authenticated):
+    """Returns (etag, last_modified timestamp or None) for a page showing `products`."""
+    records = ','.join(
+        f"{p.pk}:{p.inventory_stock}:{p.updated_at.timestamp() if p.updated_at is not None else ''}"
+        for p in products
+    )
+    identity = f"{version}|{request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')}|{int(authenticated)}|{records}"
+    etag = 'W/"%s"' % hashlib.md5(identity.encode('utf-8')).hexdigest()
+    last_modified = max((p.updated_at for p in products if p.updated_at is not None), default=None)
+    return etag, (int(last_modified.timestamp()) if last_modified is not None else None)
+
+
+def _sets_cookie(request, response):
+    # CsrfViewMiddleware adds the cookie after the view when rendering asked for a new token
+    return bool(response.cookies) or request.META.get('CSRF_COOKIE_NEEDS_UPDATE', False)
+
+
+def _cache_headers(request, response, etag, last_modified, authenticated):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+    if authenticated or _sets_cookie(request, response):
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'CATALOG_PAGE_MAX_AGE', 60))
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def respond(request, render, version, products, authenticated):
+    """Returns a 304 if the client's copy of the page is current, else render() with validators and Cache-Control."""
+    if _has_messages(request):
+        response = render()
+        add_never_cache_headers(response)
+        return response
+    etag, last_modified = validators(request, version, products, authenticated)
+    # Only the ETag is checked (see above)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = render()
+    return _cache_headers(request, response, etag, last_modified, authenticated)
+
+
+async def arespond(request, render, version, products, authenticated):
+    """respond() for async views; `render` is a coroutine function."""
+    if _has_messages(request):
+        response = await render()
+        add_never_cache_headers(response)
+        return response
+    etag, last_modified = validators(request, version, products, authenticated)
+    # Only the ETag is checked (see above)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = await render()
+    return _cache_headers(request, response, etag, last_modified, authenticated)
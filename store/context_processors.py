@@ -1,24 +1,16 @@
 # store/context_processors.py
+from django.utils.functional import SimpleLazyObject
 
-# A simple Mock object class to mimic Django's Category model behavior
-class MockCategory:
-    """Mock object to satisfy template access to cat.name and cat.slug."""
-    def __init__(self, name, slug):
-        self.name = name
-        self.slug = slug
-
-# Hardcoded category data derived from STATIC_PRODUCTS_DATA in views.py
-STATIC_CATEGORIES = [
-    MockCategory('Clothing', 'clothing'),
-    MockCategory('Accessories', 'accessories'),
-    MockCategory('Footwear', 'footwear'),
-]
+from . import catalog_cache
 
 def categories_processor(request):
     """
-    Returns a list of hardcoded MockCategory objects to populate the navigation menu,
-    thereby avoiding the OperationalError that occurs when querying the ephemeral database.
+    Returns the category nav tree (records in depth-first order, see
+    catalog_cache.get_nav_tree) to populate the navigation menu, so rendering
+    base.html neither queries the database nor rebuilds the tree per request.
+    Loaded lazily: a cached nav fragment never reads them, and async views
+    pass their own `all_categories` (sync lookups are not allowed there).
     """
     return {
-        'all_categories': STATIC_CATEGORIES
-    }
\ No newline at end of file
+        'all_categories': SimpleLazyObject(catalog_cache.get_nav_tree)
+    }
@@ -0,0 +1,175 @@
+# store/db_routing.py
+"""
+Primary/replica database routing with read-your-writes stickiness.
+
+PrimaryReplicaRouter sends reads of the catalog and sales-report models
+(REPLICA_MODELS) to a random alias in settings.DATABASE_REPLICAS, and
+everything else, including every write, to the primary ('default'). Cart,
+order, stock and session reads stay on the primary, as do reads inside a
+transaction on it (e.g. checkout's select_for_update).
+
+ReadYourWritesMiddleware pins a request to the primary once it writes, and
+sets a short-lived cookie so the same client's reads keep going to the
+primary for REPLICA_STICKY_SECONDS afterwards, long enough for the replicas
+to catch up. Unsafe methods (POST, ...) are pinned from the start.
+
+after_replication() queues a call (e.g. a cache refresh) for when the
+replicas have caught up; one daemon thread per process runs the queue.
+
+Without DATABASE_REPLICAS the router leaves every query on 'default'.
+Per-alias query counts are reported by /metrics (store/metrics.py).
+"""
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MODELS = frozenset({
+    'store.category', 'store.product', 'store.flashsale',
+    'store.hourlysales', 'store.dailysales', 'store.rollupstate',
+})
+PIN_COOKIE = 'db_primary_until'
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+# [pinned, wrote] for the request being handled
+_request_state = contextvars.ContextVar('store_db_routing', default=None)
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+# Heap of (due, seq, func) calls waiting for the replicas, run by one thread per process
+_deferred = []
+_deferred_seq = itertools.count()
+_deferred_ready = threading.Condition()
+_deferred_worker = None
+
+
+def after_replication(func):
+    """Calls func once more when the replicas have had time to catch up (no-op without replicas)."""
+    global _deferred_worker
+    if not replicas():
+        return
+    with _deferred_ready:
+        heapq.heappush(_deferred, (time.monotonic() + sticky_seconds(), next(_deferred_seq), func))
+        # Also after a fork, which leaves the parent's thread behind
+        if _deferred_worker is None or not _deferred_worker.is_alive():
+            _deferred_worker = threading.Thread(target=_run_deferred, name='after-replication', daemon=True)
+            _deferred_worker.start()
+        _deferred_ready.notify()
+
+
+def _run_deferred():
+    while True:
+        with _deferred_ready:
+            while not _deferred or _deferred[0][0] > time.monotonic():
+                _deferred_ready.wait(_deferred[0][0] - time.monotonic() if _deferred else None)
+            _, _, func = heapq.heappop(_deferred)
+        try:
+            func()
+        except Exception:
+            logger.exception("Deferred call %r failed", func)
+        finally:
+            close_old_connections()
+
+
+def _is_cache_table(model):
+    # DatabaseCache routes its tables through the routers with a stand-in model
+    return model._meta.app_label == 'django_cache'
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or _is_cache_table(model) or model._meta.label_lower not in REPLICA_MODELS:
+            return DEFAULT_DB_ALIAS
+        state = _request_state.get()
+        if state is not None and (state[0] or state[1]):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        # Filling the cache is not a write the client needs to read back
+        if state is not None and not _is_cache_table(model):
+            state[1] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in replicas():
+            return False
+        return None
+
+
+class ReadYourWritesMiddleware:
+    """Pins requests that write, and the same client's next requests, to the primary database."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self._state(request)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._finish(response, state)
+
+    async def __acall__(self, request):
+        state = self._state(request)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self._finish(response, state)
+
+    @staticmethod
+    def _state(request):
+        pinned = request.method not in SAFE_METHODS
+        if not pinned and PIN_COOKIE in request.COOKIES:
+            try:
+                pinned = float(request.COOKIES[PIN_COOKIE]) > time.time()
+            except ValueError:
+                pass
+        return [pinned, False]
+
+    @staticmethod
+    def _finish(response, state):
+        if state[1] and replicas():
+            seconds = sticky_seconds()
+            response.set_cookie(
+                PIN_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds, httponly=True, samesite='Lax',
+            )
+        return response
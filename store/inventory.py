@@ -0,0 +1,224 @@
+# store/inventory.py
+"""
+Flash-sale inventory: sharded stock counters with time-limited reservations.
+
+When thousands of buyers hit one SKU at once, every checkout serialises on
+that Product row. A product put into flash-sale mode instead keeps its stock
+in FlashSale.shards InventoryShard rows. add_to_cart takes stock from a
+randomly chosen shard (probing the others if it is empty) into a
+StockReservation that expires after FlashSale.reservation_ttl seconds;
+checkout consumes the cart's reservations instead of touching a shared row,
+and release_expired() (see the sweep_reservations command) returns expired
+holds to their shards.
+
+Product.inventory_stock is not updated per purchase for flash-sale products;
+the sweeper refreshes it from the shards so the storefront shows a close
+approximation without recreating the hotspot.
+"""
+import random
+from datetime import timedelta
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from . import catalog_cache, db_routing
+from .models import FlashSale, InventoryShard, Product, StockReservation
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+# --- FLASH-SALE LIFECYCLE ---
+@transaction.atomic
+def start_flash_sale(product, shards=8, reservation_ttl=600):
+    """Splits the product's current stock evenly across `shards` counters."""
+    product = Product.objects.select_for_update().get(pk=product.pk)
+    if FlashSale.objects.filter(product=product).exists():
+        return product.flash_sale
+
+    per_shard, remainder = divmod(product.inventory_stock, shards)
+    InventoryShard.objects.bulk_create([
+        InventoryShard(product=product, shard_no=n, stock=per_shard + (1 if n < remainder else 0))
+        for n in range(shards)
+    ])
+    sale = FlashSale.objects.create(product=product, shards=shards, reservation_ttl=reservation_ttl)
+    transaction.on_commit(catalog_cache.bump_version)
+    return sale
+
+
+@transaction.atomic
+def end_flash_sale(product):
+    """Returns all held stock and folds the shards back into Product.inventory_stock."""
+    reservations = StockReservation.objects.filter(product=product)
+    held = reservations.aggregate(total=Sum('quantity'))['total'] or 0
+    reservations.delete()
+    total = InventoryShard.objects.filter(product=product).aggregate(total=Sum('stock'))['total'] or 0
+    Product.objects.filter(pk=product.pk).update(inventory_stock=total + held)
+    InventoryShard.objects.filter(product=product).delete()
+    FlashSale.objects.filter(product=product).delete()
+    transaction.on_commit(catalog_cache.bump_version)
+
+
+def get_flash_sales(product_ids):
+    """Returns {product_id: FlashSale} for the products that are in flash-sale mode."""
+    return {sale.product_id: sale for sale in FlashSale.objects.filter(product_id__in=product_ids)}
+
+
+# --- RESERVATIONS ---
+def _take(product_id, shard_no, quantity):
+    return InventoryShard.objects.filter(
+        product_id=product_id, shard_no=shard_no, stock__gte=quantity,
+    ).update(stock=F('stock') - quantity)
+
+
+def _give_back(product_id, shard_no, quantity):
+    InventoryShard.objects.filter(product_id=product_id, shard_no=shard_no).update(stock=F('stock') + quantity)
+
+
+def _take_from_shards(sale, quantity):
+    """
+    Takes `quantity` units from the sale's shards and returns [(shard_no, taken)].
+    Tries one random shard first, then gathers from several. Must run inside a
+    transaction; raises InsufficientStock if the shards cannot cover it.
+    """
+    start = random.randrange(sale.shards)
+    order = [(start + i) % sale.shards for i in range(sale.shards)]
+
+    for shard_no in order:
+        if _take(sale.product_id, shard_no, quantity):
+            return [(shard_no, quantity)]
+
+    # No single shard has enough left
+    taken = []
+    remaining = quantity
+    shard_stock = dict(
+        InventoryShard.objects.filter(product_id=sale.product_id, stock__gt=0).values_list('shard_no', 'stock')
+    )
+    for shard_no in order:
+        take = min(remaining, shard_stock.get(shard_no, 0))
+        if take and _take(sale.product_id, shard_no, take):
+            taken.append((shard_no, take))
+            remaining -= take
+            if not remaining:
+                return taken
+    raise InsufficientStock(f"Not enough stock left for {quantity}.")
+
+
+def reserve(sale, cart, quantity):
+    """Holds `quantity` units for the cart until the sale's reservation TTL runs out."""
+    expires_at = timezone.now() + timedelta(seconds=sale.reservation_ttl)
+    with transaction.atomic():
+        return StockReservation.objects.bulk_create([
+            StockReservation(product_id=sale.product_id, cart=cart, shard_no=shard_no, quantity=taken, expires_at=expires_at)
+            for shard_no, taken in _take_from_shards(sale, quantity)
+        ])
+
+
+def release(cart, product_id, quantity=None):
+    """Returns up to `quantity` held units (all of them by default) of a product to the shards."""
+    released = 0
+    reservations = StockReservation.objects.filter(cart=cart, product_id=product_id).order_by('-expires_at', '-pk')
+    with transaction.atomic():
+        for reservation in reservations:
+            if quantity is not None and released >= quantity:
+                break
+            give = reservation.quantity if quantity is None else min(reservation.quantity, quantity - released)
+            if give == reservation.quantity:
+                # Only the process that deletes the row may return its stock
+                if not StockReservation.objects.filter(pk=reservation.pk).delete()[0]:
+                    continue
+            else:
+                if not StockReservation.objects.filter(pk=reservation.pk, quantity__gt=give).update(quantity=F('quantity') - give):
+                    continue
+            _give_back(product_id, reservation.shard_no, give)
+            released += give
+    return released
+
+
+def adjust_reservation(sale, cart, current_quantity, new_quantity):
+    """Holds or returns the difference when a cart line changes; raises InsufficientStock."""
+    if new_quantity > current_quantity:
+        reserve(sale, cart, new_quantity - current_quantity)
+    elif new_quantity < current_quantity:
+        release(cart, sale.product_id, current_quantity - new_quantity)
+
+
+def move_reservations(from_cart, to_cart):
+    """Hands a cart's held stock over to another cart (carts merging on login). Returns the rows moved."""
+    return StockReservation.objects.filter(cart=from_cart).update(cart=to_cart)
+
+
+def available_stock(product_id):
+    """Unreserved stock left across the product's shards."""
+    return InventoryShard.objects.filter(product_id=product_id).aggregate(total=Sum('stock'))['total'] or 0
+
+
+def consume(sale, cart, quantity):
+    """
+    Converts the cart's live reservations for the sale's product into a sale of
+    `quantity` units (used inside the checkout transaction). Any shortfall from
+    expired holds is reserved on the spot; surplus holds are returned.
+    Raises InsufficientStock if the shortfall cannot be covered.
+    """
+    held = 0
+    live = StockReservation.objects.filter(cart=cart, product_id=sale.product_id, expires_at__gt=timezone.now())
+    for reservation in live:
+        if StockReservation.objects.filter(pk=reservation.pk).delete()[0]:
+            if held + reservation.quantity > quantity:
+                _give_back(sale.product_id, reservation.shard_no, held + reservation.quantity - quantity)
+                held = quantity
+            else:
+                held += reservation.quantity
+
+    if held < quantity:
+        _take_from_shards(sale, quantity - held)
+    # Expired holds of this cart are left for the sweeper
+
+
+# --- SWEEPER ---
+def release_expired(batch_size=500):
+    """Returns stock held by expired reservations to their shards. Returns the number released."""
+    now = timezone.now()
+    released = 0
+    touched = set()
+    while True:
+        expired = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .order_by('pk')
+            .values_list('pk', 'product_id', 'shard_no', 'quantity')[:batch_size]
+        )
+        if not expired:
+            break
+        with transaction.atomic():
+            for pk, product_id, shard_no, quantity in expired:
+                if StockReservation.objects.filter(pk=pk).delete()[0]:
+                    _give_back(product_id, shard_no, quantity)
+                    touched.add(product_id)
+                    released += 1
+        if len(expired) < batch_size:
+            break
+
+    sync_displayed_stock(touched)
+    return released
+
+
+def sync_displayed_stock(product_ids=None):
+    """Refreshes Product.inventory_stock of flash-sale products from their shards."""
+    # From the primary, to tell which products sold out or came back
+    products = Product.objects.using(DEFAULT_DB_ALIAS).filter(flash_sale__isnull=False)
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    changed, availability_changed = [], False
+    for product_id, stock in products.values_list('pk', 'inventory_stock'):
+        total = available_stock(product_id)
+        if Product.objects.filter(pk=product_id).exclude(inventory_stock=total).update(inventory_stock=total):
+            changed.append(product_id)
+            availability_changed |= (stock > 0) != (total > 0)
+    if changed:
+        # Again once the replicas have caught up, as in checkout
+        refresh = partial(catalog_cache.stock_changed, changed, availability_changed)
+        refresh()
+        db_routing.after_replication(refresh)
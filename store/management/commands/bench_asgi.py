@@ -0,0 +1,133 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from store.models import Product
+
+SERVERS = {
+    'wsgi': ['config.wsgi:application'],
+    'asgi': ['config.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _request(reader, writer, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: keep-alive\r\n\r\n'.encode())
+    await writer.drain()
+    status = await reader.readline()
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'connection':
+            keep_alive = value.strip().lower() != 'close'
+    await reader.readexactly(length)
+    # Sync gunicorn workers close the connection after every response
+    return int(status.split()[1]), keep_alive
+
+
+async def _load(port, paths, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def client(n):
+        nonlocal errors
+        connection = None
+        i = n
+        while time.perf_counter() < deadline:
+            try:
+                if connection is None:
+                    connection = await asyncio.open_connection('127.0.0.1', port)
+                started = time.perf_counter()
+                status, keep_alive = await _request(*connection, paths[i % len(paths)])
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+                if not keep_alive:
+                    connection[1].close()
+                    connection = None
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                errors += 1
+                connection = None
+            i += 1
+
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares requests/sec and tail latency of the WSGI (sync gunicorn) and ASGI (uvicorn workers, "
+        "async views) setups at high concurrency, with simulated I/O latency on every catalog lookup."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--latency-ms', type=float, default=20, help="Simulated latency per catalog version read.")
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--modes', default='wsgi,asgi')
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by('pk').first()
+        if product is None:
+            raise CommandError("The catalog is empty; run migrate first.")
+        paths = [reverse('product_list'), reverse('product_detail', args=[product.pk]), reverse('product_list') + '?sort=price']
+
+        self.stdout.write(
+            f"concurrency {options['concurrency']}, {options['workers']} worker(s), "
+            f"{options['latency_ms']} ms simulated I/O per lookup"
+        )
+        self.stdout.write(f"{'mode':<6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for mode in options['modes'].split(','):
+            env = dict(os.environ, SERVER_MODE=mode, SIMULATED_IO_LATENCY_MS=str(options['latency_ms']))
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', *SERVERS[mode], '--workers', str(options['workers']),
+                 '--bind', f"127.0.0.1:{options['port']}", '--log-level', 'warning', '--timeout', '120'],
+                env=env, cwd=settings.BASE_DIR,
+            )
+            try:
+                self._wait_until_ready(options['port'], paths)
+                latencies, errors = asyncio.run(
+                    _load(options['port'], paths, options['concurrency'], options['duration'])
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            self.stdout.write(
+                f"{mode:<6}{len(latencies) / options['duration']:>9.1f}"
+                f"{percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+                f"{percentile(latencies, 99) * 1000:>9.1f}{errors:>8}"
+            )
+
+    def _wait_until_ready(self, port, paths):
+        async def probe():
+            connection = await asyncio.open_connection('127.0.0.1', port)
+            try:
+                return (await _request(*connection, paths[0]))[0]
+            finally:
+                connection[1].close()
+
+        for _ in range(100):
+            try:
+                if asyncio.run(probe()) == 200:
+                    return
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            time.sleep(0.2)
+        raise CommandError("Server did not come up.")
@@ -0,0 +1,79 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from store.checkout import OutOfStockError, place_order
+from store.models import Cart, CartItem, Order, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs many concurrent checkouts against a single SKU on the configured database, "
+        "reports orders/sec and verifies that stock never goes negative."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--buyers', type=int, default=500)
+        parser.add_argument('--stock', type=int, default=300)
+        parser.add_argument('--force', action='store_true', help="Allow running with DEBUG=False.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("Refusing to benchmark against a production database without --force.")
+
+        product = Product.objects.create(name="Checkout Benchmark SKU", price=Decimal('1.00'), inventory_stock=options['stock'])
+        carts = [Cart.objects.create(session_key=f"bench-checkout-{product.pk}-{i}") for i in range(options['buyers'])]
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for cart in carts])
+
+        pending = list(carts)
+        lock = threading.Lock()
+        orders, sold_out, latencies = [], [], []
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        cart = pending.pop()
+                    started = time.perf_counter()
+                    try:
+                        orders.append(place_order(cart).pk)
+                    except OutOfStockError:
+                        sold_out.append(cart.pk)
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        latencies.sort()
+        self.stdout.write(f"database:        {connection.vendor}")
+        self.stdout.write(f"threads/buyers:  {options['threads']}/{options['buyers']} against stock {options['stock']}")
+        self.stdout.write(f"orders placed:   {len(orders)}  sold out: {len(sold_out)}")
+        self.stdout.write(f"throughput:      {len(latencies) / elapsed:.1f} checkouts/s ({len(orders) / elapsed:.1f} orders/s)")
+        self.stdout.write(f"latency:         p50 {latencies[len(latencies) // 2] * 1000:.1f} ms  p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+        self.stdout.write(f"final stock:     {product.inventory_stock}")
+
+        expected = max(options['stock'] - options['buyers'], 0)
+        ok = product.inventory_stock == expected and len(orders) == options['stock'] - expected
+
+        Order.objects.filter(pk__in=orders).delete()
+        Cart.objects.filter(pk__in=[cart.pk for cart in carts]).delete()
+        product.delete()
+
+        if not ok:
+            raise CommandError("Stock accounting mismatch: oversell or lost update detected.")
+        self.stdout.write(self.style.SUCCESS("OK: no oversell, stock never went negative."))
@@ -0,0 +1,89 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from store import inventory
+from store.checkout import OutOfStockError, place_order
+from store.models import Cart, CartItem, Order, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares add-to-cart + checkout throughput and tail latency on one hot SKU "
+        "between single-row stock and flash-sale sharded stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--buyers', type=int, default=1000)
+        parser.add_argument('--stock', type=int, default=800)
+        parser.add_argument('--shards', type=int, default=16)
+        parser.add_argument('--force', action='store_true', help="Allow running with DEBUG=False.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("Refusing to benchmark against a production database without --force.")
+
+        self.stdout.write(f"database: {connection.vendor}, {options['threads']} threads, "
+                          f"{options['buyers']} buyers, stock {options['stock']}")
+        for mode in ('single-row', 'sharded'):
+            self.run(mode, options)
+
+    def run(self, mode, options):
+        product = Product.objects.create(name=f"Flash Benchmark SKU ({mode})", price=Decimal('1.00'), inventory_stock=options['stock'])
+        sale = inventory.start_flash_sale(product, shards=options['shards']) if mode == 'sharded' else None
+        carts = [Cart.objects.create(session_key=f"bench-flash-{product.pk}-{i}") for i in range(options['buyers'])]
+
+        pending = list(carts)
+        lock = threading.Lock()
+        orders, latencies = [], []
+
+        def buy(cart):
+            # add_to_cart followed by checkout
+            if sale is not None:
+                inventory.reserve(sale, cart, 1)
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            orders.append(place_order(cart).pk)
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        cart = pending.pop()
+                    started = time.perf_counter()
+                    try:
+                        buy(cart)
+                    except (OutOfStockError, inventory.InsufficientStock):
+                        pass
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        remaining = inventory.available_stock(product.pk) if sale is not None else Product.objects.get(pk=product.pk).inventory_stock
+        latencies.sort()
+        self.stdout.write(
+            f"{mode:<11} {len(latencies) / elapsed:8.1f} attempts/s  {len(orders) / elapsed:8.1f} orders/s  "
+            f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.1f} ms  "
+            f"sold {len(orders)}  left {remaining}"
+        )
+
+        oversold = len(orders) + remaining != options['stock'] or remaining < 0
+        Order.objects.filter(pk__in=orders).delete()
+        Cart.objects.filter(pk__in=[cart.pk for cart in carts]).delete()
+        product.delete()
+        if oversold:
+            raise CommandError(f"{mode}: stock accounting mismatch.")
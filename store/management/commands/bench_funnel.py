@@ -0,0 +1,266 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from decimal import Decimal
+from http.cookiejar import CookieJar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from store import catalog_cache, search
+from store.models import Cart, Order, Product
+
+STEPS = ('product_list', 'product_detail', 'add_to_cart', 'update_cart', 'checkout', 'process_order', 'order_success')
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'funnel_baseline.json'
+SKU_PREFIX = 'BENCH-FUNNEL-'
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class ClientSession:
+    """Drives the funnel in-process through the Django test client."""
+
+    def __init__(self, base_url=None):
+        self.client = Client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get('Location')
+
+    def post(self, path, data, as_json=False):
+        if as_json:
+            response = self.client.post(path, json.dumps(data), content_type='application/json')
+        else:
+            response = self.client.post(path, data)
+        return response.status_code, response.get('Location')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPSession:
+    """Drives the funnel against a running server, keeping cookies and the CSRF token."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def _csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == settings.CSRF_COOKIE_NAME), '')
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers.get('Location')
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data, as_json=False):
+        token = self._csrf_token()
+        headers = {'X-CSRFToken': token, 'Referer': self.base_url + '/'}
+        if as_json:
+            body, headers['Content-Type'] = json.dumps(data).encode(), 'application/json'
+        else:
+            body = urllib.parse.urlencode(dict(data, csrfmiddlewaretoken=token)).encode()
+        return self._open(urllib.request.Request(self.base_url + path, data=body, headers=headers))
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the shopping funnel (browse -> detail -> add_to_cart -> update_cart -> checkout -> order) "
+        "concurrently, reports throughput, p50/p95/p99 latency and queries per view, and fails when a "
+        "view runs more queries than in a baseline JSON. Latency is machine-dependent, so it only fails "
+        "the run with --latency-tolerance (use a baseline recorded on the same machine)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--funnels', type=int, default=25, help="Funnels per concurrent shopper.")
+        parser.add_argument('--catalog-size', type=int, default=1000)
+        parser.add_argument('--url', help="Run against a live server (e.g. http://127.0.0.1:8000) instead of the test client.")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--save-baseline', action='store_true', help="Write this run's results as the new baseline.")
+        parser.add_argument(
+            '--latency-tolerance', type=float,
+            help="Also fail when throughput, p50 or p95 is more than this fraction worse than the baseline "
+                 "(e.g. 0.5). Off by default.",
+        )
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--force', action='store_true', help="Allow running with DEBUG=False.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("Refusing to benchmark against a production database without --force.")
+        if not options['url']:
+            # Lets the test client through ALLOWED_HOSTS outside the test runner
+            try:
+                setup_test_environment()
+            except RuntimeError:
+                pass  # already set up (running under the test runner)
+
+        product_ids = self._create_catalog(options['catalog_size'])
+        first_order = Order.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        first_cart = Cart.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        samples = {step: [] for step in STEPS}
+        queries = {step: [] for step in STEPS}
+        failures = []
+        lock = threading.Lock()
+
+        def shopper(n):
+            rng = random.Random(options['seed'] + n)
+            session = HTTPSession(options['url']) if options['url'] else ClientSession()
+            count = [0]
+
+            def counter(execute, sql, params, many, context):
+                count[0] += 1
+                return execute(sql, params, many, context)
+
+            def timed(step, call, *args, expect=(200, 302)):
+                count[0] = 0
+                started = time.perf_counter()
+                status, location = call(*args)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    samples[step].append(elapsed)
+                    queries[step].append(count[0])
+                    if status not in expect:
+                        failures.append(f"{step}: HTTP {status}")
+                return location
+
+            try:
+                with connection.execute_wrapper(counter):
+                    for _ in range(options['funnels']):
+                        pk = rng.choice(product_ids)
+                        timed('product_list', session.get, reverse('product_list') + f'?sort={rng.choice(["name", "price", "-price"])}')
+                        timed('product_detail', session.get, reverse('product_detail', args=[pk]))
+                        timed('add_to_cart', session.post, reverse('add_to_cart', args=[pk]), {'quantity': 1})
+                        timed('update_cart', session.post, reverse('update_cart'), {'product_id': pk, 'quantity': rng.randint(1, 3)}, True)
+                        timed('checkout', session.get, reverse('checkout'))
+                        location = timed('process_order', session.post, reverse('process_order'), {}, expect=(302,))
+                        if location and '/order/success/' in location:
+                            timed('order_success', session.get, urllib.parse.urlsplit(location).path)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=shopper, args=(n,)) for n in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # Benchmark products are kept for the next run; its orders and carts are not
+        Order.objects.filter(pk__gt=first_order).delete()
+        Cart.objects.filter(pk__gt=first_cart).delete()
+        results = self._summarize(samples, queries, elapsed, options)
+        if failures:
+            raise CommandError(f"{len(failures)} funnel step(s) failed, e.g. {failures[0]}")
+
+        if options['save_baseline']:
+            path = Path(options['baseline'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f"Baseline written to {path}")
+            return
+        self._compare(results, options)
+
+    def _create_catalog(self, size):
+        existing = list(Product.objects.filter(sku__startswith=SKU_PREFIX).order_by('pk').values_list('pk', flat=True))
+        if len(existing) < size:
+            rng = random.Random(size)
+            Product.objects.bulk_create([
+                Product(
+                    sku=f'{SKU_PREFIX}{n}', name=f'Benchmark Item {n}', description='Funnel benchmark product.',
+                    price=Decimal(rng.randint(100, 20000)) / 100, inventory_stock=10 ** 6,
+                )
+                for n in range(len(existing), size)
+            ], batch_size=1000)
+            catalog_cache.bump_version()
+            search.bump_version()
+        return list(Product.objects.filter(sku__startswith=SKU_PREFIX).order_by('pk').values_list('pk', flat=True)[:size])
+
+    def _summarize(self, samples, queries, elapsed, options):
+        funnels = len(samples['process_order'])
+        results = {
+            'mode': 'http' if options['url'] else 'client',
+            'database': connection.vendor,
+            'concurrency': options['concurrency'],
+            'catalog_size': options['catalog_size'],
+            'funnels_per_second': round(funnels / elapsed, 2),
+            'steps': {},
+        }
+        self.stdout.write(f"{funnels} funnels in {elapsed:.1f} s: {results['funnels_per_second']} funnels/s")
+        self.stdout.write(f"{'view':<16}{'req':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}")
+        for step in STEPS:
+            if not samples[step]:
+                continue
+            row = {
+                'p50_ms': round(percentile(samples[step], 50) * 1000, 2),
+                'p95_ms': round(percentile(samples[step], 95) * 1000, 2),
+                'p99_ms': round(percentile(samples[step], 99) * 1000, 2),
+                # Requests served by a live server run their queries in another process
+                'queries': percentile(queries[step], 50) if not options['url'] else None,
+            }
+            results['steps'][step] = row
+            self.stdout.write(
+                f"{step:<16}{len(samples[step]):>6}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+                f"{row['queries'] if row['queries'] is not None else '-':>9}"
+            )
+        return results
+
+    def _compare(self, results, options):
+        path = Path(options['baseline'])
+        if not path.exists():
+            self.stdout.write(f"No baseline at {path}; run with --save-baseline to create one.")
+            return
+        baseline = json.loads(path.read_text())
+        setup = ('mode', 'database', 'concurrency', 'catalog_size')
+        if any(baseline.get(key) != results[key] for key in setup):
+            raise CommandError(
+                f"Baseline {path} was recorded with a different setup "
+                f"({', '.join(f'{key}={baseline.get(key)}' for key in setup)}); pass a matching --baseline."
+            )
+        # Query counts are deterministic, so any increase is a regression. Timings depend on the
+        # machine and its load, so they are only compared when asked for with --latency-tolerance.
+        tolerance = options['latency_tolerance']
+        regressions = []
+        self.stdout.write(f"throughput {results['funnels_per_second']} funnels/s (baseline {baseline['funnels_per_second']})")
+        if tolerance is not None and results['funnels_per_second'] * (1 + tolerance) < baseline['funnels_per_second']:
+            regressions.append(f"throughput {results['funnels_per_second']} < baseline {baseline['funnels_per_second']}")
+        for step, row in results['steps'].items():
+            base = baseline['steps'].get(step)
+            if base is None:
+                continue
+            self.stdout.write(
+                f"{step:<16}p50 {row['p50_ms']:.2f} ms (baseline {base['p50_ms']:.2f} ms), "
+                f"p95 {row['p95_ms']:.2f} ms (baseline {base['p95_ms']:.2f} ms)"
+            )
+            if row['queries'] is not None and base.get('queries') is not None and row['queries'] > base['queries']:
+                regressions.append(f"{step} queries {row['queries']} > baseline {base['queries']}")
+            if tolerance is not None:
+                for key in ('p50_ms', 'p95_ms'):
+                    if row[key] > base[key] * (1 + tolerance):
+                        regressions.append(f"{step} {key[:3]} {row[key]} ms > baseline {base[key]} ms")
+        if regressions:
+            raise CommandError("Performance regression against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"OK: no regression against baseline {path}"))
@@ -0,0 +1,65 @@
+import random
+import timeit
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.cart import CartLine, lines_total
+from store.catalog import CatalogProduct
+
+DECIMAL_ZERO = Decimal('0.00')
+
+
+class DecimalCartLine:
+    """The previous CartLine, with a Decimal subtotal, for comparison."""
+    __slots__ = ('product', 'quantity', 'subtotal')
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+        self.subtotal = product.price * quantity
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmarks building cart lines and their total with Decimal prices vs integer-cents Money."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,5,20,100,500', help="Comma-separated cart line counts.")
+        parser.add_argument('--repeat', type=int, default=7)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        self.stdout.write(f"{'lines':>6} {'Decimal us':>11} {'Money us':>9} {'speedup':>8}  float drift")
+        for size in sizes:
+            products = [
+                CatalogProduct(pk, f'Product {pk}', '', Decimal(rng.randint(1, 50000)) / 100, 10, None)
+                for pk in range(1, size + 1)
+            ]
+            lines = [(product, rng.randint(1, 9)) for product in products]
+
+            # What get_cart_lines() does with the cart store and catalog records
+            def decimal_total():
+                cart_lines = [DecimalCartLine(product, quantity) for product, quantity in lines]
+                return sum((line.subtotal for line in cart_lines), DECIMAL_ZERO)
+
+            def money_total():
+                return lines_total([CartLine(product, quantity) for product, quantity in lines])
+
+            if money_total().to_decimal() != decimal_total():
+                raise CommandError(f"Money and Decimal totals differ for {size} lines.")
+            # What the old float-based JSON path produced, before rounding
+            float_total = sum(float(product.price) * quantity for product, quantity in lines)
+            drift = abs(Decimal(float_total) - decimal_total())
+
+            timings = {}
+            for label, run in (('decimal', decimal_total), ('money', money_total)):
+                number = max(1, 20000 // size)
+                timings[label] = min(timeit.repeat(run, number=number, repeat=options['repeat'])) / number * 1e6
+
+            self.stdout.write(
+                f"{size:>6} {timings['decimal']:>11.2f} {timings['money']:>9.2f} "
+                f"{timings['decimal'] / timings['money']:>7.2f}x  {drift:.2e}"
+            )
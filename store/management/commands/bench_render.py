@@ -0,0 +1,53 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from store import catalog_cache
+from store.models import Product
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Measures page render time per view with the catalog fragment cache on and off."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+
+    def handle(self, *args, **options):
+        product = Product.objects.order_by('pk').first()
+        if product is None:
+            raise CommandError("The catalog is empty; run migrate first.")
+
+        # Allows the test client to run outside the test runner (ALLOWED_HOSTS, locmem email)
+        setup_test_environment()
+        pages = [
+            ('product_list', reverse('product_list')),
+            ('product_list (price sort)', reverse('product_list') + '?sort=-price'),
+            ('product_detail', reverse('product_detail', args=[product.pk])),
+            ('search', reverse('search') + '?q=leather'),
+        ]
+        self.stdout.write(f"{'view':<28}{'cache':<7}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, url in pages:
+            for enabled in (False, True):
+                with override_settings(CATALOG_FRAGMENT_CACHE=enabled):
+                    cache.clear()
+                    catalog_cache.warm()
+                    client = Client()
+                    client.get(url)
+                    samples = []
+                    for _ in range(options['requests']):
+                        started = time.perf_counter()
+                        client.get(url)
+                        samples.append(time.perf_counter() - started)
+                self.stdout.write(
+                    f"{name:<28}{'on' if enabled else 'off':<7}"
+                    f"{percentile(samples, 50) * 1000:>9.2f}{percentile(samples, 95) * 1000:>9.2f}"
+                )
@@ -0,0 +1,68 @@
+import itertools
+import random
+import resource
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.search import SearchIndex
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the in-process search index (build time, memory, query latency) on a synthetic catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500000)
+        parser.add_argument('--vocabulary', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = [
+            ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+            for _ in range(options['vocabulary'])
+        ]
+        # Zipf-like word frequencies, as in real product text
+        cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocabulary))))
+
+        def documents():
+            for pk in range(1, options['products'] + 1):
+                name = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=3))
+                description = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=15))
+                yield pk, name, description
+
+        # ru_maxrss is in KiB on Linux; documents are streamed, so the growth is the index itself
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        index = SearchIndex(documents())
+        build_seconds = time.perf_counter() - started
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+        self.stdout.write(f"products:        {len(index)}")
+        self.stdout.write(f"build time:      {build_seconds:.2f} s")
+        self.stdout.write(f"peak RSS growth: {rss_growth / 1024:.1f} MiB")
+
+        queries = [
+            ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(1, 3)))
+            for _ in range(options['queries'])
+        ]
+        for label, run in (
+            ('search', lambda q: index.search(q)),
+            ('suggest', lambda q: index.search(q[:max(2, len(q) - 2)], limit=8, prefix=True)),
+        ):
+            samples = []
+            for query in queries:
+                started = time.perf_counter()
+                run(query)
+                samples.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f"{label + ' latency:':<17}p50 {percentile(samples, 50):.2f} ms  "
+                f"p95 {percentile(samples, 95):.2f} ms  p99 {percentile(samples, 99):.2f} ms"
+            )
@@ -0,0 +1,46 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from store import catalog_cache, thumbnails
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = "Builds the WebP/JPEG thumbnail variants of every product image in a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help="Rebuild variants that already exist.")
+
+    def handle(self, *args, **options):
+        rows = list(Product.objects.exclude(image='').values_list('pk', 'image', 'image_hash'))
+        stored = {pk: digest for pk, _, digest in rows}
+        jobs = [(pk, image) for pk, image, _ in rows]
+        started = time.perf_counter()
+
+        # Workers only read image files and write variants; they never use the database
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            results = list(pool.map(
+                _build, jobs, [options['force']] * len(jobs),
+                chunksize=max(1, len(jobs) // (options['workers'] * 4)),
+            ))
+
+        # Images replaced on disk without a save get their new digest (and so new URLs)
+        changed = [Product(pk=pk, image_hash=digest) for pk, digest in results if stored[pk] != digest]
+        if changed:
+            Product.objects.bulk_update(changed, ['image_hash'], batch_size=500)
+            catalog_cache.bump_version()
+
+        self.stdout.write(
+            f"Built thumbnails for {len(results)} image(s) with {options['workers']} worker(s) in "
+            f"{time.perf_counter() - started:.1f}s; {len(changed)} digest(s) updated."
+        )
+
+
+def _build(job, force):
+    pk, image = job
+    return thumbnails.build_variants(pk, image, force=force)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+def pending_migrations(database=DEFAULT_DB_ALIAS):
+    """Returns the names of migrations that are not applied to the database yet."""
+    connection = connections[database]
+    connection.prepare_database()
+    executor = MigrationExecutor(connection)
+    targets = executor.loader.graph.leaf_nodes()
+    return [f'{migration.app_label}.{migration.name}' for migration, _ in executor.migration_plan(targets)]
+
+
+class Command(BaseCommand):
+    help = "Exits non-zero if the database has unapplied migrations (run by entrypoint.sh instead of migrate)."
+    # Startup path: the system checks already run when gunicorn loads the app
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--wait', type=float, default=0,
+            help="Keep checking for up to N seconds, e.g. while the migrate job of the same deploy runs.",
+        )
+
+    def handle(self, *args, **options):
+        deadline = time.monotonic() + options['wait']
+        while True:
+            pending = pending_migrations(options['database'])
+            if not pending:
+                self.stdout.write("All migrations are applied.")
+                return
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(1)
+        raise CommandError(
+            f"{len(pending)} unapplied migration(s): {', '.join(pending)}. "
+            "Run the migrate job (entrypoint.sh migrate) first."
+        )
@@ -0,0 +1,176 @@
+import csv
+import io
+import json
+import resource
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+
+from store import catalog_cache, categories, search
+from store.models import Category, Product
+
+UPDATE_FIELDS = ['name', 'description', 'price', 'inventory_stock', 'category', 'updated_at']
+COPY_COLUMNS = ('sku', 'name', 'description', 'price', 'inventory_stock', 'category_id')
+
+
+def read_csv(handle):
+    """Yields (line number, row dict)."""
+    reader = csv.DictReader(handle)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(handle):
+    """Yields (line number, line); parse_row() decodes it, so a bad line is skipped like any invalid row."""
+    for line_no, line in enumerate(handle, start=1):
+        line = line.strip()
+        if line:
+            yield line_no, line
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def parse_row(row):
+    """Returns (sku, name, description, price, stock, category_slug, category_name); raises ValueError."""
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError(f"expected an object, got {type(row).__name__}")
+    sku = str(row.get('sku') or '').strip()
+    name = str(row.get('name') or '').strip()
+    if not sku or len(sku) > 64:
+        raise ValueError("missing or over-long sku")
+    if not name or len(name) > 100:
+        raise ValueError("missing or over-long name")
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f"invalid price {row.get('price')!r}")
+    if price < 0 or price >= 10 ** 8:
+        raise ValueError(f"price out of range {price}")
+    stock = int(row.get('stock', row.get('inventory_stock')) or 0)
+    if stock < 0:
+        raise ValueError("negative stock")
+    slug = str(row.get('category') or '').strip() or None
+    return sku, name, row.get('description') or None, price, stock, slug, row.get('category_name')
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams products from a CSV or JSONL file (or - for stdin) and upserts them by sku in batches. "
+        "Columns: sku, name, description, price, stock, category (slug), optional category_name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(READERS), help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-copy', action='store_true', help="Use bulk_create upserts even on PostgreSQL.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.categories = dict(Category.objects.exclude(slug__isnull=True).values_list('slug', 'pk'))
+
+        handle = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        imported = skipped = 0
+        started = time.perf_counter()
+        try:
+            batch = {}
+            for line_no, row in READERS[file_format](handle):
+                try:
+                    record = parse_row(row)
+                except (TypeError, ValueError) as error:
+                    skipped += 1
+                    if skipped <= 10:
+                        self.stderr.write(f"line {line_no}: skipped ({error})")
+                    continue
+                # Later rows for the same sku win, also within one batch
+                batch[record[0]] = record
+                if len(batch) >= options['batch_size']:
+                    imported += self.write_batch(batch.values(), use_copy)
+                    batch = {}
+                    # With DEBUG on, the logged batch SQL would otherwise accumulate
+                    reset_queries()
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f"{imported} rows, {imported / elapsed:.0f} rows/s")
+            if batch:
+                imported += self.write_batch(batch.values(), use_copy)
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+            if imported:
+                # Also when a later batch failed: the committed ones must not leave the caches stale
+                self.finish()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} rows ({skipped} skipped) in {elapsed:.1f} s, "
+            f"{imported / elapsed if elapsed else 0:.0f} rows/s, "
+            f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB "
+            f"({'COPY' if use_copy else 'bulk_create'})"
+        ))
+
+    def finish(self):
+        # bulk writes bypass post_save; recount categories, retire cached pages and let the search index rebuild
+        categories.rebuild()
+        catalog_cache.bump_version()
+        search.bump_version()
+
+    def category_id(self, slug, name):
+        if slug is None:
+            return None
+        pk = self.categories.get(slug)
+        if pk is None:
+            category = Category.objects.filter(slug=slug).first()
+            if category is None:
+                category = Category.objects.create(slug=slug, name=(name or slug.replace('-', ' ').title())[:50])
+            pk = self.categories[slug] = category.pk
+        return pk
+
+    def write_batch(self, records, use_copy):
+        rows = [
+            (sku, name, description, price, stock, self.category_id(slug, category_name))
+            for sku, name, description, price, stock, slug, category_name in records
+        ]
+        with transaction.atomic():
+            if use_copy:
+                self.copy_rows(rows)
+            else:
+                Product.objects.bulk_create(
+                    [
+                        Product(sku=sku, name=name, description=description, price=price, inventory_stock=stock, category_id=category_id)
+                        for sku, name, description, price, stock, category_id in rows
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=UPDATE_FIELDS,
+                )
+        return len(rows)
+
+    def copy_rows(self, rows):
+        """COPYs the batch into a temporary table and merges it with one INSERT ... ON CONFLICT."""
+        table = connection.ops.quote_name(Product._meta.db_table)
+        columns = ', '.join(COPY_COLUMNS)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE IF NOT EXISTS catalog_import ('
+                'sku varchar(64), name varchar(100), description text, price numeric(10, 2), '
+                'inventory_stock integer, category_id bigint) ON COMMIT DELETE ROWS'
+            )
+            cursor.copy_expert(f'COPY catalog_import ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+            # Columns not in the file get the values Product() would give them
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}, image, image_hash, updated_at) "
+                f"SELECT {columns}, '', '', now() FROM catalog_import "
+                f"ON CONFLICT (sku) DO UPDATE SET "
+                + ', '.join(f'{column} = EXCLUDED.{column}' for column in (*COPY_COLUMNS[1:], 'updated_at'))
+            )
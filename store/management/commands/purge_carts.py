@@ -0,0 +1,56 @@
+import re
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from store.cart import purge_stale_carts
+
+UNITS = {'d': 'days', 'h': 'hours', 'm': 'minutes'}
+
+
+def duration(value):
+    """Parses '30d', '12h' or '90m' (a bare number means days)."""
+    match = re.fullmatch(r'(\d+)([dhm]?)', value.strip())
+    if match is None:
+        raise ValueError(value)
+    return timedelta(**{UNITS[match[2] or 'd']: int(match[1])})
+
+
+class Command(BaseCommand):
+    help = "Deletes anonymous carts not updated for a while, in small primary-key batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=duration, required=True, help="Age such as 30d, 12h or 90m.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Cart ids per batch (one transaction each).")
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches.")
+        parser.add_argument(
+            '--max-lag', type=float, default=None,
+            help="Wait while PostgreSQL replicas are more than N seconds behind.",
+        )
+        parser.add_argument('--interval', type=float, default=0, help="Keep purging every N seconds (0 = run once).")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        while True:
+            started = time.perf_counter()
+            carts = lines = 0
+            batches = purge_stale_carts(
+                timezone.now() - options['older_than'], options['batch_size'],
+                pause=options['pause'], max_lag=options['max_lag'],
+            )
+            for batch_carts, batch_lines in batches:
+                carts += batch_carts
+                lines += batch_lines
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"  deleted {batch_carts} cart(s), {batch_lines} line(s)")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Purged {carts} cart(s) and {lines} line(s) in {elapsed:.1f}s "
+                f"({(carts + lines) / elapsed if elapsed else 0:.0f} rows/s)."
+            )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from store import rollups
+
+
+class Command(BaseCommand):
+    help = "Refreshes the hourly/daily sales rollups from the orders changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', type=date.fromisoformat,
+            help="Also rebuild every day from this date (YYYY-MM-DD), e.g. after bulk order updates or deletes.",
+        )
+        parser.add_argument('--interval', type=float, default=0, help="Keep refreshing every N seconds (0 = run once).")
+
+    def handle(self, *args, **options):
+        since = options['since']
+        while True:
+            started = time.perf_counter()
+            days = rollups.refresh(since=since)
+            self.stdout.write(f"Rebuilt {days} day(s) of sales rollups in {time.perf_counter() - started:.2f}s.")
+            if not options['interval']:
+                break
+            since = None
+            time.sleep(options['interval'])
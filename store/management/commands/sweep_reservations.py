@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.inventory import release_expired, sync_displayed_stock
+
+
+class Command(BaseCommand):
+    help = "Returns expired flash-sale stock reservations to their shards and refreshes displayed stock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=0, help="Keep sweeping every N seconds (0 = run once).")
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired(options['batch_size'])
+            sync_displayed_stock()
+            self.stdout.write(f"Released {released} expired reservation(s).")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,308 @@
+# store/metrics.py
+"""
+Per-view request metrics in the Prometheus text format.
+
+MetricsMiddleware times every request and files it under the resolved URL
+name, together with the SQL queries it ran (count and time), the time spent
+rendering templates and the response size, plus the queries per database
+alias (primary and replicas, see store/db_routing.py). Queries are counted by
+a wrapper installed on every database connection (see signals.py) and
+templates are timed by the DjangoTemplates backend below; both report into a
+per-request context variable, so they also work for async views.
+
+Each thread aggregates into its own table, so recording takes no lock.
+When settings.METRICS_DIR is set, every process writes its totals to
+<METRICS_DIR>/<pid>.json at most every METRICS_FLUSH_INTERVAL seconds, and
+/metrics merges the files of all gunicorn workers (exited workers are folded
+into archive.json by the child_exit hook in config/gunicorn.conf.py).
+"""
+import contextvars
+import fcntl
+import json
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+
+# Latency histogram upper bounds in seconds (+Inf is implied)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Per-series values: requests, latency sum, queries, query seconds, template seconds, bytes, then
+# buckets, then queries per database alias
+COUNT, LATENCY, QUERIES, QUERY_TIME, TEMPLATE_TIME, BYTES, FIRST_BUCKET = range(7)
+ALIASES = tuple(settings.DATABASES)
+FIRST_ALIAS = FIRST_BUCKET + len(BUCKETS) + 1
+SERIES_LENGTH = FIRST_ALIAS + len(ALIASES)
+_alias_index = {alias: i for i, alias in enumerate(ALIASES)}
+
+ARCHIVE_FILE = 'archive.json'
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+# [queries, query seconds, template seconds, queries per alias...] of the request being handled
+_request_stats = contextvars.ContextVar('store_metrics_request', default=None)
+
+
+# --- PER-THREAD AGGREGATION ---
+_local = threading.local()
+_tables = []
+_tables_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def _table():
+    table = getattr(_local, 'table', None)
+    if table is None:
+        table = _local.table = {}
+        with _tables_lock:
+            _tables.append(table)
+    return table
+
+
+def record(view, method, status, duration, queries, query_time, template_time, size, alias_queries=()):
+    """Adds one request to the calling thread's table (only this thread writes to it)."""
+    key = (view, method if method in METHODS else 'other', f'{status // 100}xx')
+    table = _table()
+    series = table.get(key)
+    if series is None:
+        series = table[key] = [0] * SERIES_LENGTH
+    series[COUNT] += 1
+    series[LATENCY] += duration
+    series[QUERIES] += queries
+    series[QUERY_TIME] += query_time
+    series[TEMPLATE_TIME] += template_time
+    series[BYTES] += size
+    for i, count in enumerate(alias_queries):
+        series[FIRST_ALIAS + i] += count
+    bucket = FIRST_BUCKET
+    for bound in BUCKETS:
+        if duration <= bound:
+            break
+        bucket += 1
+    series[bucket] += 1
+
+
+def _merge(into, rows):
+    for key, values in rows:
+        series = into.get(key)
+        if series is None:
+            into[key] = list(values)
+        else:
+            # Files written before a database alias was added have shorter series
+            series.extend([0] * (len(values) - len(series)))
+            for i, value in enumerate(values):
+                series[i] += value
+    return into
+
+
+def snapshot():
+    """Returns {(view, method, status): values} summed over this process's threads."""
+    with _tables_lock:
+        tables = list(_tables)
+    merged = {}
+    for table in tables:
+        _merge(merged, table.copy().items())
+    return merged
+
+
+def reset():
+    with _tables_lock:
+        for table in _tables:
+            table.clear()
+
+
+# --- MULTIPROCESS FILES ---
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _write(path, data):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as handle:
+        json.dump([[*key, *values] for key, values in data.items()], handle)
+    os.replace(temporary, path)
+
+
+def _read(path):
+    try:
+        with open(path) as handle:
+            return [(tuple(row[:3]), row[3:]) for row in json.load(handle)]
+    except (OSError, ValueError):
+        return []
+
+
+def flush():
+    """Writes this process's totals to METRICS_DIR (no-op without one)."""
+    global _last_flush
+    directory = _metrics_dir()
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        _write(os.path.join(directory, f'{os.getpid()}.json'), snapshot())
+    _last_flush = time.monotonic()
+
+
+def _maybe_flush():
+    if _metrics_dir() and time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        flush()
+
+
+def mark_process_dead(pid, directory=None):
+    """Folds an exited worker's totals into archive.json so counters never go backwards."""
+    directory = directory or _metrics_dir()
+    if not directory:
+        return
+    path = os.path.join(directory, f'{pid}.json')
+    if not os.path.exists(path):
+        return
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = os.path.join(directory, ARCHIVE_FILE)
+        _write(archive, _merge(_merge({}, _read(archive)), _read(path)))
+        os.unlink(path)
+
+
+def collect():
+    """Returns the totals of all processes sharing METRICS_DIR, or of this process without one."""
+    directory = _metrics_dir()
+    if not directory:
+        return snapshot()
+    flush()
+    merged = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            _merge(merged, _read(os.path.join(directory, name)))
+    return merged
+
+
+# --- PROMETHEUS TEXT FORMAT ---
+def _labels(key, **extra):
+    view, method, status = key
+    pairs = {'view': view, 'method': method, 'status': status, **extra}
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs.items()) + '}'
+
+
+def render(data=None):
+    data = collect() if data is None else data
+    lines = [
+        '# HELP store_http_request_duration_seconds Request latency by URL name.',
+        '# TYPE store_http_request_duration_seconds histogram',
+    ]
+    for key, values in sorted(data.items()):
+        cumulative = 0
+        for i, bound in enumerate(BUCKETS):
+            cumulative += values[FIRST_BUCKET + i]
+            lines.append(f'store_http_request_duration_seconds_bucket{_labels(key, le=bound)} {cumulative}')
+        lines.append(f'store_http_request_duration_seconds_bucket{_labels(key, le="+Inf")} {values[COUNT]}')
+        lines.append(f'store_http_request_duration_seconds_sum{_labels(key)} {values[LATENCY]:.6f}')
+        lines.append(f'store_http_request_duration_seconds_count{_labels(key)} {values[COUNT]}')
+
+    for name, index, description in (
+        ('store_db_queries_total', QUERIES, 'SQL queries run by requests.'),
+        ('store_db_query_seconds_total', QUERY_TIME, 'Time spent in SQL queries.'),
+        ('store_template_render_seconds_total', TEMPLATE_TIME, 'Time spent rendering templates.'),
+        ('store_http_response_bytes_total', BYTES, 'Response body bytes sent.'),
+    ):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for key, values in sorted(data.items()):
+            value = values[index]
+            lines.append(f'{name}{_labels(key)} {value:.6f}' if isinstance(value, float) else f'{name}{_labels(key)} {value}')
+
+    lines.append('# HELP store_db_alias_queries_total SQL queries run by requests, per database alias.')
+    lines.append('# TYPE store_db_alias_queries_total counter')
+    for key, values in sorted(data.items()):
+        for i, alias in enumerate(ALIASES):
+            if FIRST_ALIAS + i < len(values) and values[FIRST_ALIAS + i]:
+                lines.append(f'store_db_alias_queries_total{_labels(key, alias=alias)} {values[FIRST_ALIAS + i]}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- INSTRUMENTATION ---
+def count_query(execute, sql, params, many, context):
+    """Database execute wrapper installed on every connection (see signals.py)."""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - started
+        index = _alias_index.get(context['connection'].alias)
+        if index is not None:
+            stats[3 + index] += 1
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _request_stats.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats[2] += time.perf_counter() - started
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """The Django template backend, timing each render for the metrics middleware."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class MetricsMiddleware:
+    """Records per-view metrics; place it first in MIDDLEWARE so it times the whole stack."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = [0, 0.0, 0.0] + [0] * len(ALIASES)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = [0, 0.0, 0.0] + [0] * len(ALIASES)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        self._record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    @staticmethod
+    def _record(request, response, duration, stats):
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match is not None else 'unmatched'
+        size = int(response.get('Content-Length') or 0) if response.streaming else len(response.content)
+        record(view, request.method, response.status_code, duration, stats[0], stats[1], stats[2], size, stats[3:])
+        _maybe_flush()
@@ -0,0 +1,42 @@
+# store/middleware.py
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs natively under ASGI. WhiteNoise 6 is
+    sync-only, which would make Django hold a thread for the whole of every
+    async request behind it. Also serves the product thumbnails present in
+    THUMBNAIL_ROOT at startup, as immutable files (their names are content hashes).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if self.autorefresh or os.path.isdir(settings.THUMBNAIL_ROOT):
+            self.add_files(settings.THUMBNAIL_ROOT, prefix=settings.THUMBNAIL_URL)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def immutable_file_test(self, path, url):
+        return url.startswith(settings.THUMBNAIL_URL) or super().immutable_file_test(path, url)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+def assign_remaining_categories(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Category = apps.get_model('store', 'Category')
+
+    # 0006 only categorised three products; the storefront now reads categories from the database
+    assignments = {
+        'clothing': ["Slim Fit Hoodie", "Premium Denim Jeans"],
+        'accessories': ["Cross-Body Bag"],
+        'footwear': ["Business Loafers"],
+    }
+    for slug, names in assignments.items():
+        category = Category.objects.filter(slug=slug).first()
+        if category is not None:
+            Product.objects.filter(name__in=names, category__isnull=True).update(category=category)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_assign_categories'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_remaining_categories, migrations.RunPython.noop),
+    ]
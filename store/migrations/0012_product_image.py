@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_request_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image',
+            field=models.ImageField(blank=True, height_field='image_height', upload_to='products/', width_field='image_width'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('high_water', models.DateTimeField(null=True)),
+                ('refreshed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=10)),
+                ('order_lines', models.PositiveIntegerField()),
+                ('units', models.PositiveBigIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('day', models.DateField()),
+                ('category', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.category')),
+                ('product', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales',
+                'indexes': [models.Index(fields=['day', 'product'], name='daily_sales_day_idx'), models.Index(fields=['category', 'day'], name='daily_sales_category_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=10)),
+                ('order_lines', models.PositiveIntegerField()),
+                ('units', models.PositiveBigIntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('hour', models.DateTimeField()),
+                ('category', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.category')),
+                ('product', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.product')),
+            ],
+            options={
+                'verbose_name_plural': 'Hourly sales',
+                'indexes': [models.Index(fields=['hour', 'product'], name='hourly_sales_hour_idx')],
+            },
+        ),
+    ]
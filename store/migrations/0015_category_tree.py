@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_paths(apps, schema_editor):
+    # Existing categories are all roots
+    Category = apps.get_model('store', 'Category')
+    Product = apps.get_model('store', 'Product')
+    counts = dict(
+        Product.objects.filter(category__isnull=False).values_list('category_id').annotate(n=Count('pk')).order_by()
+    )
+    categories = list(Category.objects.all())
+    for category in categories:
+        category.path = f'{category.pk}/'
+        category.product_count = counts.get(category.pk, 0)
+    Category.objects.bulk_update(categories, ['path', 'product_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='store.category'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
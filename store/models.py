@@ -1,14 +1,44 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings # For referencing the User model
 
+from .money import Money
+
 # NEW: Category Model
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=50, unique=True, null=True, blank=True)
-    
+    # Subcategories: a category with children cannot be deleted until they are moved
+    parent = models.ForeignKey('self', on_delete=models.PROTECT, null=True, blank=True, related_name='children')
+    # Materialized path of pks from the root, e.g. "3/12/" (see store/categories.py)
+    path = models.CharField(max_length=255, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Products in this category and all of its descendants, kept up to date incrementally
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         verbose_name_plural = 'Categories'
-        
+        indexes = [
+            # Pattern ops let PostgreSQL use the index for subtree (LIKE 'path%') lookups
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def clean(self):
+        from .categories import check_parent
+        check_parent(self)
+
+    def save(self, *args, **kwargs):
+        from . import categories
+        with transaction.atomic():
+            stored = categories.place(self)
+            if stored is not None:
+                # product_count is only ever changed with F() updates; never write back a stale copy
+                update_fields = kwargs.get('update_fields') or [
+                    field.name for field in self._meta.concrete_fields if not field.primary_key
+                ]
+                kwargs['update_fields'] = {*update_fields, 'path', 'depth'} - {'product_count'}
+            super().save(*args, **kwargs)
+            categories.placed(self, stored)
+
     def __str__(self):
         return self.name
 
@@ -16,11 +46,47 @@ class Category(models.Model):
 class Product(models.Model):
     # Link to the new Category model
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True) 
+    # External stock-keeping unit; the upsert key of the import_catalog command
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     # Inventory stock field for management
     inventory_stock = models.PositiveIntegerField(default=10) 
+    # Original upload; pages show the resized variants from store/thumbnails.py
+    image = models.ImageField(upload_to='products/', blank=True, width_field='image_width', height_field='image_height')
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Content digest of the image, part of every thumbnail URL
+    image_hash = models.CharField(max_length=12, blank=True, editable=False)
+    # ETag and Last-Modified of the catalog pages showing the product (store/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Composite indexes backing the keyset-paginated sort orders of product_list
+        indexes = [
+            models.Index(fields=['category', 'price', 'id'], name='product_cat_price_id_idx'),
+            models.Index(fields=['category', 'name', 'id'], name='product_cat_name_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ]
+
+    def clean(self):
+        # Blank SKUs are stored as NULL so any number of products can go without one
+        self.sku = self.sku or None
+
+    def save(self, *args, **kwargs):
+        if not self.image:
+            self.image_hash = ''
+        elif not self.image._committed or not self.image_hash:
+            from .thumbnails import file_hash
+            self.image_hash = file_hash(self.image)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if 'image' in update_fields:
+                update_fields = {*update_fields, 'image_hash', 'image_width', 'image_height'}
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -33,12 +99,14 @@ class Cart(models.Model):
     # A unique identifier for anonymous carts (stored in session)
     session_key = models.CharField(max_length=40, null=True, blank=True, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed for the admin changelist ordering and purging stale carts
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     @property
     def total(self):
-        # Calculate total price of all items in the cart
-        return sum(item.subtotal for item in self.items.all())
+        # Calculate total price of all items in the cart with one aggregate query
+        from .cart import get_total
+        return get_total(self)
 
     def __str__(self):
         if self.user:
@@ -52,7 +120,11 @@ class CartItem(models.Model):
 
     @property
     def subtotal(self):
-        return self.product.price * self.quantity
+        # Prefer the value computed by the database (see store/cart.py get_lines)
+        line_subtotal = getattr(self, 'line_subtotal', None)
+        if line_subtotal is not None:
+            return Money.from_decimal(line_subtotal)
+        return Money.from_decimal(self.product.price) * self.quantity
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
@@ -64,7 +136,10 @@ class CartItem(models.Model):
 # The Order model is simplified to integrate with a checkout process
 class Order(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Indexed for the day-by-day rebuilds of the sales rollups and the admin date filter
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # High-water mark column of the sales rollups (store/rollups.py); set by every save()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     total_paid = models.DecimalField(max_digits=10, decimal_places=2)
     # Status fields for a more complete e-commerce solution
     STATUS_CHOICES = [
@@ -74,7 +149,7 @@ class Order(models.Model):
         ('Completed', 'Completed'),
         ('Cancelled', 'Cancelled'),
     ]
-    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending', db_index=True)
 
     def __str__(self):
         return f"Order {self.id} ({self.status})"
@@ -87,7 +162,107 @@ class OrderItem(models.Model):
 
     @property
     def subtotal(self):
-        return self.price * self.quantity
+        return Money.from_decimal(self.price) * self.quantity
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} (Ordered)"
+
+# FLASH-SALE INVENTORY (see store/inventory.py)
+
+class FlashSale(models.Model):
+    # Opt-in per product: stock is split across InventoryShard rows to avoid a single hot row
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='flash_sale')
+    shards = models.PositiveSmallIntegerField(default=8)
+    # How long an add-to-cart holds stock before the sweeper returns it
+    reservation_ttl = models.PositiveIntegerField(default=600, help_text="Seconds")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Flash sale: {self.product.name} ({self.shards} shards)"
+
+class InventoryShard(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='inventory_shards')
+    shard_no = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'shard_no')
+
+    def __str__(self):
+        return f"{self.product.name} shard {self.shard_no}: {self.stock}"
+
+class StockReservation(models.Model):
+    # Stock taken from a shard by add_to_cart; consumed by checkout or returned once expired
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='reservations')
+    shard_no = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} until {self.expires_at}"
+
+# REQUEST PROFILES (see store/profiling.py)
+
+class RequestProfile(models.Model):
+    # One profiled request: cProfile stats (pstats marshal format) plus its SQL log
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=100, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    # True when picked by PROFILING_SAMPLE_RATE rather than requested by staff
+    sampled = models.BooleanField(default=False)
+    stats = models.BinaryField()
+    sql_log = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+# SALES ROLLUPS (see store/rollups.py)
+
+class SalesRollup(models.Model):
+    # Units and revenue of the order items in one bucket, per product, category and order status.
+    # Products and categories are not foreign-key constrained so history survives their deletion.
+    product = models.ForeignKey(Product, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    status = models.CharField(max_length=10)
+    order_lines = models.PositiveIntegerField()
+    units = models.PositiveBigIntegerField()
+    revenue = models.DecimalField(max_digits=16, decimal_places=2)
+
+    class Meta:
+        abstract = True
+
+
+class HourlySales(SalesRollup):
+    hour = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'Hourly sales'
+        indexes = [models.Index(fields=['hour', 'product'], name='hourly_sales_hour_idx')]
+
+
+class DailySales(SalesRollup):
+    # Calendar day in settings.TIME_ZONE
+    day = models.DateField()
+
+    class Meta:
+        verbose_name_plural = 'Daily sales'
+        indexes = [
+            models.Index(fields=['day', 'product'], name='daily_sales_day_idx'),
+            models.Index(fields=['category', 'day'], name='daily_sales_category_idx'),
+        ]
+
+
+class RollupState(models.Model):
+    # Order.updated_at up to which a rollup has been refreshed
+    name = models.CharField(max_length=50, unique=True)
+    high_water = models.DateTimeField(null=True)
+    refreshed_at = models.DateTimeField(null=True)
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name} (Ordered)"
\ No newline at end of file
+        return f"{self.name} up to {self.high_water}"
@@ -0,0 +1,109 @@
+# store/money.py
+"""
+Money as an integer number of minor units (pence/cents).
+
+Prices are stored in DecimalField(decimal_places=2) columns; Money converts
+to and from those Decimals exactly and does cart and order arithmetic on
+plain ints. Catalog records carry their price as Money (unit_price) and cart
+lines keep int subtotals, so a cart total is one int sum (cart.lines_total;
+see the bench_money command). Floats are rejected so no binary rounding can
+creep in.
+
+JSON responses carry amounts as strings with two decimals ("12.30"), the
+same text the templates render; use MoneyJSONEncoder (or str()) for them.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from functools import total_ordering
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+CENT = Decimal('0.01')
+
+
+@total_ordering
+class Money:
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        if not isinstance(cents, int):
+            raise TypeError(f"Money takes integer cents, not {type(cents).__name__}; use Money.from_decimal().")
+        self.cents = cents
+
+    @classmethod
+    def from_decimal(cls, value):
+        """Converts a Decimal (e.g. a DecimalField value) or a numeric string; half-cents round up."""
+        if isinstance(value, float):
+            raise TypeError("Money.from_decimal() does not accept floats.")
+        value = Decimal(value)
+        return cls(int(value.quantize(CENT, rounding=ROUND_HALF_UP).scaleb(2)))
+
+    @classmethod
+    def sum(cls, amounts):
+        """Adds up Money amounts in one pass over their ints."""
+        return cls(sum(amount.cents for amount in amounts))
+
+    def to_decimal(self):
+        """Returns the exact two-decimal Decimal for DecimalField columns."""
+        return Decimal(self.cents).scaleb(-2)
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    # sum() starts from 0
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __mul__(self, quantity):
+        if isinstance(quantity, int):
+            return Money(self.cents * quantity)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        if isinstance(other, (Decimal, int)):
+            return self.to_decimal() == other
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        if isinstance(other, (Decimal, int)):
+            return self.to_decimal() < other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.to_decimal())
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __str__(self):
+        sign = '-' if self.cents < 0 else ''
+        units, cents = divmod(abs(self.cents), 100)
+        return f'{sign}{units}.{cents:02d}'
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+
+ZERO = Money(0)
+
+
+class MoneyJSONEncoder(DjangoJSONEncoder):
+    """Encodes Money (and Decimal, via DjangoJSONEncoder) as a "12.30" string."""
+
+    def default(self, o):
+        if isinstance(o, Money):
+            return str(o)
+        return super().default(o)
@@ -0,0 +1,136 @@
+# store/pagination.py
+"""
+Keyset (cursor) pagination for the product listing.
+
+Instead of OFFSET, each page continues strictly after the (sort value, id) of
+the last row of the previous page. With a composite index on
+(category, sort field, id) every page is a single index range scan, so deep
+pages cost the same as the first one.
+
+EstimatedCountPaginator is for admin changelists over large tables, where an
+exact COUNT(*) per page view costs a full scan.
+"""
+import base64
+import binascii
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+PAGE_SIZE = 12
+
+# sort parameter -> (model field, descending)
+SORT_ORDERS = {
+    'name': ('name', False),
+    'price': ('price', False),
+    '-price': ('price', True),
+}
+DEFAULT_SORT = 'name'
+
+
+def encode_cursor(value, pk):
+    """Encodes the last row's sort value and pk as an opaque URL-safe token."""
+    raw = json.dumps([str(value), pk], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, field):
+    """Returns (value, pk) from a cursor token, or None if the token is missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk = json.loads(raw.decode('utf-8'))
+        pk = int(pk)
+        if field == 'price':
+            value = Decimal(value)
+            if not value.is_finite():
+                return None
+        elif not isinstance(value, str):
+            return None
+    except (binascii.Error, ValueError, TypeError, InvalidOperation, UnicodeDecodeError):
+        return None
+    return value, pk
+
+
+def normalize_sort(sort):
+    return sort if sort in SORT_ORDERS else DEFAULT_SORT
+
+
+def read_cursor(token, sort):
+    """Returns the (value, pk) position a cursor token points at for the sort order, or None."""
+    return decode_cursor(token, SORT_ORDERS[normalize_sort(sort)][0])
+
+
+def position_key(position):
+    """Identifies a page position in cache keys; every token decoding to the same position shares it."""
+    if position is None:
+        return '-'
+    value, pk = position
+    if isinstance(value, Decimal):
+        value = format(value.normalize(), 'f')
+    return hashlib.md5(json.dumps([value, pk]).encode('utf-8')).hexdigest()
+
+
+def _page_queryset(queryset, sort, position, per_page):
+    field, descending = SORT_ORDERS[normalize_sort(sort)]
+
+    if position is not None:
+        value, pk = position
+        if descending:
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+
+    prefix = '-' if descending else ''
+    # Fetch one extra row to learn whether a next page exists without a COUNT(*)
+    return queryset.order_by(f'{prefix}{field}', f'{prefix}pk')[:per_page + 1]
+
+
+def _finish_page(rows, sort, per_page):
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, SORT_ORDERS[normalize_sort(sort)][0]), last.pk)
+    return rows, next_cursor
+
+
+def paginate(queryset, sort, position=None, per_page=PAGE_SIZE):
+    """
+    Returns (rows, next_cursor) for the page of `queryset` after `position`
+    (from read_cursor()). next_cursor is None on the last page.
+    """
+    rows = list(_page_queryset(queryset, sort, position, per_page))
+    return _finish_page(rows, sort, per_page)
+
+
+async def apaginate(queryset, sort, position=None, per_page=PAGE_SIZE):
+    """Async version of paginate() using the async ORM."""
+    rows = [row async for row in _page_queryset(queryset, sort, position, per_page)]
+    return _finish_page(rows, sort, per_page)
+
+
+# --- ADMIN CHANGELISTS ---
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the PostgreSQL planner's row estimate (EXPLAIN) as the count once it
+    reaches `threshold` rows, and an exact COUNT(*) below that or on other
+    databases. An estimate may be off by a few percent, so the last page can
+    come up short or empty; the rows shown are always exact.
+    """
+    threshold = 50000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate >= self.threshold:
+                return estimate
+        return queryset.count()
@@ -0,0 +1,160 @@
+# store/profiling.py
+"""
+On-demand request profiling.
+
+A staff user adds the header "X-Profile: 1" (or the query parameter
+?_profile=1) to run that request under cProfile; additionally,
+settings.PROFILING_SAMPLE_RATE profiles that fraction of all traffic. The
+stats (pstats format: snakeviz, flameprof, gprof2dot) and the request's SQL
+log are saved as a RequestProfile and can be downloaded from the admin.
+
+A request that is not profiled costs one header lookup, one substring test
+on the raw query string and, only when sampling is on, one random number;
+each of its queries, one context variable lookup in log_query(). Queries are
+logged through a context variable rather than per-thread connections, so
+under ASGI those run in sync_to_async threads are logged too. The profiler
+itself runs on the event loop there, so concurrent requests show up in the
+profile.
+"""
+import contextvars
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .models import RequestProfile
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = '_profile'
+
+# The SQL log of the request being profiled (sync_to_async threads inherit it)
+_query_log = contextvars.ContextVar('store_profiling_queries', default=None)
+
+
+def log_query(execute, sql, params, many, context):
+    """Database execute wrapper installed on every connection (see signals.py)."""
+    queries = _query_log.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append({
+            'alias': context['connection'].alias,
+            'sql': sql,
+            'params': repr(params),
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+        })
+
+
+def load_stats(profile):
+    """Returns a pstats.Stats for a saved RequestProfile."""
+    stats = pstats.Stats(stream=io.StringIO())
+    stats.stats = marshal.loads(bytes(profile.stats))
+    stats.get_top_level_stats()
+    return stats
+
+
+def summary(profile, limit=30):
+    """Top functions by cumulative time, as text."""
+    stream = io.StringIO()
+    stats = load_stats(profile)
+    stats.stream = stream
+    stats.sort_stats('cumulative').print_stats(limit)
+    return stream.getvalue()
+
+
+class ProfilingMiddleware:
+    """Place after AuthenticationMiddleware so staff users can be recognised."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _triggers(request):
+        """Returns (requested, sampled) without touching the session or the user."""
+        requested = HEADER in request.META or QUERY_PARAM in request.META.get('QUERY_STRING', '')
+        rate = settings.PROFILING_SAMPLE_RATE
+        return requested, not requested and rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        requested, sampled = self._triggers(request)
+        if sampled or (requested and request.user.is_staff and self._flag_set(request)):
+            return self._profile(request, sampled)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        requested, sampled = self._triggers(request)
+        if sampled or (requested and (await request.auser()).is_staff and self._flag_set(request)):
+            queries = []
+            token = _query_log.set(queries)
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profiler.disable()
+                _query_log.reset(token)
+            return await sync_to_async(self._save)(request, response, profiler, time.perf_counter() - started, queries, sampled)
+        return await self.get_response(request)
+
+    @staticmethod
+    def _flag_set(request):
+        value = request.META.get(HEADER) or request.GET.get(QUERY_PARAM)
+        return value not in (None, '', '0')
+
+    def _profile(self, request, sampled):
+        queries = []
+        token = _query_log.set(queries)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            _query_log.reset(token)
+        return self._save(request, response, profiler, time.perf_counter() - started, queries, sampled)
+
+    def _save(self, request, response, profiler, duration, queries, sampled):
+        profiler.create_stats()
+        match = request.resolver_match
+        user = getattr(request, 'user', None)
+        profile = RequestProfile.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:500],
+            view_name=(match.view_name if match else '')[:100],
+            user=user if user is not None and user.is_authenticated else None,
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            query_count=len(queries),
+            sampled=sampled,
+            stats=marshal.dumps(profiler.stats),
+            sql_log=json.dumps(queries, indent=1),
+        )
+        self._trim()
+        if not sampled:
+            response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    @staticmethod
+    def _trim():
+        keep = settings.PROFILING_MAX_PROFILES
+        cutoff = list(RequestProfile.objects.order_by('-pk').values_list('pk', flat=True)[keep:keep + 1])
+        if cutoff:
+            RequestProfile.objects.filter(pk__lte=cutoff[0]).delete()
@@ -0,0 +1,157 @@
+# store/rollups.py
+"""
+Hourly and daily sales rollups.
+
+HourlySales and DailySales hold the units, revenue and order-line count of
+the order items in each bucket, per product, category and order status, so
+reports (the "Daily sales" admin page) never scan Order/OrderItem.
+
+refresh() is incremental. RollupState keeps a high-water mark on
+Order.updated_at (set by every Order.save(), including admin status changes);
+each run finds the orders changed since the mark, and rebuilds the calendar
+days those orders were placed on: the day's hourly rows from one grouped
+query over its order items, and its daily rows by summing those hours. A
+rebuilt day replaces its rows in one transaction, so readers never see it
+half done.
+
+The mark stops SETTLE_SECONDS short of now so orders still being written are
+picked up by the next run. Changes that bypass save() (queryset update() or
+delete()) are not seen; recover them with refresh(since=<date>).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import Category, DailySales, HourlySales, Order, OrderItem, Product, RollupState
+
+STATE_NAME = 'sales'
+SETTLE_SECONDS = 60
+
+LINE_REVENUE = ExpressionWrapper(
+    F('price') * F('quantity'),
+    output_field=DecimalField(max_digits=16, decimal_places=2),
+)
+
+
+def _day_range(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def rebuild_day(day):
+    """Recomputes the hourly and daily rows of one calendar day (settings.TIME_ZONE)."""
+    start, end = _day_range(day)
+    rows = (
+        OrderItem.objects.filter(order__created_at__gte=start, order__created_at__lt=end)
+        .annotate(hour=TruncHour('order__created_at'))
+        .values('hour', 'product_id', 'product__category_id', 'order__status')
+        .annotate(order_lines=Count('pk'), units=Sum('quantity'), revenue=Sum(LINE_REVENUE))
+        .order_by()
+    )
+    hourly = []
+    daily = {}
+    for row in rows:
+        key = (row['product_id'], row['product__category_id'], row['order__status'])
+        hourly.append(HourlySales(
+            hour=row['hour'], product_id=key[0], category_id=key[1], status=key[2],
+            order_lines=row['order_lines'], units=row['units'], revenue=row['revenue'],
+        ))
+        total = daily.get(key)
+        if total is None:
+            daily[key] = DailySales(
+                day=day, product_id=key[0], category_id=key[1], status=key[2],
+                order_lines=row['order_lines'], units=row['units'], revenue=row['revenue'],
+            )
+        else:
+            total.order_lines += row['order_lines']
+            total.units += row['units']
+            total.revenue += row['revenue']
+
+    with transaction.atomic():
+        HourlySales.objects.filter(hour__gte=start, hour__lt=end).delete()
+        DailySales.objects.filter(day=day).delete()
+        HourlySales.objects.bulk_create(hourly, batch_size=1000)
+        DailySales.objects.bulk_create(daily.values(), batch_size=1000)
+    return len(hourly)
+
+
+def changed_days(after=None, upto=None):
+    """Calendar days of the orders whose updated_at is in (after, upto], one DISTINCT query."""
+    orders = Order.objects.all()
+    if after is not None:
+        orders = orders.filter(updated_at__gt=after)
+    if upto is not None:
+        orders = orders.filter(updated_at__lte=upto)
+    return sorted(
+        orders.annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+        .values_list('day', flat=True)
+        .distinct()
+        .order_by()
+    )
+
+
+def refresh(now=None, since=None):
+    """
+    Brings the rollups up to date with the orders changed since the stored
+    high-water mark (or every order on the first run). `since` (a date) also
+    rebuilds every day from then on. Returns the number of days rebuilt.
+    """
+    now = now or timezone.now()
+    upto = now - timedelta(seconds=SETTLE_SECONDS)
+    state, _ = RollupState.objects.get_or_create(name=STATE_NAME)
+
+    days = set(changed_days(state.high_water, upto))
+    if since is not None:
+        days.update(since + timedelta(days=n) for n in range((timezone.localdate(now) - since).days + 1))
+    for day in sorted(days):
+        rebuild_day(day)
+
+    state.high_water = upto
+    state.refreshed_at = now
+    state.save(update_fields=['high_water', 'refreshed_at'])
+    return len(days)
+
+
+# --- REPORTING (reads only the rollup tables) ---
+DIMENSIONS = {'product': 'product_id', 'category': 'category_id', 'status': 'status'}
+
+
+def report(start, end, granularity='day', by='product', status=None, limit=20):
+    """
+    Returns {'series': [...], 'breakdown': [...], 'totals': {...}} for the
+    days start..end inclusive: per-bucket totals and the top `limit` values of
+    the `by` dimension by revenue. Three queries at most, whatever the order volume.
+    """
+    if granularity == 'hour':
+        first, _ = _day_range(start)
+        _, last = _day_range(end)
+        rows, bucket = HourlySales.objects.filter(hour__gte=first, hour__lt=last), 'hour'
+    else:
+        rows, bucket = DailySales.objects.filter(day__gte=start, day__lte=end), 'day'
+    if status:
+        rows = rows.filter(status=status)
+    measures = {'order_lines': Sum('order_lines'), 'units': Sum('units'), 'revenue': Sum('revenue')}
+
+    series = list(rows.values(bucket).annotate(**measures).order_by(bucket))
+    for row in series:
+        row['bucket'] = row.pop(bucket)
+    totals = {
+        name: sum(row[name] for row in series) if series else 0
+        for name in measures
+    }
+
+    column = DIMENSIONS[by]
+    breakdown = list(rows.values(column).annotate(**measures).order_by('-revenue')[:limit])
+    names = {}
+    if by != 'status':
+        model = Product if by == 'product' else Category
+        names = dict(model.objects.filter(pk__in=[row[column] for row in breakdown]).values_list('pk', 'name'))
+    for row in breakdown:
+        key = row.pop(column)
+        # Deleted products/categories keep their rows under their old id
+        row['label'] = '(none)' if key is None else names.get(key, key if by == 'status' else f'#{key}')
+    return {'series': series, 'breakdown': breakdown, 'totals': totals}
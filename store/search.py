@@ -0,0 +1,293 @@
+# store/search.py
+"""
+In-process full-text search over Product.name and Product.description.
+
+The index is built once per process into impact-ordered postings: for every
+term, the product ids are stored in an array sorted by their precomputed
+BM25 contribution, so a query only walks the head of each postings list
+(at most POSTINGS_BUDGET entries per term) no matter how large the catalog.
+
+Changes are applied incrementally: an edited or new product is moved into a
+small overlay that is scored directly, and its old postings are masked by a
+tombstone set. Once the overlay grows past REBUILD_THRESHOLD the index is
+rebuilt. Autocomplete uses the sorted vocabulary as a flattened prefix trie:
+all terms sharing a prefix form one contiguous range found by bisection.
+
+Other processes learn about a change through a search version kept in the
+cache (shared between workers when CACHES is). It only moves when a
+product's name or description changes, or a product is added or removed, so
+price and stock changes (and every order) leave the indexes alone.
+"""
+import heapq
+import math
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Product
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset({
+    'a', 'an', 'and', 'are', 'as', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'the', 'to', 'with', 'your',
+})
+
+# BM25 parameters; name matches count NAME_WEIGHT times as much as description matches
+K1 = 1.2
+B = 0.75
+NAME_WEIGHT = 3
+
+POSTINGS_BUDGET = 2000
+PREFIX_EXPANSIONS = 5
+REBUILD_THRESHOLD = 1000
+
+VERSION_KEY = 'search:version'
+
+
+def tokenize(text):
+    """Lowercases and splits text into indexable terms, dropping stop words."""
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def _term_frequencies(name, description):
+    """Returns ({term: weighted tf}, weighted document length)."""
+    tfs = {}
+    name_tokens = tokenize(name)
+    desc_tokens = tokenize(description)
+    for term in name_tokens:
+        tfs[term] = tfs.get(term, 0) + NAME_WEIGHT
+    for term in desc_tokens:
+        tfs[term] = tfs.get(term, 0) + 1
+    return tfs, NAME_WEIGHT * len(name_tokens) + len(desc_tokens)
+
+
+class SearchIndex:
+    """Inverted index with impact-ordered postings, an update overlay and prefix lookup."""
+
+    def __init__(self, documents=()):
+        self._lock = threading.Lock()
+        self._build(documents)
+
+    # --- BUILDING ---
+    def _build(self, documents):
+        # Postings are collected as parallel arrays of doc ordinals and term frequencies,
+        # keeping the transient build memory close to the size of the final index
+        postings = {}
+        pks = array('q')
+        lengths = array('l')
+        for pk, name, description in documents:
+            tfs, length = _term_frequencies(name, description)
+            ordinal = len(pks)
+            pks.append(pk)
+            lengths.append(length)
+            for term, tf in tfs.items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array('l'), array('l'))
+                entry[0].append(ordinal)
+                entry[1].append(tf)
+
+        doc_count = len(pks)
+        avg_length = (sum(lengths) / doc_count) if doc_count else 1.0
+        index = {}
+        while postings:
+            term, (ordinals, tfs) = postings.popitem()
+            idf = self._idf(doc_count, len(ordinals))
+            impacts = [self._impact(idf, tf, lengths[o], avg_length) for o, tf in zip(ordinals, tfs)]
+            order = sorted(range(len(impacts)), key=impacts.__getitem__, reverse=True)
+            index[term] = (array('q', [pks[ordinals[i]] for i in order]), array('f', [impacts[i] for i in order]))
+
+        self.doc_count = doc_count
+        self.avg_length = avg_length or 1.0
+        self._postings = index
+        self._terms = sorted(index)
+        # (overlay, deleted): replaced as a whole under the lock, never mutated, so readers need no lock
+        self._changes = ({}, frozenset())
+
+    @staticmethod
+    def _idf(doc_count, doc_freq):
+        return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    @staticmethod
+    def _impact(idf, tf, length, avg_length):
+        return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+    # --- INCREMENTAL UPDATES ---
+    def update(self, pk, name, description):
+        """Re-indexes one product (new or edited)."""
+        with self._lock:
+            overlay, deleted = self._changes
+            overlay = {**overlay, pk: _term_frequencies(name, description)}
+            self._changes = (overlay, deleted | {pk})
+        return len(overlay) + len(deleted) > REBUILD_THRESHOLD
+
+    def remove(self, pk):
+        """Removes one product from the results."""
+        with self._lock:
+            overlay, deleted = self._changes
+            overlay = {key: value for key, value in overlay.items() if key != pk}
+            self._changes = (overlay, deleted | {pk})
+        return len(overlay) + len(deleted) > REBUILD_THRESHOLD
+
+    def __len__(self):
+        return self.doc_count
+
+    # --- QUERYING ---
+    def complete(self, prefix, limit=PREFIX_EXPANSIONS):
+        """Returns up to `limit` indexed terms starting with `prefix`, most frequent first."""
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        overlay, _ = self._changes
+        start = bisect_left(self._terms, prefix)
+        end = bisect_left(self._terms, prefix + '\uffff', start)
+        matches = self._terms[start:end]
+        overlay_terms = {t for tfs, _ in overlay.values() for t in tfs if t.startswith(prefix)}
+        matches.extend(overlay_terms.difference(matches))
+        return heapq.nlargest(limit, matches, key=lambda t: (len(self._postings[t][0]) if t in self._postings else 1, -len(t)))
+
+    def search(self, query, limit=20, prefix=False):
+        """
+        Returns [(pk, score)] for the best matches of `query`, best first.
+        Documents matching more query terms always rank above those matching fewer.
+        With prefix=True the last query term also matches indexed terms it is a prefix of.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        groups = [[term] for term in terms]
+        if prefix:
+            expansions = self.complete(terms[-1])
+            if terms[-1] not in expansions:
+                expansions.append(terms[-1])
+            groups[-1] = expansions
+
+        overlay, deleted = self._changes
+        scores = {}
+        matched = {}
+        for group in groups:
+            group_scores = {}
+            # Prefix expansions share one postings budget so a short prefix costs no more than a term
+            budget = POSTINGS_BUDGET // len(group)
+            for term in group:
+                entry = self._postings.get(term)
+                if entry is None:
+                    continue
+                ids, impacts = entry
+                for i in range(min(len(ids), budget)):
+                    pk = ids[i]
+                    if pk in deleted:
+                        continue
+                    if impacts[i] > group_scores.get(pk, 0.0):
+                        group_scores[pk] = impacts[i]
+            self._score_overlay(overlay, group, group_scores)
+            for pk, score in group_scores.items():
+                scores[pk] = scores.get(pk, 0.0) + score
+                matched[pk] = matched.get(pk, 0) + 1
+
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (matched[item[0]], item[1]))
+
+    def _score_overlay(self, overlay, group, group_scores):
+        for pk, (tfs, length) in overlay.items():
+            for term in group:
+                tf = tfs.get(term)
+                if tf:
+                    doc_freq = len(self._postings[term][0]) if term in self._postings else 1
+                    impact = self._impact(self._idf(max(self.doc_count, 1), doc_freq), tf, length, self.avg_length)
+                    if impact > group_scores.get(pk, 0.0):
+                        group_scores[pk] = impact
+
+
+# --- PROCESS-WIDE INDEX ---
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+
+def get_version():
+    """Returns the current search version, seeding it if the key was evicted."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_version():
+    """Tells every process that product names or descriptions changed."""
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        return get_version()
+
+
+def _load_documents():
+    return Product.objects.values_list('pk', 'name', 'description').order_by('pk').iterator(chunk_size=5000)
+
+
+def _rebuild():
+    global _index, _index_version
+    version = get_version()
+    index = SearchIndex(_load_documents())
+    _index, _index_version = index, version
+    return index
+
+
+def _refresh_in_background():
+    # At most one rebuild per process at a time
+    if not _refresh_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            _rebuild()
+        finally:
+            connections.close_all()
+            _refresh_lock.release()
+
+    threading.Thread(target=run, name='search-index-rebuild', daemon=True).start()
+
+
+def get_index():
+    """
+    Returns the process-wide index, building it on first use. When another
+    process has changed product text (the search version moved), the current
+    index keeps serving while a fresh one is built in the background.
+    """
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                return _rebuild()
+    elif _index_version != get_version():
+        _refresh_in_background()
+    return _index
+
+
+def _changed(needs_rebuild):
+    global _index_version
+    version = bump_version()
+    if needs_rebuild:
+        _refresh_in_background()
+    elif _index_version is not None and version == _index_version + 1:
+        # Nobody else changed anything since this index was built or last caught up
+        _index_version = version
+
+
+def product_changed(pk, name, description):
+    """Applies a committed change to a product's text made in this process, and tells the others."""
+    _changed(_index is not None and _index.update(pk, name, description))
+
+
+def product_deleted(pk):
+    """Applies a committed product delete made in this process, and tells the others."""
+    _changed(_index is not None and _index.remove(pk))
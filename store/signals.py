@@ -0,0 +1,88 @@
+# store/signals.py
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cart as cart_service
+from . import catalog_cache, categories, db_routing, metrics, profiling, search
+from .models import Category, FlashSale, Product
+
+# Product fields whose previous values the post_save handlers compare against
+TRACKED_FIELDS = frozenset({'category', 'name', 'description'})
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=FlashSale)
+@receiver(post_delete, sender=FlashSale)
+def invalidate_catalog_cache(sender, **kwargs):
+    """Any product or category change (e.g. admin price/stock edits) invalidates the catalog cache."""
+    catalog_cache.bump_version()
+    # Bump again once the write is visible, in case a concurrent request re-cached the old rows,
+    # and once more when the replicas have caught up, in case one served them
+    transaction.on_commit(catalog_cache.bump_version)
+    transaction.on_commit(partial(db_routing.after_replication, catalog_cache.bump_version))
+
+
+@receiver(pre_save, sender=Product)
+def remember_stored(sender, instance, update_fields=None, **kwargs):
+    """Notes the stored category and text of a product being saved, for the category counts and search."""
+    instance._stored_category_id = None
+    instance._stored_text = None
+    if not instance._state.adding and (update_fields is None or TRACKED_FIELDS.intersection(update_fields)):
+        stored = Product.objects.filter(pk=instance.pk).values_list('category_id', 'name', 'description').first()
+        if stored is not None:
+            instance._stored_category_id = stored[0]
+            instance._stored_text = stored[1:]
+
+
+@receiver(post_save, sender=Product)
+def count_product(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        categories.product_moved(None, instance.category_id)
+    elif update_fields is None or 'category' in update_fields:
+        categories.product_moved(instance._stored_category_id, instance.category_id)
+
+
+@receiver(post_delete, sender=Product)
+def uncount_product(sender, instance, **kwargs):
+    categories.product_moved(instance.category_id, None)
+
+
+@receiver(pre_delete, sender=Category)
+def uncount_category(sender, instance, **kwargs):
+    categories.category_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+def reindex_product(sender, instance, created, **kwargs):
+    """Re-indexes a product whose name or description changed, once committed; price and stock edits are skipped."""
+    if created or (instance._stored_text is not None and instance._stored_text != (instance.name, instance.description)):
+        transaction.on_commit(partial(search.product_changed, instance.pk, instance.name, instance.description))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    transaction.on_commit(partial(search.product_deleted, instance.pk))
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Carries the anonymous cart over to the user's cart when they log in."""
+    if request is not None and hasattr(request, 'session'):
+        cart_service.merge_anonymous_cart(request, user)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """Counts and times every query for the metrics middleware, and logs those of profiled requests (once per connection object)."""
+    if metrics.count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, metrics.count_query)
+    if profiling.log_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(1, profiling.log_query)
@@ -0,0 +1,96 @@
+# store/templatetags/catalog_tags.py
+"""
+{% catalog_fragment name [vary_on ...] %} ... {% endcatalog_fragment %}
+
+Caches the rendered HTML of a catalog fragment (product grid, card, detail,
+category nav) under a key that embeds the catalog version, so any product,
+price or category change retires every cached fragment at once. Orders only
+drop the card and detail fragments of the products whose stock moved
+(catalog_cache.stock_changed()).
+
+Fragments must not contain per-user output. The one exception is
+{% csrf_token %}: it renders a placeholder when the fragment is cached and
+the placeholder is swapped for the current request's token on every use.
+Set CATALOG_FRAGMENT_CACHE = False to render fragments uncached. Async views
+pass `catalog_version` in the context so rendering needs no version lookup,
+and `catalog_fragments` (catalog_cache.Fragments), looked up beforehand with
+the async cache API, so rendering makes no cache calls at all.
+
+{% product_picture product sizes %} renders a product's responsive, lazily
+loaded thumbnails (store/thumbnails.py).
+"""
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from store import catalog_cache, thumbnails
+
+register = template.Library()
+
+CSRF_PLACEHOLDER = '__catalog_fragment_csrf__'
+
+
+class CatalogFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        if not getattr(settings, 'CATALOG_FRAGMENT_CACHE', True):
+            return self.nodelist.render(context)
+
+        key = catalog_cache.fragment_key(
+            self.name.resolve(context), [var.resolve(context) for var in self.vary_on],
+            version=context.get('catalog_version'),
+        )
+        fragments = context.get('catalog_fragments')
+        content = cache.get(key) if fragments is None else fragments.found.get(key)
+        if content is None:
+            catalog_cache.stats.record(misses=1)
+            with context.push(csrf_token=CSRF_PLACEHOLDER):
+                content = self.nodelist.render(context)
+            if fragments is None:
+                cache.set(key, content, catalog_cache.CACHE_TIMEOUT)
+            else:
+                fragments.missed[key] = content
+        else:
+            catalog_cache.stats.record(hits=1)
+
+        if CSRF_PLACEHOLDER in content:
+            csrf_token = context.get('csrf_token')
+            content = content.replace(CSRF_PLACEHOLDER, '' if csrf_token is None else str(csrf_token))
+        return mark_safe(content)
+
+
+@register.tag
+def catalog_fragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    nodelist = parser.parse(('endcatalog_fragment',))
+    parser.delete_first_token()
+    return CatalogFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
+
+
+@register.inclusion_tag('store/product_picture.html')
+def product_picture(product, sizes, css_class='img-fluid', style='', loading='lazy'):
+    width = thumbnails.WIDTHS[-1]
+    height = round(width * product.image_height / product.image_width) if product.image_width else None
+    return {
+        'product': product,
+        'sizes': sizes,
+        'css_class': css_class,
+        'style': style,
+        'loading': loading,
+        'webp_srcset': thumbnails.srcset(product, 'webp'),
+        'jpeg_srcset': thumbnails.srcset(product, 'jpg'),
+        'src': thumbnails.url(product, thumbnails.WIDTHS[1], 'jpg'),
+        'width': width,
+        'height': height,
+    }
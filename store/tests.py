@@ -1,10 +1,1171 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 # Create your tests here.
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from . import cart_store, catalog_cache, categories, db_routing, inventory, metrics, pagination, profiling, rollups, search, thumbnails
+from .checkout import OutOfStockError, place_order
+from .management.commands import import_catalog
+from .models import Cart, CartItem, Category, DailySales, HourlySales, InventoryShard, Order, OrderItem, Product, RequestProfile, StockReservation
+from .money import Money
+from .warmup import warm_up
 
 # Create your tests here.
 class StoreViewTests(TestCase):
     def test_product_list_page_status_code(self):
         response = self.client.get(reverse('product_list'))
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.stats.reset()
+
+    def test_page_and_product_are_cached(self):
+        footwear = catalog_cache.get_category('footwear')
+        catalog_cache.stats.reset()
+        with self.assertNumQueries(1):
+            page, _ = catalog_cache.get_page(footwear)
+        self.assertEqual([p.name for p in page], ["Business Loafers", "Running Shoes"])
+        with self.assertNumQueries(0):
+            catalog_cache.get_page(footwear)
+        catalog_cache.get_product(2)
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog_cache.get_product(2).name, "Leather Wallet")
+        self.assertEqual(catalog_cache.stats.as_dict(), {'hits': 3, 'misses': 2, 'hit_ratio': 0.6})
+
+    def test_save_invalidates_cached_entries(self):
+        self.assertEqual(catalog_cache.get_product(1).inventory_stock, 10)
+        product = Product.objects.get(pk=1)
+        product.price = Decimal('9.99')
+        product.inventory_stock = 3
+        product.save()
+        record = catalog_cache.get_product(1)
+        self.assertEqual((record.price, record.inventory_stock), (Decimal('9.99'), 3))
+
+    def test_product_detail_and_cart_use_cache(self):
+        response = self.client.get(reverse('product_detail', args=[3]))
+        self.assertContains(response, "Running Shoes")
+        self.client.post(reverse('add_to_cart', args=[3]), {'quantity': 2})
+        response = self.client.get(reverse('cart'))
+        self.assertContains(response, "Running Shoes")
+        self.assertEqual(response.context['cart_total'], Decimal('159.98'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_follow_sort_order_without_overlap(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = catalog_cache.get_page(None, 'price', cursor, per_page=3)
+            seen.extend(p.pk for p in page)
+            if cursor is None:
+                break
+        expected = list(Product.objects.order_by('price', 'pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_category_page_descending_price(self):
+        category = catalog_cache.get_category('clothing')
+        page, cursor = catalog_cache.get_page(category, '-price', per_page=2)
+        self.assertEqual([p.name for p in page], ["Premium Denim Jeans", "Slim Fit Hoodie"])
+        page, cursor = catalog_cache.get_page(category, '-price', cursor, per_page=2)
+        self.assertEqual([p.name for p in page], ["Classic T-Shirt"])
+        self.assertIsNone(cursor)
+
+    def test_view_ignores_malformed_cursor(self):
+        response = self.client.get(reverse('product_list_by_category', args=['footwear']), {'sort': 'price', 'after': '!!'})
+        self.assertEqual([p.name for p in response.context['products']], ["Running Shoes", "Business Loafers"])
+        self.assertTrue(response.context['is_first_page'])
+
+    def test_pages_are_cached_by_decoded_position(self):
+        def pks(cursor):
+            return [p.pk for p in catalog_cache.get_page(None, 'price', cursor, per_page=3)[0]]
+
+        first = pks(None)
+        cursor = catalog_cache.get_page(None, 'price', per_page=3)[1]
+        second = pks(cursor)
+        value, pk = pagination.read_cursor(cursor, 'price')
+        # Same positions, different tokens
+        with self.assertNumQueries(0):
+            self.assertEqual(pks(pagination.encode_cursor(f'{value}000', pk)), second)
+            for junk in ('!!', pagination.encode_cursor('NaN', pk), 'W10'):
+                self.assertEqual(pks(junk), first)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        search._index = None
+
+    def test_ranking_prefers_name_matches(self):
+        index = search.SearchIndex([
+            (1, "Leather Wallet", "A slim wallet."),
+            (2, "Belt", "Made of leather."),
+            (3, "Shoes", "Canvas shoes."),
+        ])
+        self.assertEqual([pk for pk, _ in index.search("leather")], [1, 2])
+        self.assertEqual([pk for pk, _ in index.search("leather wallet")], [1, 2])
+        self.assertEqual(index.complete("le"), ["leather"])
+        self.assertEqual([pk for pk, _ in index.search("sho", prefix=True)], [3])
+
+    def test_incremental_update_and_remove(self):
+        index = search.SearchIndex([(1, "Leather Wallet", ""), (2, "Running Shoes", "")])
+        index.update(1, "Canvas Tote", "")
+        self.assertEqual(index.search("wallet"), [])
+        self.assertEqual([pk for pk, _ in index.search("tote")], [1])
+        index.remove(2)
+        self.assertEqual(index.search("shoes"), [])
+
+    def test_product_save_reindexes(self):
+        search.get_index()
+        product = Product.objects.get(name="Leather Wallet")
+        product.name = "Travel Wallet"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(search.get_index().search("travel")[0][0], product.pk)
+
+    def test_only_text_changes_rebuild_other_processes_indexes(self):
+        search.get_index()
+        version = search.get_version()
+        product = Product.objects.get(pk=1)
+        product.price = Decimal('1.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        catalog_cache.bump_version()
+        with mock.patch.object(search, '_refresh_in_background') as refresh:
+            search.get_index()
+        refresh.assert_not_called()
+        self.assertEqual(search.get_version(), version)
+
+        # Another process renamed a product
+        search.bump_version()
+        with mock.patch.object(search, '_refresh_in_background') as refresh:
+            search.get_index()
+        refresh.assert_called_once()
+
+    def test_search_and_suggest_views(self):
+        response = self.client.get(reverse('search'), {'q': 'denim'})
+        self.assertEqual([p.name for p in response.context['products']], ["Premium Denim Jeans"])
+        response = self.client.get(reverse('search_suggest'), {'q': 'runn'})
+        self.assertEqual(response.json()['products'][0]['name'], "Running Shoes")
+        self.assertEqual(response.json()['terms'], ["running"])
+
+
+class PersistentCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cart_store.get_store().clear()
+
+    def add(self, pk, quantity):
+        self.client.post(reverse('add_to_cart', args=[pk]), {'quantity': quantity})
+
+    def test_cart_page_query_count_is_constant(self):
+        self.add(1, 1)
+        catalog_cache.get_categories()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['cart_total'], Decimal('15.99'))
+
+        for pk in range(2, 8):
+            self.add(pk, 2)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('cart'))
+        self.assertEqual(len(response.context['cart_items']), 7)
+        expected = sum(p.price * (1 if p.pk == 1 else 2) for p in Product.objects.all())
+        self.assertEqual(response.context['cart_total'], expected)
+
+    def test_add_to_cart_adds_to_the_stored_quantity(self):
+        self.add(1, 1)
+        key = f"s:{self.client.session['cart_key']}"
+        for _ in range(2):
+            # A stale copy of the lines, as another worker may hold
+            cart_store.get_store().set(key, {1: 1})
+            self.add(1, 1)
+        self.assertEqual(CartItem.objects.get(product_id=1).quantity, 3)
+
+        self.add(1, 8)
+        self.assertEqual(CartItem.objects.get(product_id=1).quantity, 3)
+        self.add(1, 7)
+        self.assertEqual(CartItem.objects.get(product_id=1).quantity, 10)
+
+    def test_update_cart_persists(self):
+        self.add(3, 1)
+        response = self.client.post(reverse('update_cart'), {'product_id': 3, 'quantity': 4}, content_type='application/json')
+        self.assertEqual(response.json()['cart_total'], '319.96')
+        self.assertEqual(CartItem.objects.get(product_id=3).quantity, 4)
+        response = self.client.post(reverse('update_cart'), {'product_id': 3, 'quantity': 0}, content_type='application/json')
+        self.assertTrue(response.json()['item_removed'])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_batched_update_applies_all_lines_and_returns_only_them(self):
+        for pk in (1, 2, 3):
+            self.add(pk, 1)
+        lines = [
+            {'product_id': 1, 'quantity': 3},
+            {'product_id': 2, 'quantity': 0},
+            {'product_id': 4, 'quantity': 50},
+            {'product_id': 1, 'quantity': 2},
+        ]
+        response = self.client.post(reverse('update_cart_lines'), {'lines': lines}, content_type='application/json')
+        data = response.json()
+
+        self.assertEqual({line['product_id']: line['quantity'] for line in data['lines']}, {1: 2, 2: 0, 4: 10})
+        self.assertTrue(data['lines'][1]['removed'])
+        self.assertIn('limited', data['lines'][2]['warning'])
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')), {1: 2, 3: 1, 4: 10})
+        expected = sum(p.price * q for p, q in ((Product.objects.get(pk=pk), q) for pk, q in ((1, 2), (3, 1), (4, 10))))
+        self.assertEqual(data['cart_total'], str(expected))
+
+    def test_batched_update_rejects_unknown_products_without_changes(self):
+        self.add(1, 1)
+        lines = [{'product_id': 1, 'quantity': 5}, {'product_id': 999999, 'quantity': 1}]
+        response = self.client.post(reverse('update_cart_lines'), {'lines': lines}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(CartItem.objects.get(product_id=1).quantity, 1)
+
+    def test_anonymous_cart_merges_into_user_cart_on_login(self):
+        user = User.objects.create_user('shopper', password='pw')
+        user_cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=user_cart, product_id=1, quantity=2)
+
+        self.add(1, 1)
+        self.add(2, 3)
+        self.client.login(username='shopper', password='pw')
+
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(
+            dict(user_cart.items.values_list('product_id', 'quantity')),
+            {1: 3, 2: 3},
+        )
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_checkout_creates_order_and_decrements_stock(self):
+        self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 2})
+        self.client.post(reverse('add_to_cart', args=[2]), {'quantity': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('process_order'))
+
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_success', args=[order.pk]))
+        self.assertEqual(order.total_paid, Decimal('61.97'))
+        self.assertEqual(sorted(order.items.values_list('product_id', 'quantity')), [(1, 2), (2, 1)])
+        self.assertEqual(Product.objects.get(pk=1).inventory_stock, 8)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(catalog_cache.get_product(1).inventory_stock, 8)
+
+        response = self.client.get(reverse('order_success', args=[order.pk]))
+        self.assertContains(response, f"Order #{order.pk} Summary")
+
+    def test_order_refreshes_only_the_ordered_products(self):
+        catalog_cache.get_products([1, 2, 3])
+        version = catalog_cache.get_version()
+        self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('process_order'))
+        self.assertEqual(catalog_cache.get_version(), version)
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog_cache.get_product(1).inventory_stock, 8)
+            catalog_cache.get_product(3)
+
+        # Selling out changes the listings too
+        self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 8})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('process_order'))
+        self.assertNotEqual(catalog_cache.get_version(), version)
+
+    def test_oversell_rolls_back_whole_order(self):
+        self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 2})
+        self.client.post(reverse('add_to_cart', args=[2]), {'quantity': 5})
+        Product.objects.filter(pk=2).update(inventory_stock=4)
+
+        response = self.client.post(reverse('process_order'))
+        self.assertRedirects(response, reverse('cart'))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=1).inventory_stock, 10)
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    def test_order_success_hidden_from_other_visitors(self):
+        order = Order.objects.create(total_paid=Decimal('1.00'))
+        response = self.client.get(reverse('order_success', args=[order.pk]))
+        self.assertRedirects(response, reverse('product_list'))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Many buyers racing for one SKU must never drive its stock below zero."""
+
+    def test_concurrent_checkouts_never_oversell(self):
+        stock, buyers = 20, 40
+        product = Product.objects.create(name="Hot Item", price=Decimal('5.00'), inventory_stock=stock)
+        carts = [Cart.objects.create(session_key=f"buyer-{i}") for i in range(buyers)]
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=1) for cart in carts])
+
+        results = []
+
+        def buy(cart):
+            try:
+                place_order(cart)
+                results.append('ok')
+            except OutOfStockError:
+                results.append('sold out')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(results.count('ok'), stock)
+        self.assertEqual(results.count('sold out'), buyers - stock)
+        self.assertEqual(product.inventory_stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), stock)
+
+
+class FlashSaleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.get(pk=3)
+        self.sale = inventory.start_flash_sale(self.product, shards=4, reservation_ttl=60)
+
+    def test_stock_is_split_across_shards(self):
+        self.assertEqual(sorted(self.product.inventory_shards.values_list('stock', flat=True)), [2, 2, 3, 3])
+        self.assertTrue(catalog_cache.get_product(3).flash_sale)
+
+    def test_add_to_cart_reserves_and_checkout_consumes(self):
+        self.client.post(reverse('add_to_cart', args=[3]), {'quantity': 4})
+        self.assertEqual(sum(StockReservation.objects.values_list('quantity', flat=True)), 4)
+        self.assertEqual(inventory.available_stock(3), 6)
+
+        self.client.post(reverse('process_order'))
+        self.assertEqual(Order.objects.get().items.get().quantity, 4)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(inventory.available_stock(3), 6)
+
+    def test_cannot_reserve_more_than_shards_hold(self):
+        self.client.post(reverse('add_to_cart', args=[3]), {'quantity': 11})
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(inventory.available_stock(3), 10)
+
+    def test_failed_cart_write_gives_the_hold_back(self):
+        with mock.patch('store.cart.add_quantity', side_effect=RuntimeError("database is locked")):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('add_to_cart', args=[3]), {'quantity': 4})
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(inventory.available_stock(3), 10)
+
+    def test_sweeper_returns_expired_holds(self):
+        self.client.post(reverse('add_to_cart', args=[3]), {'quantity': 5})
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(inventory.available_stock(3), 5)
+        inventory.release_expired()
+        self.assertEqual(inventory.available_stock(3), 10)
+
+    def test_login_merge_keeps_held_stock(self):
+        user = User.objects.create_user('shopper', password='pw')
+        user_cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=user_cart, product=self.product, quantity=1)
+        inventory.reserve(self.sale, user_cart, 1)
+        self.client.post(reverse('add_to_cart', args=[3]), {'quantity': 4})
+        self.client.login(username='shopper', password='pw')
+
+        self.assertEqual(Cart.objects.get().pk, user_cart.pk)
+        self.assertEqual(sum(user_cart.reservations.values_list('quantity', flat=True)), 5)
+        self.assertEqual(inventory.available_stock(3), 5)
+        inventory.end_flash_sale(self.product)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory_stock, 10)
+
+    def test_end_flash_sale_folds_stock_back(self):
+        self.client.post(reverse('add_to_cart', args=[3]), {'quantity': 2})
+        inventory.end_flash_sale(self.product)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory_stock, 10)
+        self.assertFalse(self.product.inventory_shards.exists())
+
+
+class CartStoreTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cart_store.get_store().clear()
+
+    def test_varint_encoding_round_trip(self):
+        lines = {1: 2, 7: 1, 300: 45, 2**40: 3}
+        encoded = cart_store.encode_lines(lines)
+        self.assertEqual(cart_store.decode_lines(encoded), lines)
+        self.assertEqual(len(cart_store.encode_lines({1: 1, 2: 1, 3: 1})), 7)
+        self.assertEqual(cart_store.decode_lines(cart_store.encode_lines({})), {})
+
+    def test_sqlite_backend_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'carts.sqlite3')
+            cart_store.SQLiteCartStore(path).set('s:abc', {5: 2})
+            other = cart_store.SQLiteCartStore(path)
+            self.assertEqual(other.get('s:abc'), {5: 2})
+            other.delete('s:abc')
+            self.assertIsNone(other.get('s:abc'))
+
+    def test_incomplete_backend_fails_when_created(self):
+        class NoDelete(cart_store.BaseCartStore):
+            def _get(self, key):
+                return None
+
+            def _set(self, key, data):
+                pass
+
+            def clear(self):
+                pass
+
+        with self.assertRaises(TypeError):
+            NoDelete()
+
+    def test_lru_backend_evicts_oldest(self):
+        store = cart_store.LRUCartStore(max_entries=2)
+        store.set('a', {1: 1})
+        store.set('b', {2: 1})
+        store.get('a')
+        store.set('c', {3: 1})
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('a'), {1: 1})
+
+    def test_repeat_cart_render_skips_database_and_session_cookie(self):
+        self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 2})
+        catalog_cache.get_categories()
+        self.client.get(reverse('cart'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['cart_total'], Decimal('31.98'))
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+        self.client.post(reverse('update_cart'), {'product_id': 1, 'quantity': 3}, content_type='application/json')
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(response.context['cart_total'], Decimal('47.97'))
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_grid_follows_price_changes(self):
+        self.client.get(reverse('product_list'))
+        product = Product.objects.get(pk=1)
+        product.price = Decimal('12.34')
+        product.save()
+
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, '£12.34')
+
+    def test_cached_cards_carry_each_clients_csrf_token(self):
+        self.client.get(reverse('product_list'))
+        client = Client(enforce_csrf_checks=True)
+        html = client.get(reverse('product_list')).content.decode()
+        self.assertNotIn('__catalog_fragment_csrf__', html)
+
+        token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', html).group(1)
+        response = client.post(reverse('add_to_cart', args=[1]), {'quantity': 1, 'csrfmiddlewaretoken': token})
+        self.assertEqual(response.status_code, 302)
+
+    def test_messages_stay_dynamic_on_cached_detail_page(self):
+        self.client.get(reverse('product_detail', args=[1]))
+        response = self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 1, 'next': reverse('product_detail', args=[1])}, follow=True)
+        self.assertContains(response, 'added to cart!')
+        response = self.client.get(reverse('product_detail', args=[1]))
+        self.assertNotContains(response, 'added to cart!')
+
+
+class ImportCatalogTests(TestCase):
+    def write(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False)
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def test_csv_import_upserts_by_sku_and_creates_categories(self):
+        path = self.write('.csv', (
+            'sku,name,description,price,stock,category\n'
+            'IMP-1,Canvas Tote,Sturdy,12.5,4,totes\n'
+            'IMP-2,Linen Shirt,,30,2,\n'
+            'IMP-3,,No name,1,1,totes\n'
+            'IMP-1,Canvas Tote XL,Sturdier,14.00,6,totes\n'
+        ))
+        version = catalog_cache.get_version()
+        call_command('import_catalog', path, batch_size=2, stdout=StringIO(), stderr=StringIO())
+
+        tote = Product.objects.get(sku='IMP-1')
+        self.assertEqual((tote.name, tote.price, tote.inventory_stock), ('Canvas Tote XL', Decimal('14.00'), 6))
+        self.assertEqual(tote.category.slug, 'totes')
+        self.assertIsNone(Product.objects.get(sku='IMP-2').category)
+        self.assertFalse(Product.objects.filter(sku='IMP-3').exists())
+        self.assertNotEqual(catalog_cache.get_version(), version)
+
+    def test_jsonl_import_updates_existing_rows(self):
+        Product.objects.filter(pk=1).update(sku='EXISTING')
+        path = self.write('.jsonl', '{"sku": "EXISTING", "name": "Renamed", "price": "9.99", "stock": 3}\n\n')
+        call_command('import_catalog', path, stdout=StringIO())
+
+        product = Product.objects.get(pk=1)
+        self.assertEqual((product.name, product.price, product.inventory_stock), ('Renamed', Decimal('9.99'), 3))
+
+    def test_malformed_jsonl_lines_are_skipped(self):
+        path = self.write('.jsonl', (
+            '{"sku": "IMP-1", "name": "Canvas Tote", "price": "12.50", "category": "totes"}\n'
+            '{not json\n'
+            '["IMP-2"]\n'
+            '{"sku": "IMP-3", "name": "Linen Shirt", "price": "30"}\n'
+        ))
+        version = catalog_cache.get_version()
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_catalog', path, batch_size=1, stdout=stdout, stderr=stderr)
+
+        self.assertEqual(set(Product.objects.filter(sku__startswith='IMP-').values_list('sku', flat=True)), {'IMP-1', 'IMP-3'})
+        self.assertIn('line 2: skipped', stderr.getvalue())
+        self.assertIn('line 3: skipped (expected an object, got list)', stderr.getvalue())
+        self.assertIn('(2 skipped)', stdout.getvalue())
+        self.assertEqual(Category.objects.get(slug='totes').product_count, 1)
+        self.assertNotEqual(catalog_cache.get_version(), version)
+
+    def test_committed_batches_are_finalised_when_the_import_fails(self):
+        path = self.write('.jsonl', (
+            '{"sku": "IMP-1", "name": "Canvas Tote", "price": "12.50", "category": "totes"}\n'
+            '{"sku": "IMP-2", "name": "Linen Shirt", "price": "30"}\n'
+        ))
+        version = catalog_cache.get_version()
+        write_batch = import_catalog.Command.write_batch
+        calls = []
+
+        def fail_second(command, records, use_copy):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return write_batch(command, records, use_copy)
+
+        with mock.patch.object(import_catalog.Command, 'write_batch', fail_second):
+            with self.assertRaisesMessage(RuntimeError, "connection lost"):
+                call_command('import_catalog', path, batch_size=1, stdout=StringIO())
+        self.assertEqual(Category.objects.get(slug='totes').product_count, 1)
+        self.assertNotEqual(catalog_cache.get_version(), version)
+
+
+@override_settings(ROOT_URLCONF='store.async_urls')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cart_store.get_store().clear()
+
+    async def test_catalog_pages_render(self):
+        response = await self.async_client.get(reverse('product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), await Product.objects.acount())
+        self.assertTrue(response.context['all_categories'])
+
+        response = await self.async_client.get(reverse('product_detail', args=[1]))
+        self.assertContains(response, 'Add to Cart'.upper())
+
+    async def test_cart_and_checkout_flow(self):
+        await self.async_client.post(reverse('add_to_cart', args=[2]), {'quantity': 2})
+        response = await self.async_client.get(reverse('cart'))
+        self.assertEqual(response.context['cart_total'], 2 * (await Product.objects.aget(pk=2)).price)
+
+        response = await self.async_client.post(reverse('process_order'))
+        order = await Order.objects.alatest('pk')
+        self.assertRedirects(response, reverse('order_success', args=[order.pk]), fetch_redirect_response=False)
+        self.assertEqual((await Product.objects.aget(pk=2)).inventory_stock, 8)
+        self.assertFalse(await CartItem.objects.aexists())
+
+
+# Production without REDIS_URL: a cache whose sync API must not be called from the event loop
+@override_settings(
+    ROOT_URLCONF='store.async_urls',
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'test_catalog_cache'},
+        'carts': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'test_carts_cache'},
+    },
+)
+class DatabaseCacheAsyncViewTests(AsyncViewTests):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('createcachetable', verbosity=0)
+
+    async def test_cached_fragments_are_reused(self):
+        await self.async_client.get(reverse('product_detail', args=[1]))
+        catalog_cache.stats.reset()
+        await self.async_client.get(reverse('product_detail', args=[1]))
+        self.assertEqual(catalog_cache.stats.misses, 0)
+
+
+class WarmUpTests(TestCase):
+    def test_warm_up_preloads_catalog_and_search(self):
+        cache.clear()
+        search._index = None
+        timings = warm_up()
+        self.assertEqual(set(timings), {'catalog', 'search index', 'templates', 'url resolver'})
+        with self.assertNumQueries(0):
+            catalog_cache.get_product(1)
+            catalog_cache.get_page(catalog_cache.get_category('footwear'), '-price')
+            search.get_index().search('leather')
+
+
+# Benchmark products have no matching image, and img/default.jpg is not in the static manifest
+@override_settings(STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+class FunnelBenchmarkTests(TransactionTestCase):
+    def test_query_count_regression_fails_the_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, 'baseline.json')
+            options = {'concurrency': 2, 'funnels': 2, 'catalog_size': 5, 'baseline': baseline, 'force': True, 'stdout': StringIO()}
+            call_command('bench_funnel', save_baseline=True, **options)
+            self.assertEqual(Order.objects.count(), 0)
+
+            with open(baseline) as handle:
+                data = json.load(handle)
+            self.assertEqual(set(data['steps']), {'product_list', 'product_detail', 'add_to_cart', 'update_cart', 'checkout', 'process_order', 'order_success'})
+            # Timings only fail the run when asked to
+            for row in data['steps'].values():
+                row['p50_ms'] = row['p95_ms'] = 0.001
+            data['funnels_per_second'] = 10 ** 6
+            with open(baseline, 'w') as handle:
+                json.dump(data, handle)
+            call_command('bench_funnel', **options)
+            with self.assertRaisesMessage(CommandError, 'checkout p95'):
+                call_command('bench_funnel', latency_tolerance=0.5, **options)
+
+            # An artificially slow baseline passes the latency gate
+            for row in data['steps'].values():
+                row['p50_ms'] = row['p95_ms'] = 10 ** 6
+            data['funnels_per_second'] = 0.001
+            with open(baseline, 'w') as handle:
+                json.dump(data, handle)
+            call_command('bench_funnel', latency_tolerance=0.5, **options)
+
+            data['steps']['checkout']['queries'] -= 1
+            with open(baseline, 'w') as handle:
+                json.dump(data, handle)
+            with self.assertRaisesMessage(CommandError, 'checkout queries'):
+                call_command('bench_funnel', **options)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_reports_per_view_series(self):
+        self.client.get(reverse('product_list'))
+        self.client.get(reverse('product_detail', args=[1]))
+        body = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'}).content.decode()
+
+        labels = '{view="product_list",method="GET",status="2xx"}'
+        self.assertIn(f'store_http_request_duration_seconds_count{labels} 1', body)
+        self.assertIn('store_http_request_duration_seconds_bucket{view="product_list",method="GET",status="2xx",le="+Inf"} 1', body)
+        queries = int(re.search(rf'store_db_queries_total{re.escape(labels)} (\d+)', body).group(1))
+        self.assertGreater(queries, 0)
+        self.assertRegex(body, rf'store_template_render_seconds_total{re.escape(labels)} 0\.\d*[1-9]')
+        self.assertIn('store_http_request_duration_seconds_count{view="product_detail",method="GET",status="2xx"} 1', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_checks_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_endpoint_is_closed_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_worker_files_are_merged_and_archived(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            metrics.record('cart', 'GET', 200, 0.02, 3, 0.001, 0.004, 500)
+            metrics.flush()
+            os.rename(os.path.join(directory, f'{os.getpid()}.json'), os.path.join(directory, '1.json'))
+            metrics.mark_process_dead(1)
+            self.assertEqual(sorted(os.listdir(directory)), ['.lock', metrics.ARCHIVE_FILE])
+
+            data = metrics.collect()
+            self.assertEqual(data[('cart', 'GET', '2xx')][metrics.COUNT], 2)
+            self.assertEqual(data[('cart', 'GET', '2xx')][metrics.QUERIES], 6)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user('ops', password='pw', is_staff=True, is_superuser=True)
+
+    def test_staff_request_is_profiled_with_sql_log(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('product_list'), headers={'X-Profile': '1'})
+        profile = RequestProfile.objects.get()
+        self.assertEqual(response['X-Profile-Id'], str(profile.pk))
+        self.assertEqual(profile.view_name, 'product_list')
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(len(json.loads(profile.sql_log)), profile.query_count)
+        self.assertGreater(profiling.load_stats(profile).total_calls, 0)
+
+        download = self.client.get(reverse('admin:store_requestprofile_pstats', args=[profile.pk]))
+        self.assertEqual(download.content, bytes(profile.stats))
+        self.assertIn('attachment', download['Content-Disposition'])
+
+        # Staff without the view permission
+        self.client.force_login(User.objects.create_user('clerk', is_staff=True))
+        for name in ('admin:store_requestprofile_pstats', 'admin:store_requestprofile_sql'):
+            self.assertEqual(self.client.get(reverse(name, args=[profile.pk])).status_code, 403)
+
+    @override_settings(ROOT_URLCONF='store.async_urls')
+    async def test_async_request_is_profiled_with_sql_log(self):
+        await self.async_client.aforce_login(self.staff)
+        await self.async_client.get(reverse('product_list'), headers={'X-Profile': '1'})
+        profile = await RequestProfile.objects.aget()
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(len(json.loads(profile.sql_log)), profile.query_count)
+
+    def test_other_users_cannot_trigger_profiling(self):
+        self.client.get(reverse('product_list') + '?_profile=1')
+        User.objects.create_user('shopper', password='pw')
+        self.client.login(username='shopper', password='pw')
+        response = self.client.get(reverse('product_list'), headers={'X-Profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MAX_PROFILES=2)
+    def test_sampled_profiles_are_capped(self):
+        for _ in range(3):
+            self.client.get(reverse('product_detail', args=[1]))
+        self.assertEqual(RequestProfile.objects.filter(sampled=True).count(), 2)
+
+
+class CheckMigrationsTests(TestCase):
+    def test_reports_an_up_to_date_schema(self):
+        out = StringIO()
+        call_command('check_migrations', stdout=out)
+        self.assertIn('All migrations are applied', out.getvalue())
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = os.path.join(directory.name, 'thumbs')
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name, THUMBNAIL_ROOT=self.root))
+
+        buffer = BytesIO()
+        Image.new('RGBA', (1200, 900), (200, 30, 30, 255)).save(buffer, 'PNG')
+        self.product = Product.objects.get(pk=1)
+        self.product.image = SimpleUploadedFile('red.png', buffer.getvalue(), content_type='image/png')
+        self.product.save()
+
+    def test_cards_use_lazy_responsive_variants(self):
+        self.assertEqual(len(self.product.image_hash), 12)
+        self.assertEqual((self.product.image_width, self.product.image_height), (1200, 900))
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, f'srcset="{thumbnails.srcset(self.product, "webp")}"')
+        self.assertContains(response, 'loading="lazy"')
+        self.assertContains(response, 'width="960" height="720"')
+
+    def test_hashing_a_stored_image_closes_it(self):
+        product = Product.objects.get(pk=1)
+        product.image_hash = ''
+        product.save()
+        self.assertEqual(product.image_hash, self.product.image_hash)
+        self.assertTrue(product.image.closed)
+
+    def test_missing_variant_is_built_on_first_request(self):
+        url = thumbnails.url(self.product, 320, 'webp')
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 240)))
+        self.assertEqual(len(os.listdir(self.root)), len(thumbnails.WIDTHS) * len(thumbnails.FORMATS))
+
+        stale = url.replace(self.product.image_hash, '0' * 12)
+        self.assertEqual(self.client.get(stale).status_code, 404)
+
+    def test_command_builds_all_variants_in_a_pool(self):
+        call_command('build_thumbnails', workers=2, stdout=StringIO())
+        names = sorted(os.listdir(self.root))
+        self.assertEqual(names, sorted(
+            thumbnails.variant_name(1, self.product.image_hash, width, ext)
+            for width in thumbnails.WIDTHS for ext in thumbnails.FORMATS
+        ))
+
+
+class MoneyTests(TestCase):
+    def test_conversion_is_exact_and_rejects_floats(self):
+        price = Money.from_decimal(Decimal('19.99'))
+        self.assertEqual(price.cents, 1999)
+        self.assertEqual((price * 3).to_decimal(), Decimal('59.97'))
+        self.assertEqual(Money.sum([Money.from_decimal('0.10')] * 3), Money(30))
+        self.assertEqual(str(Money(-5)), '-0.05')
+        with self.assertRaises(TypeError):
+            Money.from_decimal(0.1)
+
+    def test_json_amounts_match_rendered_totals(self):
+        self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 3})
+        rendered = self.client.get(reverse('cart')).context['cart_total']
+        data = self.client.post(reverse('update_cart'), {'product_id': 1, 'quantity': 3}, content_type='application/json').json()
+        self.assertEqual(data['cart_total'], str(rendered))
+        self.assertEqual(data['item_subtotal'], '47.97')
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+        self.shirt, self.wallet = Product.objects.get(pk=1), Product.objects.get(pk=2)
+        self.old = self.order(self.now - timedelta(days=1), (self.shirt, 2), (self.wallet, 1))
+        self.new = self.order(self.now, (self.shirt, 1))
+
+    def order(self, created_at, *lines):
+        order = Order.objects.create(total_paid=Decimal('0.00'), status='Processing')
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=p, price=p.price, quantity=q) for p, q in lines])
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        order.refresh_from_db()
+        return order
+
+    def later(self, minutes=2):
+        return self.now + timedelta(minutes=minutes)
+
+    def test_rollups_match_order_items(self):
+        self.assertEqual(rollups.refresh(now=self.later()), 2)
+        row = DailySales.objects.get(day=self.today - timedelta(days=1), product=self.shirt)
+        self.assertEqual((row.units, row.revenue, row.category_id, row.status), (2, self.shirt.price * 2, self.shirt.category_id, 'Processing'))
+        self.assertEqual(sum(HourlySales.objects.values_list('units', flat=True)), 4)
+
+        # Nothing changed since the mark
+        self.assertEqual(rollups.refresh(now=self.later(3)), 0)
+
+    def test_refresh_rebuilds_only_days_of_changed_orders(self):
+        rollups.refresh(now=self.later())
+        self.old.status = 'Shipped'
+        self.old.save()
+        # As if saved after the first refresh's mark (now - SETTLE_SECONDS)
+        Order.objects.filter(pk=self.old.pk).update(updated_at=self.later(3))
+        self.assertEqual(rollups.refresh(now=self.later(5)), 1)
+        statuses = set(DailySales.objects.filter(day=self.today - timedelta(days=1)).values_list('status', flat=True))
+        self.assertEqual(statuses, {'Shipped'})
+
+    def test_report_page_reads_only_rollups(self):
+        rollups.refresh(now=self.later())
+        self.client.force_login(User.objects.create_superuser('boss', password='pw'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:store_dailysales_changelist'), {'by': 'category'})
+        self.assertEqual(response.context['totals']['units'], 4)
+        self.assertEqual(response.context['breakdown'][0]['label'], self.shirt.category.name)
+        self.assertFalse([q for q in queries.captured_queries if re.search(r'"store_order(item)?"', q['sql'])])
+
+    def test_report_page_requires_view_permission(self):
+        self.client.force_login(User.objects.create_user('clerk', is_staff=True))
+        self.assertEqual(self.client.get(reverse('admin:store_dailysales_changelist')).status_code, 403)
+
+
+class AdminChangelistTests(TestCase):
+    # Session, user, count and the page's rows, with one spare
+    BUDGET = 5
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('boss', password='pw'))
+        self.products = list(Product.objects.all()[:2])
+        self.add_rows(3)
+
+    def add_rows(self, n):
+        for _ in range(n):
+            user = User.objects.create_user(f'shopper{User.objects.count()}')
+            cart = Cart.objects.create(user=user)
+            order = Order.objects.create(user=user, total_paid=Decimal('0.00'))
+            for product in self.products:
+                CartItem.objects.create(cart=cart, product=product, quantity=2)
+                OrderItem.objects.create(order=order, product=product, price=product.price, quantity=2)
+
+    def changelist_queries(self, model):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:store_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_use_a_fixed_number_of_queries(self):
+        for model in ('cart', 'order', 'cartitem'):
+            with self.subTest(model=model):
+                few = self.changelist_queries(model)
+                self.add_rows(5)
+                self.assertEqual(self.changelist_queries(model), few)
+                self.assertLessEqual(few, self.BUDGET)
+
+    def test_cart_total_is_annotated(self):
+        response = self.client.get(reverse('admin:store_cart_changelist'))
+        changelist = response.context['cl']
+        expected = sum(Money.from_decimal(p.price) * 2 for p in self.products)
+        self.assertEqual(changelist.model_admin.total(changelist.result_list[0]), expected)
+
+
+class PurgeCartsTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.get(pk=1)
+        old = timezone.now() - timedelta(days=40)
+        self.stale = [self.cart(f'stale{n}', old) for n in range(5)]
+        self.fresh = self.cart('fresh', timezone.now())
+        self.owned = self.cart(None, old, user=User.objects.create_user('owner'))
+        self.held = self.cart('held', old)
+        StockReservation.objects.create(
+            product=self.product, cart=self.held, shard_no=0, quantity=1, expires_at=timezone.now(),
+        )
+
+    def cart(self, session_key, updated_at, user=None):
+        cart = Cart.objects.create(session_key=session_key, user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=updated_at)
+        return cart
+
+    def test_purges_only_stale_anonymous_carts_in_batches(self):
+        cart_store.get_store().set('s:stale0', {self.product.pk: 1})
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_carts', '--older-than=30d', batch_size=2, pause=0, verbosity=2, stdout=out)
+
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {self.fresh.pk, self.owned.pk, self.held.pk})
+        self.assertFalse(CartItem.objects.filter(cart__in=self.stale).exists())
+        self.assertIn("Purged 5 cart(s) and 5 line(s)", out.getvalue())
+        self.assertGreaterEqual(out.getvalue().count("deleted"), 3)
+        self.assertIsNone(cart_store.get_store().get('s:stale0'))
+
+    def test_rejects_bad_age(self):
+        with self.assertRaises(CommandError):
+            call_command('purge_carts', '--older-than=soon')
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.clothing = Category.objects.get(slug='clothing')
+        self.footwear = Category.objects.get(slug='footwear')
+        self.apparel = Category.objects.create(name="Apparel", slug='apparel')
+        self.clothing.parent = self.apparel
+        self.clothing.save()
+
+    def counts(self):
+        return dict(Category.objects.values_list('slug', 'product_count'))
+
+    def test_moving_a_category_moves_its_subtree_and_count(self):
+        self.clothing.refresh_from_db()
+        self.assertEqual((self.clothing.path, self.clothing.depth), (f'{self.apparel.pk}/{self.clothing.pk}/', 1))
+        counts = self.counts()
+        self.assertEqual(counts['apparel'], counts['clothing'])
+        self.assertEqual(set(categories.subtree(self.apparel)), {self.apparel, self.clothing})
+
+        shirts = Category.objects.create(name="Shirts", slug='shirts', parent=self.clothing)
+        self.apparel.parent = self.footwear
+        self.apparel.save()
+        shirts.refresh_from_db()
+        self.assertEqual(shirts.path, f'{self.footwear.pk}/{self.apparel.pk}/{self.clothing.pk}/{shirts.pk}/')
+        self.assertEqual(shirts.depth, 3)
+        self.assertEqual(self.counts()['footwear'], counts['footwear'] + counts['apparel'])
+
+        self.footwear.parent = shirts
+        with self.assertRaises(ValidationError):
+            self.footwear.full_clean()
+
+    def test_product_changes_update_ancestor_counts(self):
+        before = self.counts()
+        product = Product.objects.filter(category=self.footwear).first()
+        product.category = self.clothing
+        product.save()
+        Product.objects.create(name="Scarf", price=Decimal('5.00'), category=self.clothing)
+        after = self.counts()
+        self.assertEqual(after['footwear'], before['footwear'] - 1)
+        self.assertEqual((after['clothing'], after['apparel']), (before['clothing'] + 2, before['apparel'] + 2))
+
+        product.delete()
+        self.assertEqual(self.counts()['apparel'], before['apparel'] + 1)
+        incremental = self.counts()
+        categories.rebuild()
+        self.assertEqual(self.counts(), incremental)
+
+    def test_parent_listing_includes_subcategories(self):
+        response = self.client.get(reverse('product_list_by_category', args=['apparel']))
+        self.assertContains(response, "Classic T-Shirt")
+
+    def test_nav_tree_is_cached_per_process_until_the_catalog_changes(self):
+        tree = catalog_cache.get_nav_tree()
+        self.assertEqual([c.slug for c in tree][:2], ['accessories', 'apparel'])
+        self.assertEqual(tree[2].slug, 'clothing')
+        with self.assertNumQueries(0):
+            self.assertIs(catalog_cache.get_nav_tree(), tree)
+        Category.objects.create(name="Bags", slug='bags')
+        self.assertIn('bags', [c.slug for c in catalog_cache.get_nav_tree()])
+
+
+# New products use img/default.jpg, which is not in the static manifest
+@override_settings(
+    DATABASE_REPLICAS=['replica'],
+    STORAGES={'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+)
+class DatabaseRoutingTests(TransactionTestCase):
+    # 'replica' is a second connection to the test database (TEST MIRROR)
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.product = Product.objects.create(name="Desk Lamp", price=Decimal('30.00'))
+
+    def get(self, url):
+        """Returns the response and the SQL the replica ran for it."""
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = self.client.get(url)
+        return response, [q['sql'] for q in queries.captured_queries]
+
+    def test_catalog_reads_go_to_replica_until_the_client_writes(self):
+        detail = reverse('product_detail', args=[self.product.pk])
+        response, replica = self.get(detail)
+        self.assertContains(response, "Desk Lamp")
+        self.assertTrue(any('"store_product"' in sql for sql in replica))
+        self.assertNotIn(db_routing.PIN_COOKIE, response.cookies)
+
+        response = self.client.post(reverse('add_to_cart', args=[self.product.pk]), {'quantity': 1})
+        self.assertIn(db_routing.PIN_COOKIE, response.cookies)
+        cache.clear()
+        _, replica = self.get(detail)
+        self.assertEqual(replica, [])
+
+        series = metrics.snapshot()[('product_detail', 'GET', '2xx')]
+        by_alias = dict(zip(metrics.ALIASES, series[metrics.FIRST_ALIAS:]))
+        self.assertGreater(by_alias['replica'], 0)
+        self.assertGreater(by_alias['default'], 0)
+        self.assertIn('store_db_alias_queries_total{view="product_detail",method="GET",status="2xx",alias="replica"}', metrics.render())
+
+    def test_stock_changes_are_refreshed_again_after_replication(self):
+        Product.objects.filter(pk=self.product.pk).update(inventory_stock=5)
+        with mock.patch.object(db_routing, 'after_replication') as after_replication:
+            self.client.post(reverse('add_to_cart', args=[self.product.pk]), {'quantity': 1})
+            self.client.post(reverse('process_order'))
+            inventory.start_flash_sale(self.product)
+            InventoryShard.objects.filter(product=self.product, shard_no=0).update(stock=0)
+            inventory.sync_displayed_stock()
+        # Checkout and the sweeper (starting the sale is a catalog edit, refreshed by the signal handlers)
+        refreshes = [call.args[0] for call in after_replication.call_args_list if isinstance(call.args[0], partial)]
+        self.assertEqual(len(refreshes), 2)
+        for refresh in refreshes:
+            self.assertEqual((refresh.func, refresh.args[0]), (catalog_cache.stock_changed, [self.product.pk]))
+
+    @override_settings(REPLICA_STICKY_SECONDS=0.05)
+    def test_deferred_calls_share_one_thread(self):
+        done = threading.Event()
+        calls = []
+        db_routing.after_replication(lambda: calls.append(threading.current_thread()))
+        db_routing.after_replication(lambda: 1 / 0)
+        db_routing.after_replication(done.set)
+        with self.assertLogs('store.db_routing', 'ERROR'):
+            self.assertTrue(done.wait(5))
+        self.assertEqual(calls, [db_routing._deferred_worker])
+        self.assertEqual([t for t in threading.enumerate() if t.name == 'after-replication'], [db_routing._deferred_worker])
+
+    def test_writes_transactions_and_migrations_stay_on_primary(self):
+        router = db_routing.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), 'replica')
+        self.assertEqual(router.db_for_read(Cart), 'default')
+        self.assertEqual(router.db_for_write(Product), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Product), 'default')
+        self.assertIs(router.allow_migrate('replica', 'store'), False)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('product_detail', args=[1])
+        # The first response sets the CSRF cookie that later validators include
+        self.client.get(self.url)
+
+    def revalidate(self, url=None):
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return self.client.get(url or self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_page_is_304_without_rendering(self):
+        response = self.client.get(self.url)
+        self.assertIn('Cookie', response['Vary'])
+        self.assertEqual(response['Last-Modified'], http_date(Product.objects.get(pk=1).updated_at.timestamp()))
+
+        for url in (self.url, reverse('product_list'), reverse('product_list_by_category', args=['footwear'])):
+            with self.subTest(url=url):
+                response = self.revalidate(url)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.templates, [])
+                self.assertEqual(response.content, b'')
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('max-age=60', response['Cache-Control'])
+
+        # A date cannot tell whether the page changed: the ETag decides
+        since = http_date(time.time() + 60)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=since, HTTP_IF_NONE_MATCH='W/"stale"').status_code, 200)
+
+    def test_responses_setting_cookies_are_private(self):
+        # Rendering the form sends the CSRF cookie, which a shared cache must not hand to others
+        response = Client().get(self.url)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+
+    def test_stock_change_invalidates_validators(self):
+        etag = self.client.get(self.url)['ETag']
+        Product.objects.filter(pk=1).update(inventory_stock=9)
+        catalog_cache.stock_changed([1])
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_catalog_change_invalidates_validators(self):
+        etag = self.client.get(self.url)['ETag']
+        product = Product.objects.get(pk=2)
+        product.price = Decimal('1.00')
+        product.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_messages_and_logged_in_users_are_not_shared(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(reverse('add_to_cart', args=[1]), {'quantity': 1})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertFalse(response.has_header('ETag'))
+
+        self.client.force_login(User.objects.create_user('shopper'))
+        response = self.revalidate()
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('private', response['Cache-Control'])
+
+    @override_settings(ROOT_URLCONF='store.async_urls')
+    def test_async_views_answer_304(self):
+        self.assertEqual(self.revalidate().status_code, 304)
@@ -0,0 +1,145 @@
+# store/thumbnails.py
+"""
+Responsive product thumbnails.
+
+Every product image is served as WIDTHS x FORMATS variants (WebP plus a JPEG
+fallback) instead of the uploaded original. A variant is named
+
+    <product pk>-<first 12 hex digits of the original's sha256>-<width>.<ext>
+
+so its URL changes whenever the image does and it can be cached forever.
+Product.image_hash holds that digest (set on save), which lets templates
+build srcset URLs without touching the file.
+
+Variants live in settings.THUMBNAIL_ROOT and are built either in bulk by the
+build_thumbnails command (a process pool; run it after importing images or
+deploying) or on the first request for a missing one (views.thumbnail),
+which builds all variants of that image once and keeps them on disk.
+WhiteNoise serves the variants present when a worker starts with an
+immutable Cache-Control header (see store/middleware.py); the view serves
+the rest with the same header.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+WIDTHS = (320, 640, 960)
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+NAME_RE = re.compile(r'^(?P<pk>\d+)-(?P<digest>[0-9a-f]{12})-(?P<width>\d+)\.(?P<ext>webp|jpg)$')
+
+
+def file_hash(field_file):
+    """Returns the 12-hex-digit content digest of an image file (an upload or a stored file)."""
+    digest = hashlib.sha256()
+    # Callers may still need an open file (an upload about to be stored), so only close what was opened here
+    was_closed = field_file.closed
+    field_file.open('rb')
+    try:
+        for chunk in field_file.chunks():
+            digest.update(chunk)
+    finally:
+        if was_closed:
+            field_file.close()
+    return digest.hexdigest()[:12]
+
+
+def variant_name(pk, digest, width, ext):
+    return f'{pk}-{digest}-{width}.{ext}'
+
+
+def url(product, width, ext):
+    return settings.THUMBNAIL_URL + variant_name(product.pk, product.image_hash, width, ext)
+
+
+def srcset(product, ext):
+    return ', '.join(f'{url(product, width, ext)} {width}w' for width in WIDTHS)
+
+
+def _save(image, path, image_format):
+    # A unique file per call: threads of one worker may build the same variant
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, image_format, **SAVE_OPTIONS[image_format])
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def build_variants(pk, image_name, force=False):
+    """
+    Builds every variant of one product image and returns (pk, digest).
+    Takes only plain values so it can run in a process pool; the original is
+    decoded once and each width is resized from it.
+    """
+    root = settings.THUMBNAIL_ROOT
+    with default_storage.open(image_name, 'rb') as source:
+        digest = file_hash(source)
+        paths = {
+            (width, ext): os.path.join(root, variant_name(pk, digest, width, ext))
+            for width in WIDTHS for ext in FORMATS
+        }
+        if not force and all(os.path.exists(path) for path in paths.values()):
+            return pk, digest
+
+        source.seek(0)
+        with Image.open(source) as original:
+            # Let the JPEG decoder downscale while decoding when the original is much larger
+            original.draft('RGB', (WIDTHS[-1], WIDTHS[-1]))
+            image = ImageOps.exif_transpose(original)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            os.makedirs(root, exist_ok=True)
+            for width in WIDTHS:
+                if image.width > width:
+                    height = max(1, round(image.height * width / image.width))
+                    variant = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+                else:
+                    variant = image
+                for ext, image_format in FORMATS.items():
+                    _save(variant, paths[(width, ext)], image_format)
+    return pk, digest
+
+
+def get_or_build(name):
+    """
+    Returns the path of a variant, building the image's variants if they are
+    missing, or None if the name does not match a current product image.
+    """
+    match = NAME_RE.match(name)
+    if match is None or int(match['width']) not in WIDTHS:
+        return None
+    path = os.path.join(settings.THUMBNAIL_ROOT, name)
+    if os.path.exists(path):
+        return path
+
+    from .models import Product
+    image_name = (
+        Product.objects.filter(pk=match['pk'], image_hash=match['digest'])
+        .exclude(image='')
+        .values_list('image', flat=True)
+        .first()
+    )
+    if image_name is None:
+        return None
+    build_variants(int(match['pk']), image_name)
+    return path if os.path.exists(path) else None
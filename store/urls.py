@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -8,6 +9,11 @@ urlpatterns = [
 
     # Product Detail
     path('product/<int:pk>/', views.product_detail, name='product_detail'),
+    path(settings.THUMBNAIL_URL.lstrip('/') + '<str:name>', views.thumbnail, name='thumbnail'),
+
+    # Product Search and Autocomplete
+    path('search/', views.search_products, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
 
     # Add to Cart functionality
     path('add_to_cart/<int:pk>/', views.add_to_cart, name='add_to_cart'),
@@ -17,9 +23,13 @@ urlpatterns = [
     
     # AJAX Cart Update
     path('update_cart/', views.update_cart, name='update_cart'), 
+    path('update_cart/lines/', views.update_cart_lines, name='update_cart_lines'),
 
     # Checkout and Order Processing
     path('checkout/', views.checkout, name='checkout'),
     path('checkout/process/', views.process_order, name='process_order'), 
     path('order/success/<int:order_id>/', views.order_success, name='order_success'),
+
+    # Prometheus metrics
+    path('metrics', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,113 +1,128 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.http import JsonResponse
+from django.db import transaction
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.urls import reverse
 import json
-from decimal import Decimal
-
-# --- HARDCODED STATIC DATA ---
-STATIC_PRODUCTS_DATA = [
-    {'pk': 1, 'name': "Classic T-Shirt", 'description': "A comfortable 100% cotton t-shirt for year-round comfort.", 'price': 15.99, 'inventory_stock': 25, 'category': {'name': 'Clothing', 'slug': 'clothing'}},
-    {'pk': 2, 'name': "Leather Wallet", 'description': "A stylish and durable leather wallet with RFID protection.", 'price': 29.99, 'inventory_stock': 15, 'category': {'name': 'Accessories', 'slug': 'accessories'}},
-    {'pk': 3, 'name': "Running Shoes", 'description': "Lightweight performance shoes designed for your daily run, featuring high-grip soles.", 'price': 79.99, 'inventory_stock': 20, 'category': {'name': 'Footwear', 'slug': 'footwear'}},
-    {'pk': 4, 'name': "Slim Fit Hoodie", 'description': "A lightweight, modern slim-fit hoodie perfect for layering.", 'price': 45.50, 'inventory_stock': 12, 'category': {'name': 'Clothing', 'slug': 'clothing'}},
-    {'pk': 5, 'name': "Cross-Body Bag", 'description': "A compact and versatile cross-body bag for essentials and travel.", 'price': 35.00, 'inventory_stock': 18, 'category': {'name': 'Accessories', 'slug': 'accessories'}},
-    {'pk': 6, 'name': "Business Loafers", 'description': "Classic leather loafers suitable for formal and business casual wear.", 'price': 120.00, 'inventory_stock': 8, 'category': {'name': 'Footwear', 'slug': 'footwear'}},
-    {'pk': 7, 'name': "Premium Denim Jeans", 'description': "Durable and comfortable premium denim jeans with a modern fit.", 'price': 59.99, 'inventory_stock': 10, 'category': {'name': 'Clothing', 'slug': 'clothing'}},
-]
-
-# --- MOCK CLASSES TO MIMIC DJANGO MODEL BEHAVIOR ---
-class MockProduct:
-    def __init__(self, data):
-        for k, v in data.items():
-            setattr(self, k, v)
-        # Mock Category object for product_list.html template needs
-        self.category = type('MockCategory', (object,), data.get('category', {'name': 'Unknown', 'slug': 'unknown'}))()
-
-class MockCartItem:
-    def __init__(self, product, quantity):
-        self.product = product
-        self.quantity = quantity
-        # Mimic CartItem subtotal calculation
-        self.subtotal = round(product.price * quantity, 2)
-        
-    def __str__(self):
-        return f"{self.quantity} x {self.product.name}"
-
-# --- SESSION UTILITIES ---
-def get_session_cart(session):
-    """Initializes cart data structure in session if not present: {product_pk: quantity}."""
-    if 'cart' not in session:
-        session['cart'] = {} 
-    return session['cart']
-
-def get_cart_items_for_template(session):
-    """Converts session data into a list of MockCartItem objects for rendering."""
-    cart_items_data = get_session_cart(session)
-    items = []
-    total = 0.0
-
-    # Retrieve full product details from static data
-    product_map = {p['pk']: MockProduct(p) for p in STATIC_PRODUCTS_DATA}
-    
-    for pk_str, quantity in cart_items_data.items():
-        try:
-            pk = int(pk_str)
-        except ValueError:
-            continue
-            
-        if pk in product_map and quantity > 0:
-            product = product_map[pk]
-            item = MockCartItem(product, quantity)
-            items.append(item)
-            total += item.subtotal
-            
-    return items, round(total, 2)
+
+from . import cart as cart_service
+from . import catalog_cache, conditional, inventory, metrics, search, thumbnails
+from .checkout import CheckoutError, OutOfStockError, place_order
+from .models import Order
+from .money import ZERO, MoneyJSONEncoder
+from .pagination import normalize_sort, position_key, read_cursor
+
+RECENT_ORDERS_SESSION_KEY = 'recent_orders'
+SEARCH_RESULTS = 24
+SUGGEST_RESULTS = 8
+MAX_CART_UPDATE_LINES = 100
+SORT_LABELS = [('name', 'Name'), ('price', 'Price: Low to High'), ('-price', 'Price: High to Low')]
 
 # -------------------------- VIEWS --------------------------
 
-# View 1: Home/Product List Page (Uses Static Data)
+# View 1: Home/Product List Page (Keyset-paginated, Uses Catalog Cache, Conditional GET)
 def product_list(request, category_slug=None):
     current_category = None
-    
-    products_data = [MockProduct(data) for data in STATIC_PRODUCTS_DATA]
+    category = None
+    products, next_cursor = (), None
+    sort = normalize_sort(request.GET.get('sort'))
+    # A cursor that does not decode is dropped before it reaches any cache key
+    position = read_cursor(request.GET.get('after'), sort)
+    after = request.GET.get('after') if position is not None else None
     
     if category_slug:
-        products = [p for p in products_data if p.category.slug == category_slug]
-        
-        category_item = next((p.category for p in products if p.category.slug == category_slug), None)
-        if category_item:
-            current_category = category_item.name
-    else:
-        products = products_data
+        category = catalog_cache.get_category(category_slug)
+        if category:
+            current_category = category.name
+
+    # Unknown category slugs render an empty page instead of the full catalog
+    if category or not category_slug:
+        products, next_cursor = catalog_cache.get_page(category, sort, after)
 
     context = {
         'products': products,
-        'current_category': current_category
+        'current_category': current_category,
+        'category_slug': category_slug,
+        'sort': sort,
+        'sort_options': SORT_LABELS,
+        'next_cursor': next_cursor,
+        'is_first_page': position is None,
+        'page_key': position_key(position),
     }
-    return render(request, 'store/product_list.html', context)
+    return conditional.respond(
+        request, lambda: render(request, 'store/product_list.html', context),
+        catalog_cache.get_version(), products, request.user.is_authenticated,
+    )
 
-# View 2: Product Detail Page (Uses Static Data)
+# View 2: Product Detail Page (Uses Catalog Cache, Conditional GET)
 def product_detail(request, pk):
-    product_data = next((item for item in STATIC_PRODUCTS_DATA if item['pk'] == pk), None)
+    product = catalog_cache.get_product(pk)
     
-    if product_data is None:
+    if product is None:
         return redirect('product_list')
 
-    product = MockProduct(product_data)
-    
     context = {'product': product}
-    return render(request, 'store/product_detail.html', context)
+    return conditional.respond(
+        request, lambda: render(request, 'store/product_detail.html', context),
+        catalog_cache.get_version(), [product], request.user.is_authenticated,
+    )
+
+# View 2.1: Full-text Product Search (In-process Index)
+def search_products(request):
+    query = request.GET.get('q', '').strip()[:100]
+    products = []
+
+    if query:
+        hits = search.get_index().search(query, limit=SEARCH_RESULTS)
+        records = catalog_cache.get_products([pk for pk, _ in hits])
+        products = [records[pk] for pk, _ in hits if pk in records]
+
+    context = {
+        'query': query,
+        'products': products,
+    }
+    return render(request, 'store/search.html', context)
+
+# View 2.2: Search-as-you-type Suggestions (JSON)
+def search_suggest(request):
+    query = request.GET.get('q', '').strip()[:100]
+    if not query:
+        return JsonResponse({'query': query, 'terms': [], 'products': []})
+
+    index = search.get_index()
+    terms = search.tokenize(query)
+    completions = index.complete(terms[-1]) if terms else []
+    hits = index.search(query, limit=SUGGEST_RESULTS, prefix=True)
+    records = catalog_cache.get_products([pk for pk, _ in hits])
+
+    return JsonResponse({
+        'query': query,
+        'terms': completions,
+        'products': [
+            {'id': pk, 'name': records[pk].name, 'url': reverse('product_detail', args=[pk])}
+            for pk, _ in hits if pk in records
+        ],
+    })
+
+# View 2.3: Product Thumbnail (built on first request; WhiteNoise serves those present at startup)
+def thumbnail(request, name):
+    path = thumbnails.get_or_build(name)
+    if path is None:
+        raise Http404("No such thumbnail.")
+    response = FileResponse(open(path, 'rb'), content_type=thumbnails.CONTENT_TYPES[name.rsplit('.', 1)[1]])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
-# View 2.5: Add to Cart Logic (Uses Session)
+# View 2.5: Add to Cart Logic (Persistent Cart)
 def add_to_cart(request, pk):
     if request.method == 'POST':
-        product_data = next((item for item in STATIC_PRODUCTS_DATA if item['pk'] == pk), None)
-        if not product_data:
+        product = catalog_cache.get_product(pk)
+        if product is None:
             messages.error(request, "Product not found.")
             return redirect('product_list')
 
-        cart = get_session_cart(request.session)
-        product_pk_str = str(pk)
+        cart = cart_service.get_cart(request, create=True)
         
         try:
             quantity_to_add = int(request.POST.get('quantity', 1))
@@ -116,77 +131,157 @@ def add_to_cart(request, pk):
         except ValueError:
             quantity_to_add = 1
             
-        current_cart_quantity = cart.get(product_pk_str, 0)
-        total_new_quantity = current_cart_quantity + quantity_to_add
+        inventory_stock = product.inventory_stock
+        held = False
+        if product.flash_sale:
+            # Flash-sale stock is held per cart from the sharded counters
+            sale = inventory.get_flash_sales([pk]).get(pk)
+            try:
+                if sale is not None:
+                    inventory.reserve(sale, cart, quantity_to_add)
+                    held = True
+            except inventory.InsufficientStock:
+                messages.error(request, f"Cannot add {quantity_to_add} more. {product.name} is selling fast and not enough stock is left.")
+                next_url = request.POST.get('next', 'product_list')
+                return redirect(next_url)
 
-        inventory_stock = product_data['inventory_stock']
-        if total_new_quantity > inventory_stock:
-            messages.error(request, f"Cannot add {quantity_to_add} more. Only {inventory_stock - current_cart_quantity} of {product_data['name']} are available in stock.")
+        # Relative update in the database: concurrent adds (in any worker) all count
+        try:
+            added = cart_service.add_quantity(cart, pk, quantity_to_add, limit=None if product.flash_sale else inventory_stock)
+        except Exception:
+            # Give the stock just held back now rather than when the reservation expires
+            if held:
+                inventory.release(cart, pk, quantity_to_add)
+            raise
+        if not added:
+            current_cart_quantity = cart_service.get_quantity(cart, pk)
+            messages.error(request, f"Cannot add {quantity_to_add} more. Only {max(inventory_stock - current_cart_quantity, 0)} of {product.name} are available in stock.")
             next_url = request.POST.get('next', 'product_list')
             return redirect(next_url)
-            
-        cart[product_pk_str] = total_new_quantity
-        request.session.modified = True 
 
-        messages.success(request, f"{quantity_to_add} x {product_data['name']} added to cart!")
+        messages.success(request, f"{quantity_to_add} x {product.name} added to cart!")
         
         next_url = request.POST.get('next', 'cart')
         return redirect(next_url)
 
-# View 3.5: Update Cart Logic (Session-based AJAX)
+# View 3.5: Update Cart Logic (Persistent Cart, AJAX)
 def update_cart(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body.decode('utf-8'))
             product_pk = int(data.get('product_id'))
             new_quantity = int(data.get('quantity', 0))
-            product_pk_str = str(product_pk)
         except (json.JSONDecodeError, ValueError, TypeError):
             return JsonResponse({'error': 'Invalid request data'}, status=400)
         
-        cart = get_session_cart(request.session)
-        
-        product_data = next((item for item in STATIC_PRODUCTS_DATA if item['pk'] == product_pk), None)
-        if not product_data:
+        product = catalog_cache.get_product(product_pk)
+        if product is None:
              return JsonResponse({'error': 'Item not found.'}, status=404)
         
-        inventory_stock = product_data['inventory_stock']
+        cart = cart_service.get_cart(request, create=True)
+        inventory_stock = product.inventory_stock
         item_removed = False
         message = 'Cart updated successfully.'
-        item_subtotal = 0.0
+        item_subtotal = ZERO
 
-        if new_quantity > inventory_stock:
+        new_quantity = max(new_quantity, 0)
+        if product.flash_sale:
+            sale = inventory.get_flash_sales([product_pk]).get(product_pk)
+            current_quantity = cart_service.get_quantity(cart, product_pk)
+            try:
+                if sale is not None:
+                    inventory.adjust_reservation(sale, cart, current_quantity, new_quantity)
+            except inventory.InsufficientStock:
+                new_quantity = current_quantity
+                message = "Warning: Not enough stock left to increase this quantity."
+        elif new_quantity > inventory_stock:
             new_quantity = inventory_stock
             message = f"Warning: Quantity limited to available stock ({inventory_stock})"
         
         if new_quantity > 0:
-            cart[product_pk_str] = new_quantity
-            item_subtotal = Decimal(product_data['price']) * new_quantity
-        else:
-            if product_pk_str in cart:
-                del cart[product_pk_str]
-                item_removed = True
-                message = 'Item removed successfully.'
-            
-        request.session.modified = True
+            item_subtotal = product.unit_price * new_quantity
+        if cart_service.set_quantity(cart, product_pk, new_quantity):
+            item_removed = True
+            message = 'Item removed successfully.'
 
-        _, cart_total = get_cart_items_for_template(request.session)
+        cart_total = cart_service.get_total(cart)
 
         return JsonResponse({
             'success': True,
-            'item_subtotal': round(float(item_subtotal), 2),
+            'item_subtotal': item_subtotal,
             'cart_total': cart_total,
             'message': message,
             'item_removed': item_removed,
             'new_quantity': new_quantity
-        })
+        }, encoder=MoneyJSONEncoder)
 
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 
-# View 3: Cart Page (Uses Session)
+# View 3.6: Batched Cart Update (Persistent Cart, AJAX)
+def update_cart_lines(request):
+    """
+    Applies several line changes in one transaction. Expects
+    {"lines": [{"product_id": ..., "quantity": ...}, ...]} and returns only
+    those lines (with their final quantity and subtotal) plus the new total.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        # Later changes to the same product win
+        requested = {int(line['product_id']): max(int(line.get('quantity', 0)), 0) for line in data['lines']}
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid request data'}, status=400)
+    if not requested or len(requested) > MAX_CART_UPDATE_LINES:
+        return JsonResponse({'error': f'Send between 1 and {MAX_CART_UPDATE_LINES} lines.'}, status=400)
+
+    # Validate every line against one batch of catalog records
+    products = catalog_cache.get_products(requested)
+    if len(products) < len(requested):
+        return JsonResponse({'error': 'Item not found.'}, status=404)
+
+    cart = cart_service.get_cart(request, create=any(requested.values()))
+    quantities, warnings = dict(requested), {}
+    if cart is not None:
+        with transaction.atomic():
+            current = cart_service.get_quantities(cart, requested)
+            flash_sales = inventory.get_flash_sales([pk for pk in requested if products[pk].flash_sale])
+            for pk, quantity in requested.items():
+                product = products[pk]
+                if product.flash_sale:
+                    try:
+                        if pk in flash_sales:
+                            inventory.adjust_reservation(flash_sales[pk], cart, current.get(pk, 0), quantity)
+                    except inventory.InsufficientStock:
+                        quantities[pk] = current.get(pk, 0)
+                        warnings[pk] = "Not enough stock left to increase this quantity."
+                elif quantity > product.inventory_stock:
+                    quantities[pk] = product.inventory_stock
+                    warnings[pk] = f"Quantity limited to available stock ({product.inventory_stock})."
+            cart_service.set_quantities(cart, quantities)
+    cart_total = cart_service.get_total(cart)
+
+    return JsonResponse({
+        'success': True,
+        'lines': [
+            {
+                'product_id': pk,
+                'quantity': quantity,
+                'subtotal': products[pk].unit_price * quantity,
+                'removed': quantity == 0,
+                'warning': warnings.get(pk),
+            }
+            for pk, quantity in quantities.items()
+        ],
+        'cart_total': cart_total,
+    }, encoder=MoneyJSONEncoder)
+
+
+# View 3: Cart Page (Persistent Cart, served from the cart store when warm)
 def view_cart(request):
-    cart_items, cart_total = get_cart_items_for_template(request.session)
+    cart_items, cart_total = cart_service.get_cart_lines(request)
         
     context = {
         'cart_items': cart_items,
@@ -196,9 +291,9 @@ def view_cart(request):
     return render(request, 'store/cart.html', context)
 
 
-# View 4: Checkout Page (Uses Session, Redirects Order Processing)
+# View 4: Checkout Page (Persistent Cart, Redirects Order Processing)
 def checkout(request):
-    cart_items, cart_total = get_cart_items_for_template(request.session)
+    cart_items, cart_total = cart_service.get_cart_lines(request)
     
     if not cart_items:
         messages.warning(request, "Your cart is empty. Please add items before checking out.")
@@ -207,30 +302,48 @@ def checkout(request):
     context = {'cart_total': cart_total}
     return render(request, 'store/checkout.html', context)
 
-# View to process the order (MOCK SUCCESS)
+# View to process the order (Transactional Checkout)
 def process_order(request):
-    messages.success(request, "Order processed successfully! (Note: Stock/Order persistence is disabled for free tier PoC).")
-    # Redirect to mock order ID
-    return redirect('order_success', order_id=999)
+    if request.method != 'POST':
+        return redirect('checkout')
+
+    try:
+        order = place_order(cart_service.get_cart(request), request.user)
+    except OutOfStockError as error:
+        messages.error(request, f"{error} Please update your cart and try again.")
+        return redirect('cart')
+    except CheckoutError as error:
+        messages.warning(request, str(error))
+        return redirect('product_list')
+
+    # Remember the order so anonymous buyers can view their confirmation page
+    recent_orders = request.session.get(RECENT_ORDERS_SESSION_KEY, [])
+    request.session[RECENT_ORDERS_SESSION_KEY] = (recent_orders + [order.pk])[-10:]
+
+    messages.success(request, "Order processed successfully!")
+    return redirect('order_success', order_id=order.pk)
 
-# Simple success page view (MOCK DATA)
+# Order confirmation page
 def order_success(request, order_id):
-    # Retrieve mock cart for display before clearing
-    cart_items, cart_total = get_cart_items_for_template(request.session)
-    
-    # Clear the session cart to simulate completion
-    if 'cart' in request.session:
-        del request.session['cart']
-        request.session.modified = True
-
-    # Mock Order object for template rendering
-    mock_order = type('MockOrder', (object,), {
-        'id': order_id, 
-        'total_paid': cart_total, 
-        'status': 'Completed (PoC)',
-        'created_at': 'N/A',
-        'items': type('MockOrderItems', (object,), {'count': lambda: len(cart_items)})()
-    })
+    order = Order.objects.filter(pk=order_id).first()
+
+    is_owner = order is not None and (
+        (order.user_id is not None and order.user_id == request.user.id)
+        or order.pk in request.session.get(RECENT_ORDERS_SESSION_KEY, [])
+    )
+    if not is_owner:
+        messages.error(request, "Order not found.")
+        return redirect('product_list')
+
+    context = {'order': order}
+    return render(request, 'store/order_success.html', context)
 
-    context = {'order': mock_order}
-    return render(request, 'store/order_success.html', context)
\ No newline at end of file
+# Prometheus scrape endpoint (per-view metrics from store/metrics.py)
+def prometheus_metrics(request):
+    token = settings.METRICS_TOKEN
+    # Closed unless a token is configured (open without one only with DEBUG on)
+    if not token and not settings.DEBUG:
+        raise Http404("Metrics are disabled.")
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
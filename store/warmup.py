@@ -0,0 +1,41 @@
+# store/warmup.py
+"""
+Process warm-up, run once in the gunicorn master before it forks workers
+(config/gunicorn.conf.py). Everything loaded here -- the catalog cache,
+the search index, compiled templates and the URL resolver -- is inherited
+copy-on-write by every worker, so workers neither rebuild it on their
+first requests nor each hold a private copy.
+"""
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver, reverse
+
+from . import catalog_cache, search
+
+
+def _template_names():
+    root = Path(apps.get_app_config('store').path) / 'templates'
+    return sorted(str(path.relative_to(root)) for path in root.rglob('*.html'))
+
+
+def warm_up():
+    """Loads the shared read-mostly state and returns {step: seconds}."""
+    timings = {}
+
+    def step(name, function):
+        started = time.perf_counter()
+        function()
+        timings[name] = time.perf_counter() - started
+
+    step('catalog', catalog_cache.warm)
+    step('search index', search.get_index)
+    step('templates', lambda: [get_template(name) for name in _template_names()])
+    step('url resolver', lambda: (get_resolver().reverse_dict, reverse('product_list')))
+
+    # Sockets must not be shared with forked workers
+    connections.close_all()
+    return timings